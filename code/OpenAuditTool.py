@@ -25,6 +25,7 @@ it could also be run locally in a county.
 
 # MIT License
 
+import collections
 import logging
 
 # Following should be done before other imports, as they will otherwise
@@ -32,6 +33,7 @@ import logging
 logging.basicConfig(level=logging.INFO,format="%(message)s")
 logger = logging.getLogger(__name__)
 
+import audit_context
 import cli_OpenAuditTool
 import utils
 
@@ -101,6 +103,26 @@ class Election(object):
         e.sample_by_size = sample_by_size
         e.use_discrete_rm = False
         e.pick_county_func = None
+        e.plan_engine = "scalar"
+        # "scalar" or "array": how planner.py simulates the random walk
+        # or Robbins-Monro iteration (see planner.get_sample_size_array
+        # and planner.discrete_rm_array)
+        e.plan_time_budget = 0.0
+        # if positive, seconds allowed for computing a plan with
+        # get_sample_size or discrete_rm; when they run out, the plan
+        # refined so far is used (see planner.planned_sample_sizes)
+        e.joint_allocation = False
+        # if True, planner.py chooses all collections' sample-size
+        # increments together, from per-contest risk response curves
+        # (see allocation.py)
+        e.num_workers = 1
+        # number of worker processes to use for reading per-collection files,
+        # for simulated audits (asn.py), and for per-measurement risk and
+        # planning jobs (scheduler.py)
+        e.job_times_k = {}
+        # kind of job ("risk", "curve")->list of dicts giving job name,
+        # estimated cost, seconds, and worker, for the jobs last run by
+        # scheduler.run_jobs
         # *** Notation
 
         # We use nested dictionaries extensively.
@@ -132,6 +154,11 @@ class Election(object):
         # There is a standard directory ELECTIONS_ROOT where "all information
         # about elections is held", defaulting to "./elections".
         # This can be changed with a command-line option.
+        # It is kept (with the audit's random streams) in the audit
+        # context e.ctx, so that each Election can have its own.
+
+        e.ctx = audit_context.AuditContext(ELECTIONS_ROOT)
+        # audit context (see audit_context.py)
 
         # *** General
 
@@ -301,6 +328,13 @@ class Election(object):
         # vote in given contest, paper ballot collection, and ballot id
         # e.rv_cpb is like e.av, but reported votes instead of actual votes
 
+        e.cvr_store_p = {}
+        # input (24-reported-cvr-store/cvr-store-PBCID-*.npy), if present
+        # pbcid->sidecar index of the CVR store (see cvr_store.py)
+        # Only set for collections whose reported votes were read from a
+        # CVR store (a binary cache of the csv file) rather than from the
+        # csv file.
+
         e.votes_c = {}
         # input (from selids_c, reported votes, and actual votes)
         # cid->vote->True
@@ -317,6 +351,12 @@ class Election(object):
         # reported number of votes by contest, paper ballot collection,
         # and reported vote.
 
+        e.rn_cpr_partial = {}
+        # Computed from e.rv_cpb, per collection, by read_reported_parallel
+        # cid->pbcid->rvote->count
+        # partial counts for e.rn_cpr (only nonzero counts present),
+        # for collections whose files were read by a worker process.
+
         e.rn_p = {}
         # Computed from e.rv_cpb
         # pbcid -> count
@@ -427,6 +467,47 @@ class Election(object):
         e.shuffled_bids_p = {}
         # computed in audit_orders.py (but probably will be replaced)
         # sampling order for bids of each pbcid
+        # (in lazy mode, just the prefix of it computed so far)
+
+        e.audit_order_mode = "shuffle"
+        # "shuffle" or "lazy" (see audit_orders.py)
+
+        e.audit_order_chunk_size = 0
+        # If > 0, audit orders are written in chunk files of this many
+        # ballots, as the audit needs them (see audit_orders.py)
+
+        e.audit_order_chunks_p = {}
+        # pbcid->set of numbers of the audit-order chunks written so far
+
+        e.asn_audits = 1000
+        e.asn_error_rate = 0.0
+        e.asn_trials = 100
+        e.asn_max_stages = 20
+        # number of audits to simulate, assumed chance that an actual
+        # vote differs from the reported vote, trials per risk
+        # measurement, and maximum number of stages, for the pre-audit
+        # simulation of the audit's workload (see asn.py)
+
+        e.pull_lists = False
+        # If True, write per-box pull lists for the ballots selected at
+        # each stage (see pull_lists.py)
+
+        e.consistent_sampling = False
+        # If True, each contest is sampled separately, from the ballots
+        # that may contain it, using persistent per-ballot priorities
+        # (see consistent_sampling.py)
+
+        e.priority_bids_p = {}
+        # pbcid->list of bids, in priority order (consistent sampling)
+
+        e.contest_bids_cp = {}
+        # cid->pbcid->list of bids that may contain cid, in priority order
+        # (consistent sampling)
+
+        e.priority_ordinal_pb = {}
+        # pbcid->bid->int
+        # position of bid in e.priority_bids_p[pbcid], i.e. in the audit
+        # order (consistent sampling; see consistent_sampling.priority_ordinals)
 
         # *** stage-related items
         # We don't give sequence numbers to stages; we just identify
@@ -438,6 +519,29 @@ class Election(object):
         # Note that stage is a string representing a datetime string.
         # Stage time identifies the audit stage.
 
+        e.simulate = False
+        # If True, audit stages are simulated: stage times are logical
+        # (see utils.logical_stage_time), there is no pause between
+        # stages, and saved state is kept in memory (e.saved_state_ss).
+
+        e.write_outputs = True
+        # If False, don't write saved state and status files to
+        # 3-audit/34-audit-output (only allowed when simulating).
+
+        e.saved_state_ss = None
+        # last saved state written, when simulating
+
+        e.watch_poll_interval = 1.0
+        e.watch_debounce = 2.0
+        e.watch_latency_target = 10.0
+        # watch mode (see audit_watch.py): seconds between polls of the
+        # audited votes directory, seconds of quiet to wait for after a
+        # change, and target seconds from a change to updated statuses
+
+        e.stage_number = 0
+        # number of stages run by audit server or watch mode
+        # (see audit_server.py and audit_watch.py)
+
         e.max_stage_time = "9999-12-31-23-59-59"
         # maximum stage time (starting time) allowed for any audit
         # string
@@ -472,6 +576,37 @@ class Election(object):
         # stage_time->pbcid->ints
         # number of ballots sampled so far
 
+        e.plan_cache = {}
+        # plan key->pbcid->int
+        # sample-size increments computed by the planner, keyed by a
+        # digest of the sample state they were computed from
+        # (see planner.planned_sample_sizes)
+
+        e.plan_converged_t = {}
+        # stage_time->bool
+        # whether the plan computed at that stage by get_sample_size or
+        # discrete_rm got all of its iterations (within e.plan_time_budget)
+
+        e.risk_curve_cache = {}
+        # curve key->pbcid->list of reals
+        # projected risks of a contest for increasing sample sizes of
+        # each collection, keyed by a digest of the contest's sample
+        # state (see allocation.response_curves)
+
+        e.risk_draw_cache = collections.OrderedDict()
+        # draw key->array of reals (trials x votes)
+        # contribution of a collection to the test tallies of a contest in
+        # risk measurement, keyed by a digest of that collection's sample
+        # tallies and random substreams, so collections unchanged since an
+        # earlier stage aren't drawn again (see risk_bayes.collection_draws)
+
+        e.plan_tcp = {}
+        e.sn_tcp = {}
+        # stage_time->cid->pbcid->ints
+        # with consistent sampling, planned sample size for next stage,
+        # and size of sample so far, for each contest and pbcid
+        # (e.plan_tp and e.sn_tp then give the numbers of ballots pulled)
+
         e.av_cpb = {}
         # cid->pbcid->bid->vote
         # (actual votes from sampled ballots)
@@ -486,6 +621,55 @@ class Election(object):
         # sampled number stage_time->cid->pbcid->vote->count
         # sampled number by stage_time, contest, pbcid, and reported vote
 
+        e.sample_tally_cpra = {}
+        e.sample_size_cp = {}
+        # running sample tallies, kept from stage to stage (see audit.py)
+        # cid->pbcid->rvote->avote->count
+        # cid->pbcid->int
+        # e.sample_tally_cpra[cid][pbcid] tallies the first
+        # e.sample_size_cp[cid][pbcid] ballots in e.bids_p[pbcid]
+        # (with consistent sampling, in e.contest_bids_cp[cid][pbcid])
+
+        e.audited_votes_tail_p = {}
+        # pbcid->tail state (see csv_readers.read_csv_file_tail)
+        # how much of the audited votes file for pbcid has been read
+
+        e.audited_prefix_p = {}
+        e.audited_prefix_cp = {}
+        # pbcid->int
+        # cid->pbcid->int
+        # in watch mode, number of initial ballots of e.bids_p[pbcid]
+        # having an audited vote (with consistent sampling, of
+        # e.contest_bids_cp[cid][pbcid] having an audited vote for cid),
+        # as of the last stage (see audit_watch.py)
+
+        e.ordinal_pb = {}
+        # pbcid->bid->int
+        # position of bid in e.bids_p[pbcid] (computed when needed,
+        # by audit.ballot_ordinals; first position, if bid is repeated)
+
+        e.duplicate_bids_p = {}
+        # pbcid->set of bids
+        # bids appearing more than once in e.bids_p[pbcid]
+        # (computed along with e.ordinal_pb[pbcid])
+
+        e.contest_ordinal_cpb = {}
+        # cid->pbcid->bid->int
+        # with consistent sampling, position of bid in
+        # e.contest_bids_cp[cid][pbcid] (computed when needed, by
+        # consistent_sampling.contest_ordinals)
+
+        # *** election database ***
+        # see election_db.py
+
+        e.db = None
+        # sqlite3 connection to election database holding the per-ballot
+        # data (manifests, reported and audited votes), or None if that
+        # data is held in the dicts above.
+
+        e.db_pathname = ""
+        # pathname of the election database (or ":memory:")
+
         # *** saved-state ***
         # see saved-state.py
         e.saved_state = {}
@@ -0,0 +1,263 @@
+# allocation.py
+# python3
+
+"""
+Routines to work with OpenAuditTool.py on post-election audits.
+Joint allocation of the next stage's sample among collections.
+
+The other planners either add e.max_audit_rate_p[pbcid] ballots to
+every collection with an Open measurement, or plan sample sizes by
+simulation one measurement at a time (planner.get_sample_size and
+planner.discrete_rm).  With many contests sharing collections, both
+pull ballots that bring no measurement closer to passing: e.g. ballots
+from a collection whose contests are all nearly done, or more ballots
+for a measurement that other collections' ballots will already finish.
+
+With --joint_allocation, the planner (planner.compute_plan) instead
+chooses the increments for all collections together:
+
+(1) For each contest cid with an Open measurement, a *response curve*
+    is estimated for each collection pbcid: the projected risk if the
+    sample of pbcid were increased by 0, 1/CURVE_POINTS, ...,
+    CURVE_POINTS/CURVE_POINTS of its increment (the lesser of
+    e.max_audit_rate_p[pbcid] and its unsampled ballots), with the
+    other collections' samples unchanged.  As in
+    risk_bayes.compute_risk_with_tweak, the extra ballots are assumed
+    to have the same mix of votes as the current sample.  The risks
+    come from CURVE_TRIALS posterior draws, made on numpy arrays, with
+    common random numbers for all points of a curve, so that the curve
+    is smooth.  Curves are kept in e.risk_curve_cache, keyed by a
+    digest of the contest's sample state, so a contest whose sample
+    hasn't changed isn't recomputed.
+
+(2) A measurement's *progress* is how far its projected risk has moved
+    from its current value toward its risk limit (1 meaning projected
+    to pass); the progress from the collections is added up (and
+    capped at 1).
+
+(3) Increments are allocated greedily, in curve steps, to the
+    collection whose next steps give the largest increase in the total
+    progress of the Open measurements per ballot, until no more steps
+    help.  Each collection gets at most its increment.
+
+The work is proportional to the number of (contest, collection) pairs,
+so hundreds of contests are planned in seconds.  The curves of
+different contests are computed as separate jobs (see scheduler.py),
+in parallel with e.num_workers > 1.
+"""
+
+import hashlib
+
+import numpy as np
+
+import outcomes
+import risk_bayes
+import scheduler
+
+
+CURVE_POINTS = 4
+# number of nonzero increments at which each response curve is estimated
+
+CURVE_TRIALS = 200
+# number of posterior draws per point of a response curve
+
+
+def increments_p(e, pbcids):
+    """
+    Return dict mapping each pbcid in pbcids to the largest increment
+    considered for it: e.max_audit_rate_p[pbcid], or fewer if fewer of
+    its ballots are unsampled.
+    """
+
+    t = e.stage_time
+    return {pbcid: max(0, min(int(e.max_audit_rate_p[pbcid]),
+                              int(e.rn_p[pbcid] - e.sn_tp[t][pbcid])))
+            for pbcid in pbcids}
+
+
+def curve_key(e, cid, inc_p):
+    """
+    Return digest (a hex string) of what the response curves of cid
+    depend on: its sample tallies and stratum sizes, the collections'
+    sample sizes and increments inc_p, and the curve parameters.
+    """
+
+    t = e.stage_time
+    state = [str(e.ctx.rng.entropy), cid, e.ro_c[cid], e.contest_type_c[cid],
+             e.pseudocount_base, e.pseudocount_match, CURVE_POINTS, CURVE_TRIALS]
+    for pbcid in sorted(e.possible_pbcid_c[cid]):
+        tally2 = e.sn_tcpra[t][cid][pbcid]
+        state.append((pbcid, e.sn_tp[t][pbcid], inc_p.get(pbcid, 0),
+                      sorted(e.rn_cpr[cid][pbcid].items()),
+                      sorted((rv, av, tally2[rv][av]) for rv in tally2 for av in tally2[rv])))
+    return hashlib.sha256(repr(state).encode("utf-8")).hexdigest()
+
+
+def draw_test_tallies(e, cid, pbcid, votes, factor, rs):
+    """
+    Return array (CURVE_TRIALS x len(votes)) of test tallies for cid in
+    pbcid, as in risk_bayes.compute_risk, but with the sample tallies
+    scaled up by factor.
+    """
+
+    t = e.stage_time
+    index = {vote: j for j, vote in enumerate(votes)}
+    sample_rv = {}
+    for rv in e.sn_tcpra[t][cid][pbcid]:
+        sample = np.zeros(len(votes))
+        for av, count in e.sn_tcpra[t][cid][pbcid][rv].items():
+            sample[index[av]] = count
+        sample_rv[rv] = sample * factor
+    return risk_bayes.draw_test_tallies_array(e, cid, pbcid, votes, sample_rv,
+                                              CURVE_TRIALS, rs)
+
+
+def response_curves(e, cid, inc_p):
+    """
+    Return dict mapping each pbcid of cid to its response curve: the
+    list of projected risks for cid when the sample of pbcid (only) is
+    increased by inc_p[pbcid]*g/CURVE_POINTS ballots, g = 0,...,CURVE_POINTS.
+    (For g = 0 this is the projected risk of the current sample.)
+
+    Results are kept in e.risk_curve_cache, keyed by curve_key.
+    """
+
+    key = curve_key(e, cid, inc_p)
+    if key in e.risk_curve_cache:
+        return e.risk_curve_cache[key]
+
+    t = e.stage_time
+    votes = list(e.votes_c[cid])
+    for pbcid in e.possible_pbcid_c[cid]:
+        for rv in e.sn_tcpra[t][cid][pbcid]:
+            for av in e.sn_tcpra[t][cid][pbcid][rv]:
+                if av not in votes:
+                    votes.append(av)
+
+    def risk(tallies):
+        wrong = [ro != e.ro_c[cid]
+                 for ro in outcomes.compute_outcomes(e, cid, votes, tallies)]
+        return sum(wrong) / len(wrong)
+
+    # Each point of pbcid's curve draws from the same substream, so the
+    # draws at neighbouring points are strongly correlated.
+    def draw(pbcid, g):
+        sn = e.sn_tp[t][pbcid]
+        factor = 1.0 if sn == 0 else (sn + inc_p.get(pbcid, 0) * g / CURVE_POINTS) / sn
+        rs = e.ctx.rng.stream("curve", key, pbcid)
+        return draw_test_tallies(e, cid, pbcid, votes, factor, rs)
+
+    pbcids = sorted(e.possible_pbcid_c[cid])
+    base_p = {pbcid: draw(pbcid, 0) for pbcid in pbcids}
+    total = sum(base_p.values())
+    risk0 = risk(total)
+    curves = {}
+    for pbcid in pbcids:
+        curve = [risk0]
+        if inc_p.get(pbcid, 0) > 0 and e.sn_tp[t][pbcid] > 0:
+            others = total - base_p[pbcid]
+            for g in range(1, CURVE_POINTS+1):
+                curve.append(risk(others + draw(pbcid, g)))
+        else:
+            curve.extend([risk0] * CURVE_POINTS)
+        curves[pbcid] = curve
+    e.risk_curve_cache[key] = curves
+    return curves
+
+
+def compute_response_curves(e, cids, inc_p):
+    """
+    Compute (into e.risk_curve_cache) the response curves of the
+    contests in cids that aren't cached yet, one job per contest
+    (see scheduler.py).
+    """
+
+    jobs = {}
+    for cid in cids:
+        key = curve_key(e, cid, inc_p)
+        if key not in e.risk_curve_cache and cid not in jobs:
+            trials = CURVE_TRIALS * (1 + CURVE_POINTS * len(e.possible_pbcid_c[cid]))
+            jobs[cid] = ((cid, inc_p), scheduler.contest_cost(e, cid, e.sn_tcpra, trials))
+    curves_c = scheduler.run_jobs(e, "curve", response_curves, jobs)
+    for cid in curves_c:
+        e.risk_curve_cache[curve_key(e, cid, inc_p)] = curves_c[cid]
+
+
+def progress_curves(curves, risk_limit):
+    """
+    Return dict mapping each pbcid of response curves to its list of
+    progress values: for each point, the fraction (between 0 and 1) of
+    the way from the current projected risk down to risk_limit.  The
+    values are made nondecreasing along each curve, as risk can only
+    fall with more sampling (up to the noise in the estimates).
+    """
+
+    progress_p = {}
+    for pbcid in curves:
+        risk0 = curves[pbcid][0]
+        values = []
+        best = 0.0
+        for r in curves[pbcid]:
+            if risk0 > risk_limit:
+                best = max(best, min(1.0, (risk0 - r) / (risk0 - risk_limit)))
+            values.append(best)
+        progress_p[pbcid] = values
+    return progress_p
+
+
+def joint_allocation(e, pbcids_to_adjust):
+    """
+    Return dict (pbcid->int) of sample-size increments for pbcids_to_adjust,
+    chosen greedily from the response curves of the contests with Open
+    measurements, to increase the (projected) progress of those
+    measurements toward passing as much as possible per ballot.
+
+    If no increment gives any projected progress (e.g. the samples are
+    too small for the curves to show any), every collection gets its
+    full increment, as when planning without --joint_allocation.
+    """
+
+    inc_p = increments_p(e, pbcids_to_adjust)
+    open_mids = [mid for mid in e.mids
+                 if e.status_tm[e.stage_time][mid] == "Open"]
+    compute_response_curves(e, [e.cid_m[mid] for mid in open_mids], inc_p)
+    progress_mp = {}
+    for mid in open_mids:
+        curves = response_curves(e, e.cid_m[mid], inc_p)
+        progress_mp[mid] = progress_curves({pbcid: curves[pbcid] for pbcid in curves
+                                            if pbcid in inc_p},
+                                           e.risk_limit_m[mid])
+    mids_p = {pbcid: [mid for mid in open_mids if pbcid in progress_mp[mid]]
+              for pbcid in pbcids_to_adjust}
+
+    g_p = {pbcid: 0 for pbcid in pbcids_to_adjust}
+
+    def progress(mid, pbcid=None, g=None):
+        # projected progress of mid at g_p, but with g steps for pbcid
+        total = 0.0
+        for pbcid2, values in progress_mp[mid].items():
+            total += values[g if pbcid2 == pbcid else g_p[pbcid2]]
+        return min(1.0, total)
+
+    # Each round takes the move (some more steps for one collection)
+    # with the largest gain per ballot; looking past the next step
+    # lets a flat stretch of a curve be crossed.
+    while True:
+        best_move, best_gain = None, 0.0
+        for pbcid in pbcids_to_adjust:
+            if inc_p[pbcid] == 0:
+                continue
+            current = sum(progress(mid) for mid in mids_p[pbcid])
+            for g in range(g_p[pbcid]+1, CURVE_POINTS+1):
+                gain = sum(progress(mid, pbcid, g) for mid in mids_p[pbcid]) - current
+                gain = gain / (inc_p[pbcid] * (g - g_p[pbcid]) / CURVE_POINTS)
+                if gain > best_gain:
+                    best_move, best_gain = (pbcid, g), gain
+        if best_move is None:
+            break
+        g_p[best_move[0]] = best_move[1]
+
+    if all(g_p[pbcid] == 0 for pbcid in pbcids_to_adjust):
+        return {pbcid: e.max_audit_rate_p[pbcid] for pbcid in pbcids_to_adjust}
+    return {pbcid: int(round(inc_p[pbcid] * g_p[pbcid] / CURVE_POINTS))
+            for pbcid in pbcids_to_adjust}
@@ -0,0 +1,324 @@
+# asn.py
+# python3
+
+"""
+Routines to work with OpenAuditTool.py on post-election audits.
+Pre-audit simulation of the expected sample size ("average sample
+number", ASN) of the staged audit.
+
+Before an audit starts, its workload (how many ballots each collection
+will have to pull, and how many stages each contest will take) depends
+on how close the contests are and how accurate the scanners were.
+With --asn, the whole staged audit is simulated e.asn_audits times
+from the reported data (e.rn_cpr, e.ro_c) and the audit spec, under an
+assumed error model:
+
+    each ballot's actual vote equals its reported vote, except with
+    probability e.asn_error_rate, when it is one of the contest's other
+    votes (equally likely); for ballots of noCVR collections, the
+    actual vote follows the contest's reported vote shares (from
+    e.rn_cr, over all collections).
+
+Each simulated audit runs as the audit does with the default planner:
+the first stage samples e.max_audit_rate_p[pbcid] ballots from every
+collection, later stages that many more from every collection with an
+Open measurement; after each stage the risk of each Open measurement
+is measured (from e.asn_trials posterior draws), and the measurement
+becomes Exhausted, Passed or Upset as in audit.compute_statuses.  The
+audit stops when no measurement is Open, or after e.asn_max_stages
+stages.  Sampling is with replacement, and a ballot of pbcid contains
+contest cid with probability (number of ballots of pbcid with cid) /
+e.rn_p[pbcid], independently for each contest.
+
+The simulated audits are vectorized: those of a batch (ASN_BATCH_SIZE
+audits, with random draws from substream ("asn", batch)) are simulated
+together on numpy arrays, with the posterior draws for their risks made
+by risk_bayes.draw_test_tallies_array.  Batches are run in a pool of
+e.num_workers worker processes; the results don't depend on the number
+of workers.
+
+The report gives, for each collection, the distribution of the total
+number of ballots sampled, and for each measurement, the distribution
+of the number of stages it stays Open and how often it ends in each
+status.  It is shown and written to
+
+    3-audit
+       36-asn
+          asn-collections.csv
+          asn-measurements.csv
+"""
+
+import concurrent.futures
+import csv
+import logging
+import os
+
+import numpy as np
+
+import OpenAuditTool
+import outcomes
+import risk_bayes
+import utils
+
+
+logger = logging.getLogger(__name__)
+
+
+ASN_BATCH_SIZE = 100
+# number of simulated audits per batch (and per random substream)
+
+STATUSES = ["Open", "Passed", "Upset", "Exhausted"]
+# measurement statuses, as coded (by index) in simulation results
+
+NOCVR = ("-noCVR",)
+
+
+def asn_election(e):
+    """
+    Return a new Election with just the parts of e needed to simulate
+    the audit (and so cheap to send to worker processes).
+    """
+
+    e2 = OpenAuditTool.Election()
+    e2.ctx = e.ctx
+    for attribute in ["pbcids", "rn_p", "max_audit_rate_p",
+                      "cids", "possible_pbcid_c", "contest_type_c", "votes_c",
+                      "rn_cpr", "rn_cr", "ro_c",
+                      "mids", "cid_m", "risk_limit_m", "risk_upset_m", "initial_status_m",
+                      "pseudocount_base", "pseudocount_match",
+                      "asn_error_rate", "asn_trials", "asn_max_stages"]:
+        setattr(e2, attribute, getattr(e, attribute))
+    return e2
+
+
+def simulated_mids(e):
+    """ Return list of mids whose measurements start Open. """
+
+    return [mid for mid in e.mids if e.initial_status_m.get(mid, "Open") == "Open"]
+
+
+def simulated_cids(e):
+    """ Return list of contests of simulated_mids, each once. """
+
+    cids = []
+    for mid in simulated_mids(e):
+        if e.cid_m[mid] not in cids:
+            cids.append(e.cid_m[mid])
+    return cids
+
+
+def actual_vote_shares(e, cid, rv, votes):
+    """
+    Return array of probabilities (indexed by votes) of the actual vote
+    of a ballot with reported vote rv for cid, under the error model.
+    """
+
+    real = [vote for vote in votes if vote != NOCVR]
+    ps = np.zeros(len(votes))
+    if rv == NOCVR:
+        for j, vote in enumerate(votes):
+            if vote in real:
+                ps[j] = e.rn_cr[cid].get(vote, 0)
+        if ps.sum() == 0:
+            ps[[votes.index(vote) for vote in real]] = 1.0
+        return ps / ps.sum()
+    others = [votes.index(vote) for vote in real if vote != rv]
+    ps[votes.index(rv)] = 1.0
+    if len(others) > 0:
+        ps[votes.index(rv)] -= e.asn_error_rate
+        ps[others] = e.asn_error_rate / len(others)
+    return ps
+
+
+def simulate_batch(e, batch, num_audits):
+    """
+    Simulate num_audits audits of election e (as from asn_election),
+    with random draws from substream ("asn", batch).
+
+    Return dict with arrays
+        "sn_p"      (num_audits x len(e.pbcids)) total number of ballots
+                    sampled from each collection
+        "status_m"  (num_audits x len(simulated_mids(e))) final status
+                    of each measurement, as an index into STATUSES
+        "stages_m"  (same shape) number of stages for which each
+                    measurement was audited (while Open)
+    """
+
+    rs = e.ctx.rng.stream("asn", batch)
+    mids = simulated_mids(e)
+    rn = np.array([e.rn_p[pbcid] for pbcid in e.pbcids])
+    rate = np.array([int(e.max_audit_rate_p[pbcid]) for pbcid in e.pbcids])
+    sn = np.zeros((num_audits, len(e.pbcids)), dtype=np.int64)
+    status = np.zeros((num_audits, len(mids)), dtype=np.int64)
+    stages = np.zeros((num_audits, len(mids)), dtype=np.int64)
+
+    # For each contest and collection: the reported votes (strata) with
+    # ballots, their shares, the actual-vote shares for each, and the
+    # sample tallies (num_audits x strata x votes).
+    votes_c = {cid: list(e.votes_c[cid]) for cid in simulated_cids(e)}
+    strata_cp = {}
+    for cid in votes_c:
+        strata_cp[cid] = {}
+        for pbcid in sorted(e.possible_pbcid_c[cid]):
+            rvs = [rv for rv in sorted(e.rn_cpr[cid][pbcid]) if e.rn_cpr[cid][pbcid][rv] > 0]
+            if len(rvs) == 0:
+                continue
+            counts = np.array([e.rn_cpr[cid][pbcid][rv] for rv in rvs], dtype=float)
+            strata_cp[cid][pbcid] = {
+                "rvs": rvs,
+                "contest_share": min(1.0, counts.sum() / e.rn_p[pbcid]),
+                "rv_shares": counts / counts.sum(),
+                "av_shares": [actual_vote_shares(e, cid, rv, votes_c[cid]) for rv in rvs],
+                "tally": np.zeros((num_audits, len(rvs), len(votes_c[cid])), dtype=np.int64)}
+
+    for stage in range(1, e.asn_max_stages+1):
+        is_open = status == 0
+        if not is_open.any():
+            break
+
+        # sample more ballots
+        if stage == 1:
+            active = np.ones(sn.shape, dtype=bool)
+        else:
+            active = np.zeros(sn.shape, dtype=bool)
+            for i, mid in enumerate(mids):
+                for j, pbcid in enumerate(e.pbcids):
+                    if pbcid in e.possible_pbcid_c[e.cid_m[mid]]:
+                        active[:, j] |= is_open[:, i]
+        inc = np.where(active, np.minimum(rate, rn - sn), 0)
+        sn += inc
+        for cid in strata_cp:
+            for pbcid, strata in strata_cp[cid].items():
+                n = rs.binomial(inc[:, e.pbcids.index(pbcid)], strata["contest_share"])
+                rv_counts = rs.multinomial(n, strata["rv_shares"])
+                for k in range(len(strata["rvs"])):
+                    strata["tally"][:, k, :] += rs.multinomial(rv_counts[:, k],
+                                                               strata["av_shares"][k])
+
+        # measure risks of Open measurements, and update their statuses
+        exhausted = (sn == rn).all(axis=1)
+        for cid in strata_cp:
+            ms = [i for i, mid in enumerate(mids) if e.cid_m[mid] == cid]
+            rows = np.flatnonzero(is_open[:, ms].any(axis=1))
+            if len(rows) == 0:
+                continue
+            votes = votes_c[cid]
+            tallies = 0
+            for pbcid, strata in strata_cp[cid].items():
+                sample_rv = {rv: strata["tally"][rows, k, :]
+                             for k, rv in enumerate(strata["rvs"])}
+                tallies = tallies + risk_bayes.draw_test_tallies_array(
+                    e, cid, pbcid, votes, sample_rv, e.asn_trials, rs)
+            wrong = np.array([ro != e.ro_c[cid]
+                              for ro in outcomes.compute_outcomes(
+                                  e, cid, votes, tallies.reshape(-1, len(votes)))])
+            risk = wrong.reshape(len(rows), e.asn_trials).mean(axis=1)
+            for i in ms:
+                mid = mids[i]
+                still_open = is_open[rows, i]
+                new_status = np.select([exhausted[rows],
+                                        risk < e.risk_limit_m[mid],
+                                        risk > e.risk_upset_m[mid]],
+                                       [3, 1, 2], 0)
+                status[rows, i] = np.where(still_open, new_status, status[rows, i])
+                stages[rows, i] += still_open
+
+    return {"sn_p": sn, "status_m": status, "stages_m": stages}
+
+
+def simulate_audits(e):
+    """
+    Simulate e.asn_audits audits of election e, in batches of
+    ASN_BATCH_SIZE, in a pool of e.num_workers worker processes.
+    Return results as for simulate_batch, for all the audits.
+    """
+
+    e2 = asn_election(e)
+    batches = list(range((e.asn_audits + ASN_BATCH_SIZE - 1) // ASN_BATCH_SIZE))
+    sizes = [min(ASN_BATCH_SIZE, e.asn_audits - batch * ASN_BATCH_SIZE)
+             for batch in batches]
+    if e.num_workers > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=e.num_workers) as executor:
+            results = list(executor.map(simulate_batch,
+                                        [e2] * len(batches), batches, sizes))
+    else:
+        results = [simulate_batch(e2, batch, size)
+                   for batch, size in zip(batches, sizes)]
+    return {key: np.concatenate([result[key] for result in results])
+            for key in ["sn_p", "status_m", "stages_m"]}
+
+
+def asn_report(e, results):
+    """
+    Return (collection_rows, measurement_rows), lists of dicts
+    summarizing simulation results from simulate_audits.
+    """
+
+    collection_rows = []
+    for j, pbcid in enumerate(e.pbcids):
+        sn = results["sn_p"][:, j]
+        collection_rows.append({"Collection": pbcid,
+                                "Mean ballots": round(float(sn.mean()), 1),
+                                "10% ballots": int(np.percentile(sn, 10)),
+                                "Median ballots": int(np.percentile(sn, 50)),
+                                "90% ballots": int(np.percentile(sn, 90)),
+                                "Max ballots": int(sn.max())})
+
+    measurement_rows = []
+    for i, mid in enumerate(simulated_mids(e)):
+        stages = results["stages_m"][:, i]
+        row = {"Measurement id": mid,
+               "Contest": e.cid_m[mid],
+               "Mean stages": round(float(stages.mean()), 2),
+               "Median stages": int(np.percentile(stages, 50)),
+               "90% stages": int(np.percentile(stages, 90)),
+               "Max stages": int(stages.max())}
+        for code, status in enumerate(STATUSES):
+            row[status] = round(float((results["status_m"][:, i] == code).mean()), 4)
+        measurement_rows.append(row)
+
+    return collection_rows, measurement_rows
+
+
+def write_asn_report(e, collection_rows, measurement_rows):
+    """ Write ASN report to 3-audit/36-asn/asn-collections.csv and asn-measurements.csv """
+
+    dirpath = os.path.join(e.ctx.elections_root, e.election_dirname,
+                           "3-audit", "36-asn")
+    os.makedirs(dirpath, exist_ok=True)
+    for filename, rows in [("asn-collections.csv", collection_rows),
+                           ("asn-measurements.csv", measurement_rows)]:
+        with open(os.path.join(dirpath, filename), "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=list(rows[0]), lineterminator="\n")
+            writer.writeheader()
+            writer.writerows(rows)
+    utils.invalidate_dir_index(e.ctx, dirpath)
+
+
+def show_asn_report(e, collection_rows, measurement_rows):
+
+    logger.info("====== ASN simulation ======")
+    logger.info("%d simulated audits, error rate %s, %d trials per risk measurement.",
+                e.asn_audits, e.asn_error_rate, e.asn_trials)
+    for rows in [collection_rows, measurement_rows]:
+        for row in rows:
+            logger.info("    %s", ", ".join("{}: {}".format(k, v) for k, v in row.items()))
+
+
+def asn(e):
+    """
+    Simulate the audit of election e (whose election spec, reported
+    data, and audit spec have been read), then show and write the report.
+    """
+
+    for cid in simulated_cids(e):
+        if any(e.rn_cpr[cid][pbcid].get(NOCVR, 0) > 0 for pbcid in e.possible_pbcid_c[cid]) \
+           and all(e.rn_cr[cid].get(vote, 0) == 0 for vote in e.votes_c[cid] if vote != NOCVR):
+            logger.warning("No reported vote shares for noCVR ballots of contest %s; "
+                           "simulating them as equal shares.", cid)
+    results = simulate_audits(e)
+    collection_rows, measurement_rows = asn_report(e, results)
+    show_asn_report(e, collection_rows, measurement_rows)
+    if e.write_outputs:
+        write_asn_report(e, collection_rows, measurement_rows)
+    return results
@@ -13,10 +13,13 @@ import warnings
 import time
 
 import OpenAuditTool
+import audit_orders
+import consistent_sampling
 import csv_readers
+import election_db
 import ids
-import outcomes
 import planner
+import pull_lists
 import risk_bayes
 import saved_state
 import utils
@@ -30,16 +33,18 @@ logger = logging.getLogger(__name__)
 # Random number generation
 ##############################################################################
 
-# see numpy.random.RandomState documentation and utils.RandomState
-# Random states used in this program:
-# auditRandomState        -- controls random sampling and other audit aspects
+# see numpy.random.Generator documentation and rng.py
+# All random draws come from named substreams of the random number
+# service e.ctx.rng in the audit context (see audit_context.py), e.g.
+# e.ctx.rng.stream("risk", ...)  -- risk computations (risk_bayes.py)
+# e.ctx.rng.stream("plan", ...)  -- randomized planners (planner.py)
 
 ##############################################################################
 # Audit I/O and validation
 ##############################################################################
 
 
-def draw_sample(e):
+def draw_sample(e, sample_size_p=None, sample_size_cp=None):
     """ 
     "Draw sample", tally it, save sample tally in 
         e.sn_tcpra[stage_time][cid][pbcid]. 
@@ -58,9 +63,31 @@ def draw_sample(e):
     to number of ballots sampled in each pbc (equal to plan).
     Note that in real life actual sampling number might be different than planned;
     here it will be the same.  But code elsewhere allows for such differences.
+
+    If sample_size_p is given, it gives the number of ballots sampled
+    in each pbc instead (e.g. as in audit_watch.py).
+
+    With consistent sampling (see consistent_sampling.py), the sample
+    for cid and pbcid is instead the first
+        e.sn_tcp[stage_time][cid][pbcid]
+    ballots of consistent_sampling.contest_bids(e, cid, pbcid), as
+    planned in e.plan_tcp (or as given by sample_size_cp), and
+        e.sn_tp[stage_time][pbcid]
+    is the number of distinct ballots in these samples.
     """
 
-    if "plan_tp" in e.saved_state:
+    if e.consistent_sampling:
+        if sample_size_cp is not None:
+            e.sn_tcp[e.stage_time] = {cid: dict(sample_size_cp[cid])
+                                      for cid in sample_size_cp}
+        elif "plan_tcp" in e.saved_state:
+            e.sn_tcp[e.stage_time] = e.saved_state["plan_tcp"][e.saved_state["stage_time"]]
+        else:
+            e.sn_tcp[e.stage_time] = consistent_sampling.initial_plan_tcp(e)
+        e.sn_tp[e.stage_time] = consistent_sampling.plan_sizes_p(e, e.sn_tcp[e.stage_time])
+    elif sample_size_p is not None:
+        e.sn_tp[e.stage_time] = dict(sample_size_p)
+    elif "plan_tp" in e.saved_state:
         e.sn_tp[e.stage_time] = e.saved_state["plan_tp"][e.saved_state["stage_time"]]
     else:
         e.sn_tp[e.stage_time] = { pbcid: int(e.max_audit_rate_p[pbcid])
@@ -75,29 +102,128 @@ def draw_sample(e):
 
             e.sn_tcpr[e.stage_time][cid][pbcid] = {}
 
-            sample_size = int(e.sn_tp[e.stage_time][pbcid])
-            sample_bids = e.bids_p[pbcid][:sample_size]
-
-            avs = []
-            rvs = []
-            for bid in sample_bids:
-                # actual
-                if bid in e.av_cpb[cid][pbcid]:
-                    avs.append(e.av_cpb[cid][pbcid][bid])
-                else:
-                    avs.append(("-NoSuchContest",))
-                # reported
-                if bid in e.rv_cpb[cid][pbcid]:
-                    rvs.append(e.rv_cpb[cid][pbcid][bid])
-                else:
-                    rvs.append(("-NoSuchContest",))
-            arvs = list(zip(avs, rvs))  # list of (actual, reported) vote pairs
-
-            e.sn_tcpra[e.stage_time][cid][pbcid] = outcomes.compute_tally2(arvs)
+            if e.consistent_sampling:
+                bids = consistent_sampling.contest_bids(e, cid, pbcid)
+                sample_size = int(e.sn_tcp[e.stage_time][cid][pbcid])
+            else:
+                bids = None
+                sample_size = int(e.sn_tp[e.stage_time][pbcid])
+
+            if e.db is not None:
+                # tally is a GROUP BY query in the election database
+                tally2 = election_db.compute_sample_tally(e, cid, pbcid, sample_size)
+                e.sn_tcpra[e.stage_time][cid][pbcid] = tally2
+                for r in e.rn_cpr[cid][pbcid]:
+                    e.sn_tcpr[e.stage_time][cid][pbcid][r] = \
+                        sum(tally2.get(r, {}).values())
+                continue
+
+            tally2 = extend_sample_tally(e, cid, pbcid, sample_size, bids)
+
+            # copy, since the running tally keeps changing in later stages
+            e.sn_tcpra[e.stage_time][cid][pbcid] = \
+                {rv: tally2[rv].copy() for rv in tally2}
 
             for r in e.rn_cpr[cid][pbcid]:
-                e.sn_tcpr[e.stage_time][cid][pbcid][r] = len(
-                    [rr for rr in rvs if rr == r])
+                e.sn_tcpr[e.stage_time][cid][pbcid][r] = \
+                    sum(tally2.get(r, {}).values())
+
+
+##############################################################################
+# Running sample tallies
+#
+# e.sample_tally_cpra[cid][pbcid] is the tally2 (rv->av->count) of the
+# first e.sample_size_cp[cid][pbcid] ballots of e.bids_p[pbcid] (or,
+# with consistent sampling, of consistent_sampling.contest_bids(e, cid,
+# pbcid)), kept from stage to stage, so that a stage only tallies the
+# ballots sampled since the previous stage.
+
+
+def extend_sample_tally(e, cid, pbcid, sample_size, bids=None):
+    """
+    Extend running sample tally for cid and pbcid to cover the first
+    sample_size ballots of bids (default e.bids_p[pbcid]), and return it.
+
+    Equal to outcomes.compute_tally2 of the (actual, reported) vote pairs
+    of those ballots (a missing vote counts as ("-NoSuchContest",)).
+    """
+
+    tally2 = e.sample_tally_cpra.setdefault(cid, {}).setdefault(pbcid, {})
+    sizes = e.sample_size_cp.setdefault(cid, {})
+    old_size = sizes.get(pbcid, 0)
+    if sample_size < old_size:
+        # sample shrank; start over
+        tally2.clear()
+        old_size = 0
+
+    if bids is None:
+        bids = e.bids_p[pbcid]
+    av_b = e.av_cpb[cid][pbcid]
+    rv_b = e.rv_cpb[cid][pbcid]
+    for bid in bids[old_size:sample_size]:
+        av = av_b.get(bid, ("-NoSuchContest",))
+        rv = rv_b.get(bid, ("-NoSuchContest",))
+        tally_a = tally2.setdefault(rv, {})
+        tally_a[av] = tally_a.get(av, 0) + 1
+    sizes[pbcid] = max(old_size, min(sample_size, len(bids)))
+    return tally2
+
+
+def update_sample_tally(e, cid, pbcid, bid, old_av, new_av):
+    """
+    Update running sample tally for cid and pbcid when the audited vote
+    for ballot bid changes from old_av to new_av (either may be None,
+    meaning no audited vote).  Only matters if bid is already tallied.
+    """
+
+    size = e.sample_size_cp.get(cid, {}).get(pbcid, 0)
+    if size == 0:
+        return
+    if e.consistent_sampling:
+        # sample is a prefix of the contest's priority order, not of
+        # e.bids_p[pbcid]; just retally from scratch next time
+        i = consistent_sampling.contest_ordinals(e, cid, pbcid).get(bid)
+        if i is not None and i < size:
+            e.sample_tally_cpra[cid][pbcid].clear()
+            e.sample_size_cp[cid][pbcid] = 0
+        return
+    i = ballot_ordinals(e, pbcid).get(bid)
+    if i is None or i >= size:
+        return
+    if bid in e.duplicate_bids_p[pbcid]:
+        # duplicate ballot id; just retally from scratch next time
+        e.sample_tally_cpra[cid][pbcid].clear()
+        e.sample_size_cp[cid][pbcid] = 0
+        return
+
+    rv = e.rv_cpb[cid][pbcid].get(bid, ("-NoSuchContest",))
+    old_av = ("-NoSuchContest",) if old_av is None else old_av
+    new_av = ("-NoSuchContest",) if new_av is None else new_av
+    tally_a = e.sample_tally_cpra[cid][pbcid][rv]
+    tally_a[old_av] -= 1
+    if tally_a[old_av] == 0:
+        del tally_a[old_av]
+    tally_a[new_av] = tally_a.get(new_av, 0) + 1
+
+
+def ballot_ordinals(e, pbcid):
+    """
+    Return dict e.ordinal_pb[pbcid] giving the (first) position of each
+    bid in e.bids_p[pbcid], computing it (once), together with the set
+    e.duplicate_bids_p[pbcid] of bids appearing there more than once.
+    """
+
+    if pbcid not in e.ordinal_pb:
+        ordinal_b = {}
+        duplicates = set()
+        for i, bid in enumerate(e.bids_p[pbcid]):
+            if bid in ordinal_b:
+                duplicates.add(bid)
+            else:
+                ordinal_b[bid] = i
+        e.ordinal_pb[pbcid] = ordinal_b
+        e.duplicate_bids_p[pbcid] = duplicates
+    return e.ordinal_pb[pbcid]
 
 
 def show_sample_counts(e):
@@ -130,9 +256,13 @@ def compute_statuses(e):
         e.status_tm[e.stage_time][mid] = \
             e.saved_state["status_tm"][e.saved_state["stage_time"]][mid]
         if e.status_tm[e.stage_time][mid] == "Open":
-            if all([e.rn_p[pbcid] == e.sn_tp[e.stage_time][pbcid]
-                    for cid in e.possible_pbcid_c
-                    for pbcid in e.possible_pbcid_c[cid]]):
+            if e.consistent_sampling:
+                exhausted = consistent_sampling.contest_exhausted(e, e.cid_m[mid])
+            else:
+                exhausted = all([e.rn_p[pbcid] == e.sn_tp[e.stage_time][pbcid]
+                                 for cid in e.possible_pbcid_c
+                                 for pbcid in e.possible_pbcid_c[cid]])
+            if exhausted:
                 e.status_tm[e.stage_time][mid] = "Exhausted"
             elif e.risk_tm[e.stage_time][mid] < e.risk_limit_m[mid]:
                 e.status_tm[e.stage_time][mid] = "Passed"
@@ -176,18 +306,17 @@ def set_audit_seed(e, new_audit_seed):
     value first, in which case it is "sticky" and thus overrides any 
     setting that might be in the audit seed file.
 
-    This routine also sets the global auditRandomState.
+    This routine also (re)seeds the random streams in the audit
+    context e.ctx.
     """
 
-    global auditRandomState
-
     e.audit_seed = new_audit_seed
     # audit_seed might be None if no command-line argument given
 
-    auditRandomState = utils.RandomState(e.audit_seed)
+    e.ctx.seed(e.audit_seed)
     # if seed is None (which happens if no command line value is given),
-    # utils.RandomState uses clock or other variable process-state
-    # parameters (via np.random.RandomState)
+    # the random streams are seeded from the clock or other variable
+    # process-state parameters
 
 
 def read_audit_spec(e, args):
@@ -207,14 +336,15 @@ def read_audit_spec(e, args):
 def read_audit_spec_global(e, args):
     """ Read 3-audit/31-audit-spec/audit-spec-global.csv """
 
-    election_pathname = os.path.join(OpenAuditTool.ELECTIONS_ROOT,
+    election_pathname = os.path.join(e.ctx.elections_root,
                                      e.election_dirname)
     audit_spec_pathname = os.path.join(election_pathname,
                                        "3-audit",
                                        "31-audit-spec")
     filename = utils.greatest_name(audit_spec_pathname,
                                    "audit-spec-global",
-                                   ".csv")
+                                   ".csv",
+                                   ctx=e.ctx)
     file_pathname = os.path.join(audit_spec_pathname, filename)
     fieldnames = ["Global Audit Parameter",
                   "Value"]
@@ -229,14 +359,15 @@ def read_audit_spec_global(e, args):
 def read_audit_spec_contest(e, args):
     """ Read 3-audit/31-audit-spec/audit-spec-contest.csv """
 
-    election_pathname = os.path.join(OpenAuditTool.ELECTIONS_ROOT,
+    election_pathname = os.path.join(e.ctx.elections_root,
                                      e.election_dirname)
     audit_spec_pathname = os.path.join(election_pathname,
                                        "3-audit",
                                        "31-audit-spec")
     filename = utils.greatest_name(audit_spec_pathname,
                                    "audit-spec-contest",
-                                   ".csv")
+                                   ".csv",
+                                   ctx=e.ctx)
     file_pathname = os.path.join(audit_spec_pathname, filename)
     fieldnames = ["Measurement id",
                   "Contest",
@@ -264,14 +395,15 @@ def read_audit_spec_contest(e, args):
 def read_audit_spec_collection(e, args):
     """ Read 3-audit/31-audit-spec/audit-spec-collection.csv """
 
-    election_pathname = os.path.join(OpenAuditTool.ELECTIONS_ROOT,
+    election_pathname = os.path.join(e.ctx.elections_root,
                                      e.election_dirname)
     audit_spec_pathname = os.path.join(election_pathname,
                                        "3-audit",
                                        "31-audit-spec")
     filename = utils.greatest_name(audit_spec_pathname,
                                    "audit-spec-collection",
-                                   ".csv")
+                                   ".csv",
+                                   ctx=e.ctx)
     file_pathname = os.path.join(audit_spec_pathname, filename)
     fieldnames = ["Collection",
                   "Max audit rate"]
@@ -289,14 +421,15 @@ def read_audit_spec_seed(e, args):
     because this means it was already set from the command line.
     """
 
-    election_pathname = os.path.join(OpenAuditTool.ELECTIONS_ROOT,
+    election_pathname = os.path.join(e.ctx.elections_root,
                                      e.election_dirname)
     audit_spec_pathname = os.path.join(election_pathname,
                                        "3-audit",
                                        "31-audit-spec")
     filename = utils.greatest_name(audit_spec_pathname,
                                    "audit-spec-seed",
-                                   ".csv")
+                                   ".csv",
+                                   ctx=e.ctx)
     file_pathname = os.path.join(audit_spec_pathname, filename)
     fieldnames = ["Audit seed"]
     rows = csv_readers.read_csv_file(file_pathname, fieldnames, varlen=False)
@@ -382,30 +515,59 @@ def show_audit_stage_header(e):
                         slack[pbcid]))
 
 
-def read_audited_votes(e):
+def read_audited_votes(e, growing=False):
     """ 
     Read audited votes from 3-audit/33-audited-votes/audited-votes-PBCID.csv 
+
+    Only rows appended since the previous call are read, unless the
+    file has been replaced (e.g. by a new version) or rewritten.
+    If growing is True (as in watch mode, where audit boards are still
+    appending rows), an unterminated last line is left for a later call.
+
+    Return set of (cid, pbcid) pairs for which some audited vote was
+    read that is new or changed.
     """
 
-    election_pathname = os.path.join(OpenAuditTool.ELECTIONS_ROOT,
+    changed_cp = set()
+
+    election_pathname = os.path.join(e.ctx.elections_root,
                                      e.election_dirname)
     audited_votes_pathname = os.path.join(election_pathname,
                                           "3-audit",
                                           "33-audited-votes")
+    # Collection Managers may have added new files since last stage.
+    utils.invalidate_dir_index(e.ctx, audited_votes_pathname)
     for pbcid in e.pbcids:
         safe_pbcid = ids.filename_safe(pbcid)
         filename = utils.greatest_name(audited_votes_pathname,
                                        "audited-votes-"+safe_pbcid,
-                                       ".csv")
+                                       ".csv",
+                                       ctx=e.ctx)
         file_pathname = os.path.join(audited_votes_pathname, filename)
         fieldnames = ["Collection", "Ballot id", "Contest", "Selections"]
-        rows = csv_readers.read_csv_file(file_pathname, fieldnames, varlen=True)
+        # Audit boards only append rows, so after the first stage
+        # just read the rows added since the previous stage.
+        tail_state = e.audited_votes_tail_p.get(pbcid)
+        rows, e.audited_votes_tail_p[pbcid], reread = \
+            csv_readers.read_csv_file_tail(file_pathname, tail_state,
+                                           fieldnames, varlen=True, growing=growing)
+        if reread and tail_state is not None:
+            logger.info("Reading all of %s.", file_pathname)
+        if e.db is not None:
+            election_db.load_audited_votes(e, pbcid, rows)
+            changed_cp.update((row["Contest"], row["Collection"]) for row in rows)
+            continue
         for row in rows:
             pbcid = row["Collection"]
             bid = row["Ballot id"]
             cid = row["Contest"]
             vote = row["Selections"]
-            utils.nested_set(e.av_cpb, [cid, pbcid, bid], vote)
+            old_vote = e.av_cpb.get(cid, {}).get(pbcid, {}).get(bid)
+            if vote != old_vote:
+                utils.nested_set(e.av_cpb, [cid, pbcid, bid], vote)
+                update_sample_tally(e, cid, pbcid, bid, old_vote, vote)
+                changed_cp.add((cid, pbcid))
+    return changed_cp
 
 
 def audit_stage(e, stage_time):
@@ -437,8 +599,9 @@ def audit_stage(e, stage_time):
     risk_bayes.compute_risks(e, e.sn_tcpra)
     compute_statuses(e)
 
-    write_audit_output_contest_status(e)
-    write_audit_output_collection_status(e)
+    if e.write_outputs:
+        write_audit_output_contest_status(e)
+        write_audit_output_collection_status(e)
 
     show_audit_stage_header(e)
     show_sample_counts(e)
@@ -451,7 +614,7 @@ def write_audit_output_contest_status(e):
     except for status field.
     """
 
-    dirpath = os.path.join(OpenAuditTool.ELECTIONS_ROOT,
+    dirpath = os.path.join(e.ctx.elections_root,
                            e.election_dirname,
                            "3-audit",
                            "34-audit-output")
@@ -481,11 +644,12 @@ def write_audit_output_contest_status(e):
             file.write("{},".format(e.risk_measurement_parameters_m[mid][0]))
             file.write("{}".format(e.risk_measurement_parameters_m[mid][1]))
             file.write("\n")
+    utils.invalidate_dir_index(e.ctx, dirpath)
 
 def write_audit_output_collection_status(e):
     """ Write 3-audit/34-audit-output/audit_output_collection_status.csv """
 
-    dirpath = os.path.join(OpenAuditTool.ELECTIONS_ROOT,
+    dirpath = os.path.join(e.ctx.elections_root,
                            e.election_dirname,
                            "3-audit",
                            "34-audit-output")
@@ -501,7 +665,10 @@ def write_audit_output_collection_status(e):
         file.write("\n")
         for pbcid in e.pbcids:
             file.write("{},".format(pbcid))
-            file.write("{},".format(len(e.bids_p[pbcid])))
+            if e.db is not None:
+                file.write("{},".format(election_db.count_ballots(e, pbcid)))
+            else:
+                file.write("{},".format(len(e.bids_p[pbcid])))
             file.write("{},".format(e.sn_tp[e.stage_time][pbcid]))
             if "sn_tp" in e.saved_state:
                 new_sample_size = e.sn_tp[e.stage_time][pbcid]
@@ -510,6 +677,7 @@ def write_audit_output_collection_status(e):
                 diff_sample_size = new_sample_size - old_sample_size
                 file.write("{}".format(diff_sample_size))
             file.write("\n")            
+    utils.invalidate_dir_index(e.ctx, dirpath)
 
 
 def stop_audit(e):
@@ -532,28 +700,72 @@ def audit(e, args):
     initialize_audit(e)
     saved_state.write_initial_saved_state(e)
     show_audit_spec(e)
+    if audit_orders.incremental(e):
+        audit_orders.extend_audit_orders(e, e.max_audit_rate_p)
+    if e.pull_lists and e.write_outputs:
+        pull_lists.write_pull_lists(e)
 
     logger.info("====== Audit ======")
 
+    stage_number = 0
     while True:
-        stage_time = utils.datetime_string()
+        stage_number += 1
+        stage_time = new_stage_time(e, stage_number)
         if stage_time > e.max_stage_time:
             break
         audit_stage(e, stage_time)
         if stop_audit(e):
             break
-        planner.compute_plan(e)
-
-        mid = e.mids[0]
-        risk_bayes.tweak_all(e, mid)
+        plan_next_stage(e)
 
         if args.pause and not input("Begin new audit stage? (y or n):").startswith('y'):
             break
         saved_state.write_intermediate_saved_state(e)
-        time.sleep(2)              # to ensure next stage_time is new
+        if not e.simulate:
+            time.sleep(2)          # to ensure next stage_time is new
     show_audit_summary(e)
 
 
+def new_stage_time(e, stage_number):
+    """
+    Return stage time for stage stage_number (1, 2, ...) of audit:
+    logical when simulating, else current datetime.
+    """
+
+    if e.simulate:
+        return utils.logical_stage_time(stage_number)
+    return utils.datetime_string()
+
+
+def next_stage_time(e):
+    """
+    Return stage time for next stage of a long-running audit (server or
+    watch mode), counting stages in e.stage_number.  Waits, if need be,
+    for the clock to pass the current stage time.
+    """
+
+    e.stage_number += 1
+    stage_time = new_stage_time(e, e.stage_number)
+    while not e.simulate and stage_time <= e.stage_time:
+        time.sleep(0.1)
+        stage_time = new_stage_time(e, e.stage_number)
+    return stage_time
+
+
+def plan_next_stage(e):
+    """ Compute plan (e.plan_tp[e.stage_time]) for next audit stage. """
+
+    planner.compute_plan(e)
+
+    mid = e.mids[0]
+    risk_bayes.tweak_all(e, mid)
+
+    if audit_orders.incremental(e):
+        audit_orders.extend_audit_orders(e, e.plan_tp[e.stage_time])
+    if e.pull_lists and e.write_outputs:
+        pull_lists.write_pull_lists(e)
+
+
 def show_audit_summary(e):
 
     logger.info("=============")
@@ -0,0 +1,50 @@
+# audit_context.py
+# python3
+
+"""
+Routines to work with OpenAuditTool.py on post-election audits.
+Audit context: per-audit state that used to be module-level globals.
+
+Each Election e has its own context e.ctx, holding
+
+    elections_root  directory holding all elections (formerly the
+                    global OpenAuditTool.ELECTIONS_ROOT, which is now
+                    just the default value)
+    audit_seed      audit seed that the random streams were seeded from
+    rng             random number service (see rng.py), from which
+                    all of the audit's random draws come, as named
+                    substreams (formerly the global
+                    audit.auditRandomState, np.random, and random)
+    random_state    rng.stream("default"), a numpy Generator for draws
+                    with no more specific substream
+    planner_random  rng.stream("planner"), likewise for planner.py
+    dir_index       cached directory listings for utils.greatest_name
+                    (formerly the global utils.dir_index_cache)
+
+Since nothing here is shared between Elections, several audits can be
+run in one process (one Election each, e.g. in separate threads)
+without affecting each other's files or random draws.
+"""
+
+import rng
+
+
+class AuditContext(object):
+    """ Root directory and random streams for auditing one Election. """
+
+    def __init__(self, elections_root="./elections", audit_seed=None):
+        self.elections_root = elections_root
+        self.dir_index = {}
+        self.seed(audit_seed)
+
+    def seed(self, audit_seed):
+        """
+        (Re)seed random streams from audit_seed, an arbitrarily
+        large nonnegative integer (or string of digits), or None
+        to seed them from fresh OS entropy.
+        """
+
+        self.audit_seed = audit_seed
+        self.rng = rng.RNG(audit_seed)
+        self.random_state = self.rng.stream("default")
+        self.planner_random = self.rng.stream("planner")
@@ -15,13 +15,48 @@ The method used uses SHA256 in counter mode, as in
 the program:
      https://people.csail.mit.edu/rivest/sampler.py
 
+An audit usually only looks at a small prefix of the audit order, but
+Fisher-Yates needs one hash per ballot before even the first ballot
+of the order is known.  So there is also a "lazy" mode
+(e.audit_order_mode == "lazy"), in which the audit order is instead a
+keyed pseudorandom permutation of the ballot positions, computed one
+position at a time: a Feistel network with SHA256 round functions on
+the smallest even number of bits covering the collection, restricted
+to the collection by "cycle walking" (re-applying the permutation
+until the value falls within range).  The first k ballots of the
+order then cost O(k) hashes, and each stage just extends the prefix
+computed so far (extend_audit_order).  (The lazy order is a different
+order from the Fisher-Yates one for the same seed.)
+
+When the full Fisher-Yates order is wanted for a large collection, the
+hashes (which are independent of each other) may be computed in
+e.num_workers worker processes (shuffle_parallel); the result is
+identical to that of shuffle.
+
+With consistent sampling (see consistent_sampling.py), the audit order
+of a collection is instead its ballots in priority order.
+
+Audit orders are normally written as one file per collection.  With
+e.audit_order_chunk_size > 0 they are instead written in numbered
+chunk files of that many ballots each,
+
+    3-audit/32-audit-orders/audit-order-PBCID-chunk-000000.csv
+    3-audit/32-audit-orders/audit-order-PBCID-chunk-000001.csv
+    ...
+
+generated on demand: at each stage only the chunks covering the
+newly planned part of the sample (extend_audit_orders) are computed
+(in lazy mode) and written.
 """
 
+import array
+import concurrent.futures
+import csv
 import hashlib
 import logging
 import os
 
-import OpenAuditTool
+import consistent_sampling
 import ids
 import utils
 
@@ -51,6 +86,47 @@ def shuffle(L, seed):
     return L
 
 
+SHUFFLE_BATCH_SIZE = 2**18
+
+
+def shuffle_swap_indices(seed, start, stop):
+    """
+    Return array of the swap indices j used by shuffle(L, seed) at
+    steps i = start, ..., stop-1 (j = SHA256(seed,i) mod (i+1)).
+    """
+
+    prefix = (str(seed)+",").encode("utf-8")
+    sha256 = hashlib.sha256
+    from_bytes = int.from_bytes
+    return array.array("Q", [from_bytes(sha256(prefix + str(i).encode("ascii")).digest(),
+                                        "big") % (i+1)
+                             for i in range(start, stop)])
+
+
+def shuffle_parallel(L, seed, num_workers, batch_size=SHUFFLE_BATCH_SIZE):
+    """
+    Return shuffled copy of list L, based on seed; same result as
+    shuffle(L, seed), but with the hashing done by num_workers worker
+    processes, batch_size steps at a time.  (Only the swaps themselves
+    need to be done in order.)
+    """
+
+    L = list(L).copy()
+    n = len(L)
+    starts = range(0, n, batch_size)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
+        batches = executor.map(shuffle_swap_indices,
+                               [seed] * len(starts),
+                               starts,
+                               [min(start+batch_size, n) for start in starts])
+        i = 0
+        for js in batches:
+            for j in js:
+                L[i], L[j] = L[j], L[i]
+                i += 1
+    return L
+
+
 def test_shuffle(seed=1234567890):
 
     for i in range(3):
@@ -63,55 +139,236 @@ def test_shuffle(seed=1234567890):
     """
     
 
+FEISTEL_ROUNDS = 6
+
+
+def feistel_round_value(seed, r, x, half_bits):
+    """ Return round-r Feistel round-function value (half_bits bits) for x. """
+
+    hash_input = bytearray(str(seed)+","+str(r)+","+str(x), 'utf-8')
+    digest = hashlib.sha256(hash_input).digest()
+    return int.from_bytes(digest[:8], "big") & ((1 << half_bits) - 1)
+
+
+def feistel_half_bits(n):
+    """ Return half-width (in bits) of Feistel network covering range(n). """
+
+    return max(1, ((n-1).bit_length() + 1) // 2)
+
+
+def permute(i, n, seed, rounds=FEISTEL_ROUNDS):
+    """
+    Return image of i (0 <= i < n) under pseudorandom permutation of
+    range(n) keyed by seed.
+    """
+
+    half_bits = feistel_half_bits(n)
+    mask = (1 << half_bits) - 1
+    x = i
+    while True:
+        left, right = x >> half_bits, x & mask
+        for r in range(rounds):
+            left, right = right, left ^ feistel_round_value(seed, r, right, half_bits)
+        x = (left << half_bits) | right
+        if x < n:                          # cycle-walk until in range
+            return x
+
+
+def lazy_order(n, seed, start, stop):
+    """
+    Return positions start, ..., stop-1 (0-based, stop <= n) of
+    lazy (Feistel) audit order of range(n) keyed by seed.
+    """
+
+    return [permute(k, n, seed) for k in range(start, stop)]
+
+
 def compute_audit_orders(e):
 
     for pbcid in e.pbcids:
-        compute_audit_order(e, pbcid)
+        if e.consistent_sampling:
+            consistent_sampling.compute_audit_order(e, pbcid)
+        elif e.audit_order_mode == "lazy":
+            extend_audit_order(e, pbcid, int(e.max_audit_rate_p[pbcid]))
+        else:
+            compute_audit_order(e, pbcid)
 
 
 def compute_audit_order(e, pbcid):
 
     pairs = zip(list(range(1, 1+len(e.bids_p[pbcid]))),
                 e.bids_p[pbcid])
-    shuffled_pairs = shuffle(pairs, str(e.audit_seed)+","+pbcid)
+    seed = str(e.audit_seed)+","+pbcid
+    if e.num_workers > 1:
+        shuffled_pairs = shuffle_parallel(pairs, seed, e.num_workers)
+    else:
+        shuffled_pairs = shuffle(pairs, seed)
     e.shuffled_indices_p[pbcid] = [i for (i,b) in shuffled_pairs]
     e.shuffled_bids_p[pbcid] = [b for (i,b) in shuffled_pairs]
 
 
+def extend_audit_order(e, pbcid, k):
+    """
+    Extend lazy audit order for pbcid (e.shuffled_indices_p[pbcid] and
+    e.shuffled_bids_p[pbcid]) to its first k ballots (or all of them).
+    With consistent sampling, the audit order (all of it) is the
+    priority order instead.
+    """
+
+    if e.consistent_sampling:
+        if pbcid not in e.shuffled_bids_p:
+            consistent_sampling.compute_audit_order(e, pbcid)
+        return
+
+    bids = e.bids_p[pbcid]
+    n = len(bids)
+    indices = e.shuffled_indices_p.setdefault(pbcid, [])
+    shuffled_bids = e.shuffled_bids_p.setdefault(pbcid, [])
+    seed = str(e.audit_seed)+","+pbcid
+    for j in lazy_order(n, seed, len(indices), min(k, n)):
+        indices.append(j+1)
+        shuffled_bids.append(bids[j])
+
+
+def incremental(e):
+    """
+    Return True if audit orders are extended and written stage by stage,
+    as planned (by extend_audit_orders), rather than all at once.
+    """
+
+    return e.audit_order_mode == "lazy" or e.audit_order_chunk_size > 0
+
+
+def ensure_audit_order(e, pbcid, k):
+    """
+    Make sure that (at least) the first k ballots of the audit order for
+    pbcid have been computed (all of it, unless in lazy mode).
+    """
+
+    if e.audit_order_mode == "lazy" or e.consistent_sampling:
+        extend_audit_order(e, pbcid, k)
+    elif pbcid not in e.shuffled_bids_p:
+        compute_audit_order(e, pbcid)
+
+
+def extend_audit_orders(e, plan_p):
+    """
+    Extend lazy audit orders to planned sample sizes plan_p (pbcid->int),
+    and write them, if any grew (or, with chunked output, write the chunks
+    covering the planned samples that have not been written yet).
+    """
+
+    for pbcid in e.pbcids:
+        k = int(plan_p[pbcid])
+        if e.consistent_sampling:
+            # sample is not a prefix of the order; cover its last ballot
+            k = consistent_sampling.order_prefix_size(e, e.plan_tcp[e.stage_time], pbcid)
+        if e.audit_order_chunk_size > 0:
+            if e.write_outputs:
+                write_audit_order_chunks(e, pbcid, k)
+            continue
+        old_k = len(e.shuffled_indices_p.get(pbcid, []))
+        extend_audit_order(e, pbcid, k)
+        if len(e.shuffled_indices_p[pbcid]) > old_k and e.write_outputs:
+            write_audit_order(e, pbcid)
+
+
 def write_audit_orders(e):
 
     for pbcid in e.pbcids:
-        write_audit_order(e, pbcid)
+        if e.audit_order_chunk_size > 0:
+            write_audit_order_chunks(e, pbcid, int(e.max_audit_rate_p[pbcid]))
+        else:
+            write_audit_order(e, pbcid)
         
 
-def write_audit_order(e, pbcid):
+AUDIT_ORDER_FIELDNAMES = ["Ballot order",
+                          "Collection",
+                          "Box",
+                          "Position",
+                          "Stamp",
+                          "Ballot id",
+                          "Comments"]
+
 
-    dirpath = os.path.join(OpenAuditTool.ELECTIONS_ROOT, e.election_dirname,
+def audit_order_rows(e, pbcid, start, stop):
+    """
+    Return list of audit-order file rows for positions start <= i < stop
+    of audit order for pbcid.
+    """
+
+    bids = e.shuffled_bids_p[pbcid][start:stop]
+    boxid_b = e.boxid_pb[pbcid]
+    position_b = e.position_pb[pbcid]
+    stamp_b = e.stamp_pb[pbcid]
+    comments_b = e.comments_pb[pbcid]
+    # trailing "" keeps the final comma of the original file format
+    return [[i, pbcid, boxid_b[bid], position_b[bid], stamp_b[bid], bid, comments_b[bid], ""]
+            for i, bid in enumerate(bids, start)]
+
+
+def write_audit_order_file(filename, rows):
+    """ Write audit-order file filename, with given rows. """
+
+    with open(filename, "w", newline="") as file:
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow(AUDIT_ORDER_FIELDNAMES)
+        writer.writerows(rows)
+
+
+def audit_orders_dirpath(e):
+    """ Return pathname of directory 3-audit/32-audit-orders for e (creating it). """
+
+    dirpath = os.path.join(e.ctx.elections_root, e.election_dirname,
                            "3-audit", "32-audit-orders")
     os.makedirs(dirpath, exist_ok=True)
+    return dirpath
+
+
+def write_audit_order(e, pbcid):
+    """
+    Write audit order for pbcid (in lazy mode, just the prefix computed
+    so far) to 3-audit/32-audit-orders/audit-order-PBCID-DATETIME.csv
+    """
+
+    dirpath = audit_orders_dirpath(e)
     ds = utils.datetime_string()
     safe_pbcid = ids.filename_safe(pbcid)
     filename = os.path.join(dirpath, "audit-order-"+safe_pbcid+"-"+ds+".csv")
-    with open(filename, "w") as file:
-        fieldnames = ["Ballot order",
-                      "Collection",
-                      "Box",
-                      "Position",
-                      "Stamp",
-                      "Ballot id",
-                      "Comments"]
-        file.write(",".join(fieldnames))
-        file.write("\n")
-        for i, index in enumerate(e.shuffled_indices_p[pbcid]):
-            bid = e.shuffled_bids_p[pbcid][i]
-            file.write("{},".format(i))
-            file.write("{},".format(pbcid))
-            file.write("{},".format(e.boxid_pb[pbcid][bid]))
-            file.write("{},".format(e.position_pb[pbcid][bid]))
-            file.write("{},".format(e.stamp_pb[pbcid][bid]))
-            file.write("{},".format(bid))
-            file.write("{},".format(e.comments_pb[pbcid][bid]))
-            file.write("\n")
+    write_audit_order_file(filename,
+                           audit_order_rows(e, pbcid, 0, len(e.shuffled_bids_p[pbcid])))
+    utils.invalidate_dir_index(e.ctx, dirpath)
+
+
+def write_audit_order_chunks(e, pbcid, k):
+    """
+    Write those chunks of the audit order for pbcid that cover its first
+    k ballots and have not been written yet, computing as much of the
+    audit order as they need, to
+        3-audit/32-audit-orders/audit-order-PBCID-chunk-NNNNNN.csv
+    Chunk j holds positions j*size <= i < (j+1)*size of the audit order,
+    where size is e.audit_order_chunk_size.
+    """
+
+    size = e.audit_order_chunk_size
+    num_chunks = -(-k // size)
+    ensure_audit_order(e, pbcid, num_chunks * size)
+    n = len(e.shuffled_bids_p[pbcid])
+    written = e.audit_order_chunks_p.setdefault(pbcid, set())
+    safe_pbcid = ids.filename_safe(pbcid)
+    dirpath = None
+    for j in range(min(num_chunks, -(-n // size))):
+        if j in written:
+            continue
+        if dirpath is None:
+            dirpath = audit_orders_dirpath(e)
+        filename = os.path.join(dirpath,
+                                "audit-order-{}-chunk-{:06d}.csv".format(safe_pbcid, j))
+        write_audit_order_file(filename,
+                               audit_order_rows(e, pbcid, j*size, (j+1)*size))
+        written.add(j)
+    if dirpath is not None:
+        utils.invalidate_dir_index(e.ctx, dirpath)
 
 
 def test_audit_orders():
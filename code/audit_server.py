@@ -0,0 +1,199 @@
+# audit_server.py
+# python3
+
+"""
+Routines to work with OpenAuditTool.py on post-election audits.
+Long-lived audit service.
+
+Normally each audit stage is a fresh run of OpenAuditTool.py, which
+re-reads the election spec, ballot manifests, and reported CVRs before
+doing any auditing.  With --serve, OpenAuditTool.py instead reads all
+of these once, keeps the Election (and everything derived from it,
+including the random state) in memory, and then answers commands sent
+to a local HTTP endpoint (http://127.0.0.1:PORT/...):
+
+    POST /ingest     read newly-appended audited votes
+    POST /stage      ingest audited votes and run one audit stage
+                     (computing statuses, then a plan for the next stage)
+    GET  /plan       plan (sample size wanted, by pbcid) for next stage
+                     (and, if computed with a time budget, whether it converged)
+    GET  /status     current stage time, risks, statuses, and sample sizes
+    POST /shutdown   stop the server
+
+Responses are json.  Commands are handled one at a time, in the order
+received.  The server only listens on the loopback interface.
+"""
+
+import http.server
+import json
+import logging
+
+import audit
+import audit_orders
+import election_spec
+import pull_lists
+import reported
+import saved_state
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_PORT = 8537
+
+
+##############################################################################
+# Commands
+#
+# Each command takes the Election e and returns a json-able dict.
+
+
+def ingest(e):
+    """ Read audited votes appended since last ingest. """
+
+    audit.read_audited_votes(e)
+    return {"audited_p": {pbcid: count_audited(e, pbcid)
+                          for pbcid in e.pbcids}}
+
+
+def count_audited(e, pbcid):
+    """ Return number of ballots in pbcid with some audited vote. """
+
+    bids = set()
+    for cid in e.av_cpb:
+        bids.update(e.av_cpb[cid].get(pbcid, {}))
+    return len(bids)
+
+
+def stage(e):
+    """
+    Run one audit stage (using all audited votes ingested so far,
+    and any newly appended), and plan the next one.
+    """
+
+    stage_time = audit.next_stage_time(e)
+    if stage_time > e.max_stage_time:
+        return dict(status(e), error="max stage time reached")
+
+    audit.audit_stage(e, stage_time)
+    if not audit.stop_audit(e):
+        audit.plan_next_stage(e)
+        saved_state.write_intermediate_saved_state(e)
+    return status(e)
+
+
+def plan(e):
+    """ Return plan for next stage. """
+
+    if e.stage_time not in e.plan_tp:
+        return {"stage_time": e.stage_time, "plan_p": None}
+    result = {"stage_time": e.stage_time,
+              "plan_p": e.plan_tp[e.stage_time]}
+    if e.consistent_sampling:
+        result["plan_cp"] = e.plan_tcp[e.stage_time]
+    if e.stage_time in e.plan_converged_t:
+        result["converged"] = e.plan_converged_t[e.stage_time]
+    return result
+
+
+def status(e):
+    """ Return status of audit, as of last stage run. """
+
+    if e.stage_time not in e.status_tm:
+        return {"stage_time": e.stage_time, "stopped": False}
+    return {"stage_time": e.stage_time,
+            "risk_m": e.risk_tm[e.stage_time],
+            "status_m": e.status_tm[e.stage_time],
+            "election_status": e.election_status_t[e.stage_time],
+            "sn_p": e.sn_tp[e.stage_time],
+            "stopped": audit.stop_audit(e)}
+
+
+COMMANDS = {("POST", "/ingest"): ingest,
+            ("POST", "/stage"): stage,
+            ("GET", "/plan"): plan,
+            ("GET", "/status"): status}
+
+
+def run_command(e, method, path):
+    """
+    Run command for given http method and path.
+    Return (http status code, json-able response dict).
+    """
+
+    command = COMMANDS.get((method, path.rstrip("/") or "/"))
+    if command is None:
+        return 404, {"error": "no such command: {} {}".format(method, path)}
+    try:
+        return 200, command(e)
+    except Exception as exc:
+        logger.exception("Command %s %s failed.", method, path)
+        return 500, {"error": "{}: {}".format(type(exc).__name__, exc)}
+
+
+##############################################################################
+# Server
+
+
+class AuditRequestHandler(http.server.BaseHTTPRequestHandler):
+    """ Handle one request to the audit server (self.server.e is the Election). """
+
+    def do_GET(self):
+        self.respond(*run_command(self.server.e, "GET", self.path))
+
+    def do_POST(self):
+        # discard any request body; commands take no arguments
+        length = int(self.headers.get("Content-Length", 0))
+        if length > 0:
+            self.rfile.read(length)
+        if self.path.rstrip("/") == "/shutdown":
+            self.server.stopping = True
+            self.respond(200, {"stopping": True})
+            return
+        self.respond(*run_command(self.server.e, "POST", self.path))
+
+    def respond(self, code, response):
+        body = json.dumps(response, indent=2).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.info("audit_server: " + format, *args)
+
+
+def start(e, args):
+    """
+    Read election, reported data, and audit spec; set up saved state
+    and the initial audited votes, as for an audit.
+    """
+
+    election_spec.read_election_spec(e)
+    reported.read_reported(e)
+    audit.read_audit_spec(e, args)
+    audit.initialize_audit(e)
+    saved_state.write_initial_saved_state(e)
+    audit.show_audit_spec(e)
+    if audit_orders.incremental(e):
+        audit_orders.extend_audit_orders(e, e.max_audit_rate_p)
+    if e.pull_lists and e.write_outputs:
+        pull_lists.write_pull_lists(e)
+    audit.read_audited_votes(e)
+
+
+def serve(e, args, port=DEFAULT_PORT):
+    """ Load election e, then answer commands on 127.0.0.1:port until shut down. """
+
+    start(e, args)
+    server = http.server.HTTPServer(("127.0.0.1", port), AuditRequestHandler)
+    server.e = e
+    server.stopping = False
+    logger.info("Audit server for %s listening on http://127.0.0.1:%d/",
+                e.election_dirname, server.server_address[1])
+    try:
+        while not server.stopping:
+            server.handle_request()
+    finally:
+        server.server_close()
@@ -0,0 +1,246 @@
+# audit_watch.py
+# python3
+
+"""
+Routines to work with OpenAuditTool.py on post-election audits.
+Watch mode: recompute risks as audited ballots arrive.
+
+Rather than waiting for someone to run the next audit stage, with
+--watch OpenAuditTool.py polls the 3-audit/33-audited-votes directory,
+and whenever Collection Managers have added audited-vote rows it runs
+a new (small) stage:
+
+    - only the newly appended rows are read (audit.read_audited_votes);
+    - the sample for each collection is the longest prefix of its
+      ballots (in e.bids_p order, as in audit.draw_sample) that have
+      all been audited (with consistent sampling, the sample for each
+      contest and collection is the longest audited prefix of its
+      ballots in priority order); these prefixes only grow, so each
+      is extended from where it ended at the previous stage, and only
+      for collections with new rows;
+    - risks are recomputed only for the measurements whose contests
+      have new sample tallies (a row for one contest may fill a gap,
+      extending the sample of its whole collection, and so change the
+      tallies of other contests too); other measurements keep their
+      risks from the previous stage;
+    - statuses are computed, and the status files in
+      3-audit/34-audit-output are written, as for any stage.
+
+Rows often arrive in bursts, so once a change is seen we wait until
+the directory has been quiet for e.watch_debounce seconds before
+reading it -- but never so long that the new statuses would come out
+later than e.watch_latency_target seconds after the change was first
+seen.  (A warning is logged when a stage nonetheless misses that
+target.)  Watching stops when no Active measurement is still Open.
+"""
+
+import logging
+import os
+import time
+
+import audit
+import consistent_sampling
+import election_spec
+import reported
+import risk_bayes
+import saved_state
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def audited_votes_dirpath(e):
+    """ Return pathname of directory 3-audit/33-audited-votes for e. """
+
+    return os.path.join(e.ctx.elections_root,
+                        e.election_dirname,
+                        "3-audit",
+                        "33-audited-votes")
+
+
+def directory_signature(dirpath):
+    """
+    Return hashable signature of (the csv files in) directory dirpath;
+    it changes when a file is added, removed, or modified.
+    """
+
+    signature = []
+    with os.scandir(dirpath) as it:
+        for entry in it:
+            if entry.name.endswith(".csv") and entry.is_file():
+                st = entry.stat()
+                signature.append((entry.name, st.st_ino, st.st_size, st.st_mtime_ns))
+    return tuple(sorted(signature))
+
+
+def audited_prefix_size(e, pbcid):
+    """
+    Return number of initial ballots of e.bids_p[pbcid] that have an
+    audited vote (for some contest).
+
+    Audited votes are never removed from e.av_cpb, so the prefix only
+    grows; the scan resumes where the previous one (recorded in
+    e.audited_prefix_p) stopped.
+    """
+
+    av_b_list = [e.av_cpb[cid][pbcid] for cid in e.av_cpb
+                 if pbcid in e.av_cpb[cid]]
+    bids = e.bids_p[pbcid]
+    n = e.audited_prefix_p.get(pbcid, 0)
+    while n < len(bids) and any(bids[n] in av_b for av_b in av_b_list):
+        n += 1
+    e.audited_prefix_p[pbcid] = n
+    return n
+
+
+def audited_prefix_sizes_cp(e, changed_cp=None):
+    """
+    With consistent sampling, return number (cid->pbcid->int) of initial
+    ballots of consistent_sampling.contest_bids(e, cid, pbcid) that have
+    an audited vote for cid.
+
+    As for audited_prefix_size, each scan resumes where the previous one
+    (recorded in e.audited_prefix_cp) stopped.  If changed_cp (a set of
+    (cid, pbcid) pairs, as returned by audit.read_audited_votes) is
+    given, only those pairs are scanned.
+    """
+
+    sizes_cp = {}
+    for cid in e.cids:
+        sizes_cp[cid] = {}
+        prefix_p = e.audited_prefix_cp.setdefault(cid, {})
+        for pbcid in e.possible_pbcid_c[cid]:
+            n = prefix_p.get(pbcid, 0)
+            if changed_cp is None or (cid, pbcid) in changed_cp:
+                av_b = e.av_cpb.get(cid, {}).get(pbcid, {})
+                bids = consistent_sampling.contest_bids(e, cid, pbcid)
+                while n < len(bids) and bids[n] in av_b:
+                    n += 1
+                prefix_p[pbcid] = n
+            sizes_cp[cid][pbcid] = n
+    return sizes_cp
+
+
+def affected_mids(e, previous_stage_time):
+    """
+    Return list of measurements whose contests have sample tallies (in
+    e.sn_tcpra) for the current stage that differ from those for stage
+    previous_stage_time.
+    """
+
+    previous_tcpra = e.sn_tcpra.get(previous_stage_time, {})
+    changed_cids = set(cid for cid in e.sn_tcpra[e.stage_time]
+                       if e.sn_tcpra[e.stage_time][cid] != previous_tcpra.get(cid))
+    return [mid for mid in e.mids if e.cid_m[mid] in changed_cids]
+
+
+def watch_stage(e, changed_cp=None):
+    """
+    Run a watch-mode stage, after new audited votes were read.
+    If given, changed_cp is the set of (cid, pbcid) pairs with new
+    audited votes (as returned by audit.read_audited_votes); the audited
+    prefixes of other collections are not rescanned.
+    Return False (without running it) if past the maximum stage time.
+    """
+
+    previous_stage_time = e.stage_time
+    stage_time = audit.next_stage_time(e)
+    if stage_time > e.max_stage_time:
+        return False
+    e.stage_time = stage_time
+
+    saved_state.read_saved_state(e)
+    e.status_tm[stage_time] = {}
+    e.risk_tm[stage_time] = {}
+    e.sn_tcpra[stage_time] = {}
+
+    if e.consistent_sampling:
+        audit.draw_sample(e, sample_size_cp=audited_prefix_sizes_cp(e, changed_cp))
+    else:
+        changed_pbcids = None if changed_cp is None \
+                         else set(pbcid for (cid, pbcid) in changed_cp)
+        sample_size_p = {}
+        for pbcid in e.pbcids:
+            if changed_pbcids is None or pbcid in changed_pbcids \
+               or pbcid not in e.audited_prefix_p:
+                sample_size_p[pbcid] = audited_prefix_size(e, pbcid)
+            else:
+                sample_size_p[pbcid] = e.audited_prefix_p[pbcid]
+        audit.draw_sample(e, sample_size_p)
+
+    mids = affected_mids(e, previous_stage_time)
+    for mid in e.mids:
+        if mid in mids or mid not in e.risk_tm.get(previous_stage_time, {}):
+            risk_bayes.compute_risk(e, mid, e.sn_tcpra)
+        else:
+            e.risk_tm[stage_time][mid] = e.risk_tm[previous_stage_time][mid]
+    audit.compute_statuses(e)
+
+    if e.write_outputs:
+        audit.write_audit_output_contest_status(e)
+        audit.write_audit_output_collection_status(e)
+    e.plan_tp[stage_time] = e.sn_tp[stage_time].copy()
+    if e.consistent_sampling:
+        e.plan_tcp[stage_time] = e.sn_tcp[stage_time]
+    saved_state.write_intermediate_saved_state(e)
+
+    audit.show_audit_stage_header(e)
+    audit.show_risks_and_statuses(e)
+    return True
+
+
+def wait_for_quiet(e, dirpath, signature, first_seen):
+    """
+    Wait until directory dirpath has been unchanged for e.watch_debounce
+    seconds, or the latency target (measured from time first_seen) would
+    otherwise be at risk.  Return latest signature.
+    """
+
+    # leave half of the latency target for reading and computing
+    deadline = first_seen + e.watch_latency_target / 2
+    quiet_since = time.time()
+    while True:
+        now = time.time()
+        if now - quiet_since >= e.watch_debounce or now >= deadline:
+            return signature
+        time.sleep(min(e.watch_poll_interval, e.watch_debounce))
+        new_signature = directory_signature(dirpath)
+        if new_signature != signature:
+            signature = new_signature
+            quiet_since = time.time()
+
+
+def watch(e, args):
+    """
+    Run audit in watch mode, until no Active measurement is Open
+    (or the maximum stage time is reached).
+    """
+
+    election_spec.read_election_spec(e)
+    reported.read_reported(e)
+    audit.read_audit_spec(e, args)
+    audit.initialize_audit(e)
+    saved_state.write_initial_saved_state(e)
+    audit.show_audit_spec(e)
+
+    logger.info("====== Audit (watch mode) ======")
+
+    dirpath = audited_votes_dirpath(e)
+    signature = None
+    while True:
+        new_signature = directory_signature(dirpath)
+        if new_signature != signature:
+            first_seen = time.time()
+            signature = wait_for_quiet(e, dirpath, new_signature, first_seen)
+            changed_cp = audit.read_audited_votes(e, growing=True)
+            if len(changed_cp) > 0:
+                if not watch_stage(e, changed_cp):
+                    break
+                latency = time.time() - first_seen
+                if latency > e.watch_latency_target:
+                    logger.warning("Watch stage took %.1f seconds (latency target %.1f).",
+                                   latency, e.watch_latency_target)
+                if audit.stop_audit(e):
+                    break
+        time.sleep(e.watch_poll_interval)
+    audit.show_audit_summary(e)
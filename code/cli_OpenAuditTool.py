@@ -11,7 +11,12 @@ Command-line parser and dispatch for OpenAuditTool.py
 import argparse
 import logging
 
+import asn
 import audit_orders
+import audit_server
+import audit_watch
+import cvr_store
+import election_db
 import OpenAuditTool
 import election_spec
 import ids
@@ -50,6 +55,21 @@ def parse_args():
                               "auditing (arbitrary nonnegative integer)."
                               "(If omitted, sets from file, else clock.)"))
 
+    parser.add_argument("--sqlite_db",
+                        help=("Pathname of an SQLite election database to hold "
+                              "per-ballot data (manifests, reported and audited "
+                              "votes) instead of memory; \":memory:\" for a private "
+                              "in-memory database.  (If omitted, data is held in memory.)"),
+                        default=None)
+
+    parser.add_argument("--num_workers",
+                        help=("Number of worker processes used to read ballot manifests "
+                              "and reported CVRs, one collection per task, to simulate "
+                              "audits (--asn), and to measure risks and plan, one "
+                              "measurement or contest per task, most costly first.  "
+                              "(Default 1: do these sequentially.)"),
+                        default=1)
+
     parser.add_argument("--read_election_spec",
                         action="store_true",
                         help="Read and check election spec.")
@@ -59,10 +79,39 @@ def parse_args():
                         help="Read and check reported election data and results.")
 
 
+    parser.add_argument("--make_cvr_store",
+                        action="store_true",
+                        help=("Convert reported CVR files into a binary CVR store (cache),"
+                              " used by later reads of reported data."))
+
     parser.add_argument("--make_audit_orders",
                         action="store_true",
                         help="Make audit orders files.")
 
+    parser.add_argument("--audit_order_mode",
+                        help=("How audit orders are computed: \"shuffle\" (full Fisher-Yates "
+                              "shuffle of each collection) or \"lazy\" (only as much of a "
+                              "pseudorandom order as the audit needs, extended at each stage)."),
+                        choices=["shuffle", "lazy"],
+                        default="shuffle")
+
+    parser.add_argument("--audit_order_chunk_size",
+                        help=("If positive, write audit orders in numbered chunk files of this "
+                              "many ballots, only as far as each stage's plan needs them "
+                              "(default 0: one file per collection)."),
+                        default=0)
+
+    parser.add_argument("--pull_lists",
+                        action="store_true",
+                        help=("Write, for each stage, pull lists of the ballots selected, "
+                              "grouped by box and sorted by position."))
+
+    parser.add_argument("--consistent_sampling",
+                        action="store_true",
+                        help=("Sample each contest from just the ballots that may contain it, "
+                              "using persistent per-ballot priorities, so that contests "
+                              "share sampled ballots (not with --sqlite_db)."))
+
     parser.add_argument("--read_audited",
                         action="store_true",
                         help="Read and check audited votes.")
@@ -71,10 +120,72 @@ def parse_args():
                         action="store_true",
                         help="Run audit based on current info.")
 
+    parser.add_argument("--serve",
+                        action="store_true",
+                        help=("Run audit server: read election once, then answer commands "
+                              "(ingest, stage, plan, status) on http://127.0.0.1:PORT/."))
+
+    parser.add_argument("--port",
+                        help="Port for --serve (default {}).".format(audit_server.DEFAULT_PORT),
+                        default=audit_server.DEFAULT_PORT)
+
+    parser.add_argument("--watch",
+                        action="store_true",
+                        help=("Run audit in watch mode: recompute risks and statuses "
+                              "whenever new audited votes appear."))
+
+    parser.add_argument("--poll_interval",
+                        help="With --watch, seconds between polls for new audited votes.",
+                        default=1.0)
+
+    parser.add_argument("--debounce",
+                        help=("With --watch, seconds without further changes to wait for "
+                              "before reading new audited votes."),
+                        default=2.0)
+
+    parser.add_argument("--latency_target",
+                        help=("With --watch, target seconds from new audited votes "
+                              "to updated statuses."),
+                        default=10.0)
+
+    parser.add_argument("--asn",
+                        action="store_true",
+                        help=("Before the audit: simulate it many times, from the reported "
+                              "data and an assumed error rate, and report the distribution "
+                              "of ballots sampled per collection and stages per measurement "
+                              "(see asn.py)."))
+
+    parser.add_argument("--asn_audits",
+                        help="With --asn, number of audits to simulate.",
+                        default=1000)
+
+    parser.add_argument("--asn_error_rate",
+                        help=("With --asn, assumed chance that a ballot's actual vote "
+                              "differs from its reported vote."),
+                        default=0.0)
+
+    parser.add_argument("--asn_trials",
+                        help="With --asn, number of trials per simulated risk measurement.",
+                        default=100)
+
+    parser.add_argument("--asn_max_stages",
+                        help="With --asn, maximum number of stages per simulated audit.",
+                        default=20)
+
     parser.add_argument("--pause",
                         action="store_true",
                         help="Pause after each audit stage to obtain confirmation before proceedings.")
 
+    parser.add_argument("--simulate",
+                        action="store_true",
+                        help=("Simulate audit: use logical stage times, don't wait between "
+                              "stages, and keep saved state in memory.  Status and saved-state "
+                              "files are not written unless --write_outputs is also given."))
+
+    parser.add_argument("--write_outputs",
+                        action="store_true",
+                        help="With --simulate, still write status and saved-state files.")
+
     parser.add_argument("--sample_by_size",
                         help="If true, then use sampling schemes, which use varying sample sizes on each"
                         " county, based on Dirichlet-Multinomial simulations.",
@@ -103,6 +214,27 @@ def parse_args():
                         "to extend next. Choices are round_robin, random_naive, or random_min_var.",
                         default="round_robin")
 
+    parser.add_argument("--plan_engine",
+                        help="With --sample_by_size or --use_discrete_rm, how the planner "
+                        "simulates: \"scalar\" (one iteration or trial at a time, on dicts) or "
+                        "\"array\" (many at once, on numpy arrays, with common random numbers "
+                        "for Robbins-Monro finite differences; faster).",
+                        choices=["scalar", "array"],
+                        default="scalar")
+
+    parser.add_argument("--plan_time_budget",
+                        help="With --sample_by_size or --use_discrete_rm, seconds allowed for "
+                        "planning each stage (0 for no limit); when they run out, the plan "
+                        "refined so far is used, and reported as not converged.",
+                        default=0.0)
+
+    parser.add_argument("--joint_allocation",
+                        help="Plan the next stage's sample-size increments for all collections "
+                        "together, greedily, to maximize the projected progress of Open "
+                        "measurements toward passing per ballot examined (see allocation.py). "
+                        "Not used with --consistent_sampling.",
+                        action="store_true")
+
     args = parser.parse_args()
     return args
 
@@ -117,8 +249,31 @@ def dispatch(e, args):
     e.sample_by_size = args.sample_by_size
     e.use_discrete_rm = args.use_discrete_rm
     e.pick_county_func = args.pick_county_func
-
-    OpenAuditTool.ELECTIONS_ROOT = args.elections_root
+    e.plan_engine = args.plan_engine
+    e.plan_time_budget = float(args.plan_time_budget)
+    e.joint_allocation = args.joint_allocation
+    e.asn_audits = int(args.asn_audits)
+    e.asn_error_rate = float(args.asn_error_rate)
+    e.asn_trials = int(args.asn_trials)
+    e.asn_max_stages = int(args.asn_max_stages)
+    e.num_workers = int(args.num_workers)
+    e.simulate = args.simulate
+    e.audit_order_mode = args.audit_order_mode
+    e.audit_order_chunk_size = int(args.audit_order_chunk_size)
+    e.consistent_sampling = args.consistent_sampling
+    e.pull_lists = args.pull_lists
+    e.watch_poll_interval = float(args.poll_interval)
+    e.watch_debounce = float(args.debounce)
+    e.watch_latency_target = float(args.latency_target)
+    e.write_outputs = args.write_outputs or not args.simulate
+
+    e.ctx.elections_root = args.elections_root
+
+    if args.sqlite_db != None:
+        if e.consistent_sampling:
+            logger.warning("--consistent_sampling ignored, since it needs in-memory ballot data.")
+            e.consistent_sampling = False
+        election_db.open_election_db(e, args.sqlite_db)
 
     if args.set_audit_seed != None:
         audit.set_audit_seed(e, args.set_audit_seed)
@@ -132,9 +287,18 @@ def dispatch(e, args):
         election_spec.read_election_spec(e)
         reported.read_reported(e)
 
+    elif args.make_cvr_store:
+        logger.info("make_cvr_store")
+        election_spec.read_election_spec(e)
+        cvr_store.write_cvr_stores(e)
+
     elif args.make_audit_orders:
         logger.info("make_audit_orders")
+        election_spec.read_election_spec(e)
+        reported.read_reported(e)
+        audit.read_audit_spec(e, args)
         audit_orders.compute_audit_orders(e)
+        audit_orders.write_audit_orders(e)
 
     elif args.read_audited:
         logger.info("read_audited--NO-OP-TBD")
@@ -144,5 +308,17 @@ def dispatch(e, args):
         reported.read_reported(e)
         audit.audit(e, args)
 
+    elif args.serve:
+        audit_server.serve(e, args, int(args.port))
+
+    elif args.watch:
+        audit_watch.watch(e, args)
+
+    elif args.asn:
+        election_spec.read_election_spec(e)
+        reported.read_reported(e)
+        audit.read_audit_spec(e, args)
+        asn.asn(e)
+
 
 
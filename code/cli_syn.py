@@ -11,6 +11,7 @@ import OpenAuditTool
 import syn1
 import syn2
 import syn3
+import utils
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -53,7 +54,7 @@ def dispatch(e, args):
     e.election_dirname = ids.filename_safe(args.election_dirname)
     e.election_name = e.election_dirname
 
-    dirpath = os.path.join(OpenAuditTool.ELECTIONS_ROOT, e.election_dirname)
+    dirpath = os.path.join(e.ctx.elections_root, e.election_dirname)
 
     if os.path.exists(dirpath):
         warnings.warn("Erasing previous contents of directory {}."
@@ -66,6 +67,7 @@ def dispatch(e, args):
             if os.path.exists(dirpathx):
                 shutil.rmtree(dirpathx)
                 warnings.warn("Directory {} erased.".format(dirpathx))
+        utils.invalidate_dir_index(e.ctx)
 
     if args.syn_type == '1':
         syn1.generate_syn_type_1(e, args)
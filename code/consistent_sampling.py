@@ -0,0 +1,225 @@
+# consistent_sampling.py
+# python3
+
+"""
+Routines to work with OpenAuditTool.py on post-election audits.
+Consistent sampling across contests.
+
+Normally each collection has a single audit order, and a stage's
+sample in a collection is the first e.sn_tp[stage_time][pbcid] ballots
+of it, whatever contests they contain.  A contest that appears on only
+some of the collection's ballots (e.g. a small-district contest) then
+pays for retrieving ballots that say nothing about it.
+
+With consistent sampling (--consistent_sampling), every ballot gets a
+persistent pseudorandom priority, derived from the audit seed, the
+pbcid and the ballot id:
+
+    priority = first 8 bytes (big-endian) of SHA-256("SEED,PBCID,BID")
+
+and the sample for contest cid in collection pbcid is the
+e.sn_tcp[stage_time][cid][pbcid] ballots of lowest priority among
+those that may contain cid (according to the manifest's required and
+possible contest groups, e.required_gid_pb and e.possible_gid_pb).
+Since all contests use the same priorities, their samples overlap as
+much as possible: the ballots actually pulled in pbcid are the union of
+the contests' samples, and e.sn_tp[stage_time][pbcid] is its size.
+
+The planner (planner.compute_plan_tcp) then plans a sample size for
+each contest and collection, in e.plan_tcp, rather than for each
+collection.  The audit order of a collection (audit_orders.py) is its
+ballots in priority order.
+
+Consistent sampling works on the in-memory per-ballot data (e.bids_p
+etc.), so it can't be used with an election database (--sqlite_db).
+"""
+
+import hashlib
+
+
+def priority(e, pbcid, bid):
+    """ Return pseudorandom (64-bit integer) priority of ballot bid in pbcid. """
+
+    s = str(e.audit_seed)+","+pbcid+","+bid
+    digest = hashlib.sha256(s.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def priority_bids(e, pbcid):
+    """
+    Return list of ballot ids of pbcid in priority order (lowest first),
+    computing it (once) into e.priority_bids_p[pbcid].
+    """
+
+    if pbcid not in e.priority_bids_p:
+        # sort is stable, so (improbable) ties keep manifest order
+        e.priority_bids_p[pbcid] = sorted(e.bids_p[pbcid],
+                                          key=lambda bid: priority(e, pbcid, bid))
+    return e.priority_bids_p[pbcid]
+
+
+def ballot_may_contain(e, cid, pbcid, bid):
+    """
+    Return True if ballot bid of pbcid may contain contest cid,
+    according to its required and possible contest groups.
+
+    As for collections (election_spec.py), a possible gid of "" means
+    every contest is possible.  A ballot with no contest groups given in
+    the manifest may contain whatever its collection may contain.
+    """
+
+    req_gid = e.required_gid_pb.get(pbcid, {}).get(bid, "")
+    poss_gid = e.possible_gid_pb.get(pbcid, {}).get(bid, "")
+    if req_gid == "" and poss_gid == "":
+        return cid in e.possible_cid_p[pbcid]
+    return poss_gid == "" \
+        or cid in e.cids_g[poss_gid] \
+        or (req_gid != "" and cid in e.cids_g[req_gid])
+
+
+def contest_bids(e, cid, pbcid):
+    """
+    Return list of ballot ids of pbcid that may contain cid, in priority
+    order, computing it (once) into e.contest_bids_cp[cid][pbcid].
+    """
+
+    bids_c = e.contest_bids_cp.setdefault(cid, {})
+    if pbcid not in bids_c:
+        bids_c[pbcid] = [bid for bid in priority_bids(e, pbcid)
+                         if ballot_may_contain(e, cid, pbcid, bid)]
+    return bids_c[pbcid]
+
+
+def priority_ordinals(e, pbcid):
+    """
+    Return dict giving the (first) position of each bid of pbcid in
+    priority order (its place in the audit order), computing it (once)
+    into e.priority_ordinal_pb[pbcid].
+    """
+
+    if pbcid not in e.priority_ordinal_pb:
+        ordinal_b = {}
+        for i, bid in enumerate(priority_bids(e, pbcid)):
+            ordinal_b.setdefault(bid, i)
+        e.priority_ordinal_pb[pbcid] = ordinal_b
+    return e.priority_ordinal_pb[pbcid]
+
+
+def contest_ordinals(e, cid, pbcid):
+    """
+    Return dict giving the (first) position of each bid in
+    contest_bids(e, cid, pbcid), computing it (once) into
+    e.contest_ordinal_cpb[cid][pbcid].
+    """
+
+    ordinal_p = e.contest_ordinal_cpb.setdefault(cid, {})
+    if pbcid not in ordinal_p:
+        ordinal_b = {}
+        for i, bid in enumerate(contest_bids(e, cid, pbcid)):
+            ordinal_b.setdefault(bid, i)
+        ordinal_p[pbcid] = ordinal_b
+    return ordinal_p[pbcid]
+
+
+def sampled_bids(e, sample_size_cp, pbcid):
+    """
+    Return set of ballot ids of pbcid in the union of the contest
+    samples given by sample_size_cp (cid->pbcid->int).
+    """
+
+    bids = set()
+    for cid in sample_size_cp:
+        if pbcid in sample_size_cp[cid]:
+            bids.update(contest_bids(e, cid, pbcid)[:int(sample_size_cp[cid][pbcid])])
+    return bids
+
+
+def extend_plan(e, sample_size_cp, cids):
+    """
+    Return contest sample sizes (cid->pbcid->int) extending sample_size_cp
+    (cid->pbcid->int) for the contests in cids, pulling (at most)
+    e.max_audit_rate_p[pbcid] more ballots from each collection pbcid.
+
+    The ballots pulled are the unpulled ballots of lowest priority that
+    may contain a contest in cids; each such contest's sample is then
+    extended through them (taking in, at no cost, any ballots on the way
+    that were already pulled for other contests).  Other contests keep
+    their sample sizes.
+    """
+
+    plan_cp = {cid: dict(sample_size_cp[cid]) for cid in sample_size_cp}
+    for pbcid in e.pbcids:
+        cids_p = [cid for cid in cids if pbcid in plan_cp.get(cid, {})]
+        if len(cids_p) == 0:
+            continue
+        pulled = sampled_bids(e, sample_size_cp, pbcid)
+        budget = int(e.max_audit_rate_p[pbcid])
+        seen_c = {cid: 0 for cid in cids_p}
+        for bid in priority_bids(e, pbcid):
+            if budget == 0:
+                break
+            containing = [cid for cid in cids_p
+                          if ballot_may_contain(e, cid, pbcid, bid)]
+            if len(containing) == 0:
+                continue
+            if bid not in pulled:
+                budget -= 1
+            for cid in containing:
+                seen_c[cid] += 1
+                plan_cp[cid][pbcid] = max(plan_cp[cid][pbcid], seen_c[cid])
+    return plan_cp
+
+
+def initial_plan_tcp(e):
+    """
+    Return contest sample sizes (cid->pbcid->int) for the first stage:
+    extend_plan from empty samples, for all contests.
+    """
+
+    sample_size_cp = {cid: {pbcid: 0 for pbcid in e.possible_pbcid_c[cid]}
+                      for cid in e.cids}
+    return extend_plan(e, sample_size_cp, e.cids)
+
+
+def plan_sizes_p(e, plan_cp):
+    """
+    Return number of ballots (pbcid->int) that would be pulled from each
+    collection for contest sample sizes plan_cp.
+    """
+
+    return {pbcid: len(sampled_bids(e, plan_cp, pbcid))
+            for pbcid in e.pbcids}
+
+
+def order_prefix_size(e, plan_cp, pbcid):
+    """
+    Return length of the shortest prefix of the priority order for pbcid
+    that includes all ballots of the contest samples given by plan_cp.
+    """
+
+    bids = sampled_bids(e, plan_cp, pbcid)
+    k = 0
+    for i, bid in enumerate(priority_bids(e, pbcid)):
+        if bid in bids:
+            k = i+1
+    return k
+
+
+def contest_exhausted(e, cid):
+    """ Return True if the current sample for cid includes all of its ballots. """
+
+    return all(e.sn_tcp[e.stage_time][cid][pbcid] == len(contest_bids(e, cid, pbcid))
+               for pbcid in e.possible_pbcid_c[cid])
+
+
+def compute_audit_order(e, pbcid):
+    """
+    Set audit order for pbcid (e.shuffled_indices_p[pbcid] and
+    e.shuffled_bids_p[pbcid]) to its ballots in priority order.
+    """
+
+    ordinal_b = {}
+    for i, bid in enumerate(e.bids_p[pbcid]):
+        ordinal_b.setdefault(bid, i+1)
+    e.shuffled_bids_p[pbcid] = list(priority_bids(e, pbcid))
+    e.shuffled_indices_p[pbcid] = [ordinal_b[bid] for bid in e.shuffled_bids_p[pbcid]]
@@ -40,6 +40,8 @@ becomes:
 """
 
 import csv
+import locale
+import os
 import warnings
 
 import ids
@@ -52,52 +54,166 @@ def read_csv_file(filename, required_fieldnames=None, varlen=False):
     with open(filename) as file:
         reader = csv.reader(file)
         rows = [row for row in reader]
-        fieldnames = rows[0]
+        fieldnames = clean_fieldnames(rows[0])
+        check_fieldnames(filename, fieldnames, required_fieldnames)
+        return row_dicts_from_rows(rows[1:], fieldnames, varlen)
+
+
+def clean_fieldnames(fieldnames):
+    """
+    Gather, clean, and trim field names from header row, eliminating blanks.
+    """
+
+    fieldnames = [ids.clean_id(fieldname) for fieldname in fieldnames]
+    while len(fieldnames)>0 and fieldnames[-1]=='':
+        fieldnames.pop()
+    if len(set(fieldnames)) != len(fieldnames):
+        raise ValueError("Duplicate field name: {}".format(fieldnames))
+    return fieldnames
+
+
+def check_fieldnames(filename, fieldnames, required_fieldnames):
+    """
+    Check that required fieldnames are present; warn about extra ones.
+    """
+
+    if required_fieldnames != None:
+        # check that all required fieldnames are present
+        required_fieldnames = [ids.clean_id(id) for id in required_fieldnames]
+        missing_fieldnames = set(required_fieldnames).difference(set(fieldnames))
+        if len(missing_fieldnames) > 0:
+            raise ValueError("File {} has fieldnames {}, while {} are required. Missing {}."
+                             .format(filename, fieldnames, required_fieldnames, missing_fieldnames))
+        # check to see if extra fieldnames present; warn user if so
+        extra_fieldnames = set(fieldnames).difference(set(required_fieldnames))
+        if len(extra_fieldnames) > 0:
+            warnings.warn("File {} has extra fieldnames (ignored): {}"
+                          .format(filename, extra_fieldnames))
+
+
+def row_dicts_from_rows(rows, fieldnames, varlen=False):
+    """
+    Return list of row dicts for data rows (lists of strings), given
+    cleaned fieldnames from the header row.
+    """
+
+    row_dicts = []
+    for row in rows:
+        row = ["" if item==None else ids.clean_id(item) for item in row]
+        while len(row)>0 and row[-1] == '':
+            row.pop()
+        if not varlen:
+            if len(row) > len(fieldnames):
+                warnings.warn("Ignoring extra values in row: {}".format(row))
+                row = row[:len(fieldnames)]
+            while len(row) < len(fieldnames):
+                row.append("")
+        row_dict = {}
+        for (fieldname, value) in zip(fieldnames, row):
+            row_dict[fieldname] = value
+        if varlen:
+            if len(row) < len(fieldnames)-1:
+                if len(row) > 0:
+                    warnings.warn("Ignoring too-short row: {}".format(row))
+                continue
+            last_fieldname = fieldnames[-1]
+            last_value = tuple(row[len(fieldnames)-1:])
+            row_dict[last_fieldname] = last_value
+        row_dicts.append(row_dict)
+    return row_dicts
+
+
+"""
+Incremental (tail) reading.
+
+Some files (e.g. the audited votes) only ever have rows appended to
+them while an audit is running.  read_csv_file_tail reads such a file
+a piece at a time: the caller keeps a small "tail state" dict for the
+file between calls, and each call returns only the rows appended since
+the previous call.  A last line without a newline is returned, but is
+not counted as read, so the next call reads it again.  While the file
+is still growing (growing=True, as in watch mode) such a line may be
+only partly written, so it is instead left unread (and undecoded)
+until its newline arrives.
+
+The tail state records the file's name, inode, size, and modification
+time, the byte offset reached, the header fieldnames, and the last few
+bytes before the offset.  If the file is a different file (new name or
+inode), has shrunk, or no longer has the same bytes just before the
+offset (i.e. it was rewritten rather than appended to), the whole file
+is read again from the beginning.
+"""
+
+TAIL_CHECK_BYTES = 256
+
+def read_csv_file_tail(filename, tail_state=None, required_fieldnames=None, varlen=False,
+                       growing=False):
+    """
+    Read rows appended to CSV file since the read that produced tail_state.
+
+    Return (row_dicts, tail_state, reread), where tail_state is the new
+    tail state to pass to the next call, and reread is True if the file
+    was read from the beginning (tail_state None, or file replaced or
+    rewritten), in which case row_dicts holds all of its rows.
+
+    If growing is True, an unterminated last line is not returned.
+    """
+
+    st = os.stat(filename)
+    reread = not tail_state_matches(filename, st, tail_state)
+    if not reread and st.st_size == tail_state["offset"] \
+       and st.st_mtime_ns == tail_state["mtime_ns"]:
+        return [], tail_state, False
+
+    offset = 0 if reread else tail_state["offset"]
+    with open(filename, "rb") as file:
+        if not reread:
+            check_start = max(0, offset - len(tail_state["check"]))
+            file.seek(check_start)
+            if file.read(offset - check_start) != tail_state["check"]:
+                # same file, but not just appended to
+                reread = True
+                offset = 0
+        file.seek(offset)
+        data = file.read()
+
+    # An unterminated last line is not counted as read, since it may
+    # still be being written; it is read again next time.  If the file
+    # is growing, it is not parsed (nor decoded) until it is finished.
+    end = data.rfind(b"\n") + 1
+    parsed = data[:end] if growing else data
+    lines = parsed.decode(locale.getpreferredencoding(False)).splitlines(keepends=True)
+    rows = [row for row in csv.reader(lines)]
+    if reread:
+        if len(rows) == 0:
+            return [], None, True
+        fieldnames = clean_fieldnames(rows[0])
+        check_fieldnames(filename, fieldnames, required_fieldnames)
         rows = rows[1:]
+        if end == 0:
+            # header line not yet complete; start over next time
+            return row_dicts_from_rows(rows, fieldnames, varlen), None, True
+    else:
+        fieldnames = tail_state["fieldnames"]
+    previous = b"" if reread else tail_state["check"]
+    check = (previous + data[:end])[-TAIL_CHECK_BYTES:]
+    tail_state = {"filename": filename,
+                  "inode": st.st_ino,
+                  "size": st.st_size,
+                  "mtime_ns": st.st_mtime_ns,
+                  "offset": offset + end,
+                  "fieldnames": fieldnames,
+                  "check": check}
+    return row_dicts_from_rows(rows, fieldnames, varlen), tail_state, reread
+
+
+def tail_state_matches(filename, st, tail_state):
+    """
+    Return True if tail_state is for file filename (with os.stat result st),
+    and the file is not shorter than the part of it already read.
+    """
 
-        # gather, clean, and trim field names, eliminating blanks
-        fieldnames = [ids.clean_id(fieldname) for fieldname in fieldnames]
-        while len(fieldnames)>0 and fieldnames[-1]=='':
-            fieldnames.pop()
-        if len(set(fieldnames)) != len(fieldnames):
-            raise ValueError("Duplicate field name: {}".format(fieldnames))
-
-        # data rows
-        row_dicts = []
-        for row in rows:
-            row = ["" if item==None else ids.clean_id(item) for item in row]
-            while len(row)>0 and row[-1] == '':
-                row.pop()
-            if not varlen:
-                if len(row) > len(fieldnames):
-                    warnings.warn("Ignoring extra values in row: {}".format(row))
-                    row = row[:len(fieldnames)]
-                while len(row) < len(fieldnames):
-                    row.append("")
-            row_dict = {}
-            for (fieldname, value) in zip(fieldnames, row):
-                row_dict[fieldname] = value
-            if varlen:
-                if len(row) < len(fieldnames)-1:
-                    if len(row) > 0:
-                        warnings.warn("Ignoring too-short row: {}".format(row))
-                    continue
-                last_fieldname = fieldnames[-1]
-                last_value = tuple(row[len(fieldnames)-1:])
-                row_dict[last_fieldname] = last_value
-            row_dicts.append(row_dict)
-        if required_fieldnames != None:
-            # check that all required fieldnames are present
-            required_fieldnames = [ids.clean_id(id) for id in required_fieldnames]
-            missing_fieldnames = set(required_fieldnames).difference(set(fieldnames))
-            if len(missing_fieldnames) > 0:
-                raise ValueError("File {} has fieldnames {}, while {} are required. Missing {}."
-                                 .format(filename, fieldnames, required_fieldnames, missing_fieldnames))
-            # check to see if extra fieldnames present; warn user if so
-            extra_fieldnames = set(fieldnames).difference(set(required_fieldnames))
-            if len(extra_fieldnames) > 0:
-                warnings.warn("File {} has extra fieldnames (ignored): {}"
-                              .format(filename, extra_fieldnames))
-        return row_dicts
-
-    
+    return tail_state is not None \
+        and tail_state["filename"] == filename \
+        and tail_state["inode"] == st.st_ino \
+        and st.st_size >= tail_state["offset"]
@@ -0,0 +1,240 @@
+# cvr_store.py
+# python3
+
+"""
+Routines to work with OpenAuditTool.py on post-election audits.
+Binary cache ("CVR store") for reported CVRs.
+
+The reported CVRs never change between audit stages, but each stage
+process would otherwise re-parse them from CSV.  This module converts
+each collection's CVR file into a few NumPy arrays (one row per CVR row):
+
+    ballots    int32 ordinal of the ballot id (index into the bids array)
+    contests   int32 code of the contest id (index into "cids" in the index)
+    votes      int32 code of the vote (index into "votes" in the index)
+    bids       unicode array of the distinct ballot ids, in order of
+               first appearance
+
+plus a small json sidecar index giving the contest and vote tables and
+the name, size, and modification time of the CSV file that was converted.
+
+The files live in
+
+    2-reported
+       24-reported-cvr-store
+          cvr-store-DEN-A01-ballots.npy
+          cvr-store-DEN-A01-contests.npy
+          cvr-store-DEN-A01-votes.npy
+          cvr-store-DEN-A01-bids.npy
+          cvr-store-DEN-A01-index.json
+          ...
+
+Loading these arrays is much faster than parsing the CSV file, and
+read_cvr_store builds e.rv_cpb and e.votes_c from them just as reading
+the CSV file would; the arrays are not kept after that.  A store whose
+sidecar does not match the current CSV file is ignored, and the CSV
+file is read instead.
+"""
+
+import json
+import logging
+import os
+
+import numpy as np
+
+import csv_readers
+import ids
+import utils
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+ARRAY_NAMES = ["ballots", "contests", "votes", "bids"]
+
+
+def store_pathname(e):
+    """ Return pathname of directory holding the CVR store for election e. """
+
+    election_pathname = os.path.join(e.ctx.elections_root,
+                                     e.election_dirname)
+    return os.path.join(election_pathname,
+                        "2-reported",
+                        "24-reported-cvr-store")
+
+
+def store_filename(pbcid, name):
+    """ Return filename (within store directory) of given part of store for pbcid. """
+
+    safe_pbcid = ids.filename_safe(pbcid)
+    if name == "index":
+        return "cvr-store-" + safe_pbcid + "-index.json"
+    return "cvr-store-" + safe_pbcid + "-" + name + ".npy"
+
+
+def source_signature(file_pathname):
+    """ Return dict identifying the current version of CSV file file_pathname. """
+
+    st = os.stat(file_pathname)
+    return {"source": os.path.basename(file_pathname),
+            "source_size": st.st_size,
+            "source_mtime_ns": st.st_mtime_ns}
+
+
+def cvrs_pathname(e, pbcid):
+    """ Return pathname of the current reported CVR csv file for pbcid. """
+
+    election_pathname = os.path.join(e.ctx.elections_root, e.election_dirname)
+    specification_pathname = os.path.join(election_pathname,
+                                          "2-reported", "22-reported-cvrs")
+    safe_pbcid = ids.filename_safe(pbcid)
+    filename = utils.greatest_name(specification_pathname,
+                                   "reported-cvrs-" + safe_pbcid,
+                                   ".csv",
+                                   ctx=e.ctx)
+    return os.path.join(specification_pathname, filename)
+
+
+##############################################################################
+# Conversion (CSV --> store)
+
+
+def write_cvr_stores(e):
+    """ Convert the reported CVR file of every collection into a CVR store. """
+
+    for pbcid in e.pbcids:
+        write_cvr_store(e, pbcid)
+
+
+def write_cvr_store(e, pbcid):
+    """
+    Convert reported CVR csv file for pbcid into a CVR store.
+
+    Return True if the store was written.  A collection whose CVR file
+    contains rows for some other collection is not converted, since
+    the store only records rows of its own collection; such a
+    collection will continue to be read from CSV.
+    """
+
+    file_pathname = cvrs_pathname(e, pbcid)
+    signature = source_signature(file_pathname)
+    fieldnames = ["Collection", "Scanner", "Ballot id",
+                  "Contest", "Selections"]
+    rows = csv_readers.read_csv_file(file_pathname, fieldnames, varlen=True)
+
+    bid_code = {}
+    cid_code = {}
+    vote_code = {}
+    n = len(rows)
+    ballots = np.empty(n, dtype=np.int32)
+    contests = np.empty(n, dtype=np.int32)
+    votes = np.empty(n, dtype=np.int32)
+    for i, row in enumerate(rows):
+        if row["Collection"] != pbcid:
+            logger.warning("CVR store not written for %s: row for collection %s in %s.",
+                           pbcid, row["Collection"], file_pathname)
+            return False
+        vote = tuple(sorted(row["Selections"]))
+        ballots[i] = bid_code.setdefault(row["Ballot id"], len(bid_code))
+        contests[i] = cid_code.setdefault(row["Contest"], len(cid_code))
+        votes[i] = vote_code.setdefault(vote, len(vote_code))
+    bids = np.array(list(bid_code), dtype=np.str_)
+
+    dirpath = store_pathname(e)
+    os.makedirs(dirpath, exist_ok=True)
+    arrays = {"ballots": ballots, "contests": contests,
+              "votes": votes, "bids": bids}
+    for name in ARRAY_NAMES:
+        np.save(os.path.join(dirpath, store_filename(pbcid, name)), arrays[name])
+    index = dict(signature)
+    index["rows"] = n
+    index["cids"] = list(cid_code)
+    index["votes"] = [list(vote) for vote in vote_code]
+    # Index is written last, so a partially-written store is never "fresh".
+    with open(os.path.join(dirpath, store_filename(pbcid, "index")), "w") as file:
+        json.dump(index, file, indent=2)
+    logger.info("CVR store written for %s (%d rows).", pbcid, n)
+    return True
+
+
+##############################################################################
+# Reading (store --> Election)
+
+
+def read_store_index(e, pbcid, file_pathname):
+    """
+    Return sidecar index of the CVR store for pbcid, if the store is up
+    to date with respect to csv file file_pathname; otherwise None.
+    """
+
+    dirpath = store_pathname(e)
+    index_pathname = os.path.join(dirpath, store_filename(pbcid, "index"))
+    if not os.path.isfile(index_pathname):
+        return None
+    with open(index_pathname, "r") as file:
+        index = json.load(file)
+    signature = source_signature(file_pathname)
+    for key in signature:
+        if index.get(key) != signature[key]:
+            logger.info("CVR store for %s is stale; reading %s instead.",
+                        pbcid, file_pathname)
+            return None
+    return index
+
+
+def load_cvr_store(e, pbcid, index):
+    """
+    Return dict with the arrays (keys ARRAY_NAMES) of the CVR store for
+    pbcid, whose sidecar index is index, or None if they do not match it.
+    """
+
+    dirpath = store_pathname(e)
+    arrays = {}
+    for name in ARRAY_NAMES:
+        arrays[name] = np.load(os.path.join(dirpath, store_filename(pbcid, name)))
+    if not all(len(arrays[name]) == index["rows"]
+               for name in ["ballots", "contests", "votes"]):
+        logger.info("CVR store for %s is inconsistent; reading csv file instead.",
+                    pbcid)
+        return None
+    return arrays
+
+
+def read_cvr_store(e, pbcid, file_pathname):
+    """
+    Set reported votes for pbcid from its CVR store, if it is fresh.
+
+    Has the same effect on e.rv_cpb and e.votes_c as reading the csv
+    file file_pathname would.  The sidecar index of the store is kept
+    in e.cvr_store_p[pbcid].
+
+    Return True if the store was used, False otherwise.
+    """
+
+    index = read_store_index(e, pbcid, file_pathname)
+    if index is None:
+        return False
+    arrays = load_cvr_store(e, pbcid, index)
+    if arrays is None:
+        return False
+    e.cvr_store_p[pbcid] = index
+
+    cids = index["cids"]
+    vote_table = [tuple(vote) for vote in index["votes"]]
+    bids = arrays["bids"]
+    ballots = arrays["ballots"]
+    contests = arrays["contests"]
+    votes = arrays["votes"]
+    # Contest codes are in order of first appearance, so visiting them
+    # in code order (and rows in file order within a contest) inserts
+    # keys into e.rv_cpb and e.votes_c in the same order as the csv reader.
+    for code, cid in enumerate(cids):
+        rows = np.flatnonzero(contests == code)
+        rv_b = e.rv_cpb.setdefault(cid, {}).setdefault(pbcid, {})
+        votes_c = e.votes_c.setdefault(cid, {})
+        for bid, vote_code in zip(bids[ballots[rows]].tolist(),
+                                  votes[rows].tolist()):
+            vote = vote_table[vote_code]
+            rv_b[bid] = vote
+            votes_c[vote] = True
+    return True
@@ -0,0 +1,266 @@
+# election_db.py
+# python3
+
+"""
+Routines to work with OpenAuditTool.py on post-election audits.
+Optional SQLite-backed storage for per-ballot election data.
+
+For a large (e.g. statewide) election, holding all of the per-ballot
+dicts (e.boxid_pb, e.position_pb, e.rv_cpb, e.av_cpb, ...) in memory
+may not be feasible.  When an election database is opened (see
+open_election_db, or the --sqlite_db command-line option), the
+per-ballot data is instead bulk-loaded from the usual CSV files into
+indexed tables of an SQLite database (stdlib sqlite3):
+
+    manifest        (pbcid, bid) -> ord, boxid, position, stamp,
+                                    required_gid, possible_gid, comments
+                    where ord is the position of bid in the manifest
+                    (so e.bids_p[pbcid][ord] == bid in the in-memory case)
+    reported_cvrs   (cid, pbcid, bid) -> vote
+    audited_votes   (cid, pbcid, bid) -> vote
+
+Votes are stored as json lists of selids.
+
+The aggregate computations (e.rn_cpr, and the sample tallies of
+audit.draw_sample) are then done in the database as indexed GROUP BY
+queries, and only these (small) aggregates are kept in the Election.
+The per-ballot dicts, and e.bids_p, are left empty.
+"""
+
+import json
+import logging
+import sqlite3
+import warnings
+
+import csv_readers
+import cvr_store
+import ids
+import reported
+import utils
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+NO_SUCH_CONTEST = ("-NoSuchContest",)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS manifest (
+    pbcid TEXT NOT NULL,
+    bid TEXT NOT NULL,
+    ord INTEGER NOT NULL,
+    boxid TEXT,
+    position TEXT,
+    stamp TEXT,
+    required_gid TEXT,
+    possible_gid TEXT,
+    comments TEXT,
+    PRIMARY KEY (pbcid, bid)
+);
+CREATE UNIQUE INDEX IF NOT EXISTS manifest_ord ON manifest (pbcid, ord);
+CREATE TABLE IF NOT EXISTS reported_cvrs (
+    cid TEXT NOT NULL,
+    pbcid TEXT NOT NULL,
+    bid TEXT NOT NULL,
+    vote TEXT NOT NULL,
+    PRIMARY KEY (cid, pbcid, bid)
+);
+CREATE TABLE IF NOT EXISTS audited_votes (
+    cid TEXT NOT NULL,
+    pbcid TEXT NOT NULL,
+    bid TEXT NOT NULL,
+    vote TEXT NOT NULL,
+    PRIMARY KEY (cid, pbcid, bid)
+);
+"""
+
+
+def encode_vote(vote):
+    """ Return string encoding of vote (a tuple of selids) for the database. """
+
+    return json.dumps(list(vote))
+
+
+def decode_vote(s):
+    """ Return vote (a tuple of selids) encoded by string s. """
+
+    return tuple(json.loads(s))
+
+
+def open_election_db(e, db_pathname):
+    """
+    Open (creating if necessary) SQLite election database db_pathname,
+    and have Election e use it for its per-ballot data.
+
+    A db_pathname of ":memory:" gives a private in-memory database.
+    """
+
+    db = sqlite3.connect(db_pathname)
+    db.execute("PRAGMA journal_mode = WAL")
+    # With WAL, NORMAL still keeps the database consistent after a crash
+    # or power loss (at worst the last transactions are lost).
+    db.execute("PRAGMA synchronous = NORMAL")
+    db.executescript(SCHEMA)
+    e.db = db
+    e.db_pathname = db_pathname
+    return db
+
+
+##############################################################################
+# Bulk loading (CSV --> database)
+
+
+def load_reported_ballot_manifests(e):
+    """
+    Load ballot manifests 21-reported-ballot-manifests into manifest table.
+    """
+
+    with e.db:
+        for pbcid in e.pbcids:
+            e.db.execute("DELETE FROM manifest WHERE pbcid = ?", (pbcid,))
+            rows = reported.read_reported_ballot_manifest_rows(e, pbcid)
+            e.db.executemany(
+                "INSERT OR REPLACE INTO manifest VALUES (?,?,?,?,?,?,?,?,?)",
+                ((pbcid, bid, ord, boxid, position, stamp, req, poss, comments)
+                 for ord, (pbcid, bid, boxid, position, stamp, req, poss, comments)
+                 in enumerate(reported.expand_manifest_rows(rows))))
+
+
+def load_reported_cvrs(e):
+    """
+    Load reported votes 22-reported-cvrs/reported-cvrs-PBCID.csv
+    into reported_cvrs table.
+    """
+
+    fieldnames = ["Collection", "Scanner", "Ballot id",
+                  "Contest", "Selections"]
+    with e.db:
+        for pbcid in e.pbcids:
+            e.db.execute("DELETE FROM reported_cvrs WHERE pbcid = ?", (pbcid,))
+            file_pathname = cvr_store.cvrs_pathname(e, pbcid)
+            rows = csv_readers.read_csv_file(file_pathname, fieldnames, varlen=True)
+            # put vote selids into canonical order, as reported.read_reported_cvrs does
+            e.db.executemany(
+                "INSERT OR REPLACE INTO reported_cvrs VALUES (?,?,?,?)",
+                ((row["Contest"], row["Collection"], row["Ballot id"],
+                  encode_vote(sorted(row["Selections"])))
+                 for row in rows))
+
+
+def load_audited_votes(e, pbcid, rows):
+    """
+    Load rows of audited votes (as read from
+    33-audited-votes/audited-votes-PBCID.csv) into audited_votes table.
+    """
+
+    with e.db:
+        e.db.executemany(
+            "INSERT OR REPLACE INTO audited_votes VALUES (?,?,?,?)",
+            ((row["Contest"], row["Collection"], row["Ballot id"],
+              encode_vote(row["Selections"]))
+             for row in rows))
+
+
+##############################################################################
+# Aggregates (database --> Election)
+
+
+def count_ballots(e, pbcid):
+    """ Return number of ballots in manifest for pbcid. """
+
+    (n,) = e.db.execute("SELECT COUNT(*) FROM manifest WHERE pbcid = ?",
+                        (pbcid,)).fetchone()
+    return n
+
+
+def check_reported_selids(e):
+    """
+    Database version of reported.check_reported_selids.
+
+    Make sure e.votes_c[cid] contains all reported votes (including
+    ("-NoSuchContest",) when some ballot in a relevant collection has no
+    reported vote for cid), and that e.selids_c[cid] contains all +/-
+    selids seen in reported votes.
+    """
+
+    # Order by first appearance, as when reading the csv files.
+    for (cid, vote, _) in e.db.execute(
+            "SELECT cid, vote, MIN(rowid) FROM reported_cvrs "
+            "GROUP BY cid, vote ORDER BY MIN(rowid)"):
+        utils.nested_set(e.votes_c, [cid, decode_vote(vote)], True)
+    for cid in e.cids:
+        for pbcid in e.possible_pbcid_c[cid]:
+            (missing,) = e.db.execute(
+                "SELECT EXISTS (SELECT 1 FROM manifest m WHERE m.pbcid = ? "
+                "AND NOT EXISTS (SELECT 1 FROM reported_cvrs r "
+                "WHERE r.cid = ? AND r.pbcid = m.pbcid AND r.bid = m.bid))",
+                (pbcid, cid)).fetchone()
+            if missing:
+                utils.nested_set(e.votes_c, [cid, NO_SUCH_CONTEST], True)
+        for rv in e.votes_c.get(cid, {}):
+            for selid in rv:
+                if ids.is_writein(selid) or ids.is_error_selid(selid):
+                    e.selids_c[cid][selid] = True
+
+
+def compute_rn_cpr(e):
+    """
+    Database version of reported.compute_rn_cpr.
+
+    Set e.rn_cpr[cid][pbcid][rv] to number of ballots in pbcid
+    (i.e. in its manifest) with reported vote rv.
+    """
+
+    for cid in e.cids:
+        e.rn_cpr[cid] = {}
+        for pbcid in e.possible_pbcid_c[cid]:
+            e.rn_cpr[cid][pbcid] = {rv: 0 for rv in e.votes_c[cid]}
+    for (cid, pbcid, vote, count) in e.db.execute(
+            "SELECT r.cid, r.pbcid, r.vote, COUNT(*) "
+            "FROM reported_cvrs r JOIN manifest m "
+            "ON m.pbcid = r.pbcid AND m.bid = r.bid "
+            "GROUP BY r.cid, r.pbcid, r.vote"):
+        if cid in e.rn_cpr and pbcid in e.rn_cpr[cid]:
+            e.rn_cpr[cid][pbcid][decode_vote(vote)] = count
+
+
+def compute_sample_tally(e, cid, pbcid, sample_size):
+    """
+    Return tally2 (rv->av->count) of (reported, actual) vote pairs for
+    contest cid over the first sample_size ballots of pbcid's manifest.
+
+    This is the database version of the tally computed in audit.draw_sample;
+    a ballot with no reported (or audited) vote for cid counts as having
+    reported (or actual) vote ("-NoSuchContest",).
+    """
+
+    no_such_contest = encode_vote(NO_SUCH_CONTEST)
+    tally2 = {}
+    for (rv, av, count) in e.db.execute(
+            "SELECT COALESCE(r.vote, ?), COALESCE(a.vote, ?), COUNT(*) "
+            "FROM manifest m "
+            "LEFT JOIN reported_cvrs r "
+            "ON r.cid = ? AND r.pbcid = m.pbcid AND r.bid = m.bid "
+            "LEFT JOIN audited_votes a "
+            "ON a.cid = ? AND a.pbcid = m.pbcid AND a.bid = m.bid "
+            "WHERE m.pbcid = ? AND m.ord < ? "
+            "GROUP BY 1, 2",
+            (no_such_contest, no_such_contest, cid, cid, pbcid, sample_size)):
+        utils.nested_set(tally2, [decode_vote(rv), decode_vote(av)], count)
+    return tally2
+
+
+def check_reported(e):
+    """
+    Database version of the per-ballot checks in reported.check_reported.
+    """
+
+    for (cid, pbcid, bid) in e.db.execute(
+            "SELECT r.cid, r.pbcid, r.bid FROM reported_cvrs r "
+            "WHERE NOT EXISTS (SELECT 1 FROM manifest m "
+            "WHERE m.pbcid = r.pbcid AND m.bid = r.bid)"):
+        warnings.warn("bid `{}` from reported_cvrs[{}][{}] is not in manifest[{}]."
+                      .format(bid, cid, pbcid, pbcid))
+    for pbcid in e.pbcids:
+        if count_ballots(e, pbcid) == 0:
+            warnings.warn("pbcid `{}` has no ballots in manifest table.".format(pbcid))
@@ -73,12 +73,13 @@ def read_election_spec_general(e, election_dirname):
     """ 
     Read file 1-election-spec/election-spec-general.csv, put results into Election e.
     election_dirname is the name of the directory for the election 
-        (e.g. "CO-2017-11") with ELECTIONS_ROOT
+        (e.g. "CO-2017-11") within e.ctx.elections_root
     """
     
-    election_pathname = os.path.join(OpenAuditTool.ELECTIONS_ROOT, election_dirname)
+    election_pathname = os.path.join(e.ctx.elections_root, election_dirname)
     spec_pathname = os.path.join(election_pathname, "1-election-spec")
-    filename = utils.greatest_name(spec_pathname, "election-spec-general", ".csv")
+    filename = utils.greatest_name(spec_pathname, "election-spec-general", ".csv",
+                                   ctx=e.ctx)
     file_pathname = os.path.join(spec_pathname, filename)
     fieldnames = ["Attribute", "Value"]
     rows = csv_readers.read_csv_file(file_pathname, fieldnames)
@@ -114,9 +115,10 @@ def read_election_spec_contests(e):
     Read file election-spec-contests.csv, put results into Election e.
     """
 
-    election_pathname = os.path.join(OpenAuditTool.ELECTIONS_ROOT, e.election_dirname)
+    election_pathname = os.path.join(e.ctx.elections_root, e.election_dirname)
     spec_pathname = os.path.join(election_pathname, "1-election-spec")
-    filename = utils.greatest_name(spec_pathname, "election-spec-contests", ".csv")
+    filename = utils.greatest_name(spec_pathname, "election-spec-contests", ".csv",
+                                   ctx=e.ctx)
     file_pathname = os.path.join(spec_pathname, filename)
     fieldnames = ["Contest", "Contest type", "Params", "Write-ins",
                   "Selections"]
@@ -149,9 +151,10 @@ def read_election_spec_contest_groups(e):
     Read file election-spec-contest-groups.csv, put results into Election e.
     """
 
-    election_pathname = os.path.join(OpenAuditTool.ELECTIONS_ROOT, e.election_dirname)
+    election_pathname = os.path.join(e.ctx.elections_root, e.election_dirname)
     spec_pathname = os.path.join(election_pathname, "1-election-spec")
-    filename = utils.greatest_name(spec_pathname, "election-spec-contest-groups", ".csv")
+    filename = utils.greatest_name(spec_pathname, "election-spec-contest-groups", ".csv",
+                                   ctx=e.ctx)
     file_pathname = os.path.join(spec_pathname, filename)
     fieldnames = ["Contest group", "Contest(s) or group(s)"]
     rows = csv_readers.read_csv_file(file_pathname, fieldnames, varlen=True)
@@ -175,9 +178,10 @@ def read_election_spec_collections(e):
     Read file 14-collections.csv, put results into Election e.
     """
 
-    election_pathname = os.path.join(OpenAuditTool.ELECTIONS_ROOT, e.election_dirname)
+    election_pathname = os.path.join(e.ctx.elections_root, e.election_dirname)
     spec_pathname = os.path.join(election_pathname, "1-election-spec")
-    filename = utils.greatest_name(spec_pathname, "election-spec-collections", ".csv")
+    filename = utils.greatest_name(spec_pathname, "election-spec-collections", ".csv",
+                                   ctx=e.ctx)
     file_pathname = os.path.join(spec_pathname, filename)
     fieldnames = ["Collection", "Manager", "CVR type",
                   "Required Contests", "Possible Contests"]
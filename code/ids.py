@@ -13,10 +13,20 @@ These routines all related to ids:
     measurement ids (mids)
 """
 
+import functools
+
 ##############################################################################
 ## generic id-related routines
 
 
+# clean_id is applied to every cell of every CSV file read, and most
+# cells are short ids that are already clean and that repeat many times
+# (collection ids, contest ids, selection ids), so results are memoized
+# in a bounded LRU cache.
+CLEAN_ID_CACHE_SIZE = 2**16
+
+
+@functools.lru_cache(maxsize=CLEAN_ID_CACHE_SIZE)
 def clean_id(id):
     """ 
     Return id with initial and final whitespace removed, and
@@ -24,15 +34,21 @@ def clean_id(id):
     blank.  Also, all nonprintable characters are removed.
     """
 
+    # Fast path: id is already clean.  Note that isprintable() is False
+    # for every whitespace character other than the blank " ".
+    if id.isprintable() and \
+       id[:1] != " " and id[-1:] != " " and "  " not in id:
+        return id
+
     id = id.strip()
-    new_id = ""
+    new_id = []
     for c in id:
         if c.isspace():
             c = " "
         if (c != " " or (len(new_id)>0 and new_id[-1] != " ")) \
            and c.isprintable():
-            new_id += c
-    return new_id
+            new_id.append(c)
+    return "".join(new_id)
 
 
 def filename_safe(id):
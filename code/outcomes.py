@@ -14,6 +14,8 @@ An outcome is always a *tuple* of ids, even if there is only one winner.
 # TBD: Tie-breaking, etc.
 
 
+import numpy as np
+
 import ids
 import rcv
 
@@ -126,6 +128,38 @@ def compute_outcome(e, cid, tally):
                                    .format(e.contest_type_c[cid], cid))
 
 
+def compute_outcomes(e, cid, votes, tallies):
+    """
+    Batch version of compute_outcome: return list of outcomes for the
+    given contest, one for each row of tallies, a 2-d numpy array whose
+    row i gives counts for the votes in list votes.
+
+    Plurality outcomes are computed on the whole array at once; other
+    outcome rules use compute_outcome on each row.
+    """
+
+    if e.contest_type_c[cid].lower()=="plurality":
+        return plurality_batch(votes, tallies)
+    return [compute_outcome(e, cid, dict(zip(votes, row)))
+            for row in tallies.tolist()]
+
+
+def plurality_batch(votes, tallies):
+    """
+    Batch version of plurality: return list giving, for each row of
+    2-d numpy array tallies (counts for the votes in list votes), the
+    valid vote with largest count (the first such, on ties, as in
+    plurality when votes is the order of the tally dict).
+    """
+
+    valid = np.array([len(vote) == 1 and not ids.is_error_selid(vote[0])
+                      for vote in votes], dtype=bool)
+    if not valid.any():
+        return [None] * len(tallies)
+    winners = np.argmax(np.where(valid, tallies, -np.inf), axis=1)
+    return [votes[j] for j in winners.tolist()]
+
+
 def compute_tally2(vec):
     """
     Input vec is an iterable of (a, r) pairs. 
@@ -137,11 +171,6 @@ def compute_tally2(vec):
 
     tally2 = {}
     for (av, rv) in vec:
-        if rv not in tally2:
-            tally2[rv] = compute_tally([aa for (aa, rr)
-                                        in vec if rv == rr])
+        tally_a = tally2.setdefault(rv, {})
+        tally_a[av] = tally_a.get(av, 0) + 1
     return tally2
-
-
-
-
@@ -10,55 +10,69 @@ given what has been done already, and the results obtained
 from the previous stage.
 """
 import copy
+import hashlib
+import logging
 import random
+import time
 
+import numpy as np
+
+import allocation
+import consistent_sampling
 import outcomes
 import risk_bayes
 
 
+logger = logging.getLogger(__name__)
+
+
 ##############################################################################
 # Compute audit plan for next stage
 
-def update_correct(xs, pbcids_to_adjust, nonsample_sizes, num_winners, risk_limit):
+def update_correct(xs, pbcids_to_adjust, nonsample_sizes, num_winners, risk_limit,
+                   rand=random):
     """
     Update how much to extend the county's sampling by.
 
     With probability 1 - (1-alpha)^(num_winners), we decrease the sampling since all
     the winners are correct. If not, keep the same value.
+    Random choices are made with rand (a random.Random or numpy Generator).
     """
     update = {}
     for pbcid in xs:
         if xs[pbcid] == 0:
             update[pbcid] = xs[pbcid]
-        elif random.random() < 1-(1-risk_limit)**num_winners:
+        elif rand.random() < 1-(1-risk_limit)**num_winners:
             update[pbcid] = (xs[pbcid]-1)
         else:
             update[pbcid] = (xs[pbcid])
     return update
 
-def update_incorrect(xs, pbcids_to_adjust, nonsample_sizes, num_winners, risk_limit):
+def update_incorrect(xs, pbcids_to_adjust, nonsample_sizes, num_winners, risk_limit,
+                     rand=random):
     """
     Update how much to extend the county's sampling by.
 
     With probability (1-alpha)^(num_winners), we increase the sampling since not all
     the winners are correct. If not, keep the same value.
+    Random choices are made with rand (a random.Random or numpy Generator).
     """
 
     update = {}
     for pbcid in xs:
         if xs[pbcid] == nonsample_sizes[pbcid]:
             update[pbcid] = (xs[pbcid])
-        elif random.random() < (1-risk_limit)**num_winners:
+        elif rand.random() < (1-risk_limit)**num_winners:
             update[pbcid] = (xs[pbcid]+1)
         else:
             update[pbcid] = (xs[pbcid])
     return update
 
-def random_naive(pbcids):
+def random_naive(pbcids, rand=random):
     """
     Randomly choose which county to extend the audit for.
     """
-    return random.sample(pbcids, 1)[0]
+    return pbcids[int(rand.random() * len(pbcids))]
 
 def round_robin(pbcids, index):
     """
@@ -95,11 +109,14 @@ def random_min_var(pbcids, actual_votes, xs, nonsample_sizes):
             best_var = (var_after - var_before)
     return best_pbcid
 
-def get_noisy_guess(e, mid, pbcids, actual_votes, xs, nonsample_sizes, num_trials=100):
+def get_noisy_guess(e, mid, pbcids, actual_votes, xs, nonsample_sizes, num_trials=100, rs=None):
     """
     Use Dirichlet a certain number of times, to measure the probability that
     a winner that isn't the reported winner wins in the overall election.
+    Random draws come from numpy Generator rs (default e.ctx.random_state).
     """
+    if rs is None:
+        rs = e.ctx.random_state
     winners = []
     cid = e.cid_m[mid]
     for _ in range(num_trials):
@@ -109,14 +126,15 @@ def get_noisy_guess(e, mid, pbcids, actual_votes, xs, nonsample_sizes, num_trial
             for av in current_sample[pbcid]:
                 if current_sample[pbcid][av] == 0:
                     current_sample[pbcid][av] += 50 # pseudocount
-            dirichlet_dict = risk_bayes.dirichlet(current_sample[pbcid])
-            extended_sample = risk_bayes.multinomial(xs[pbcid], dirichlet_dict)
+            dirichlet_dict = risk_bayes.dirichlet(current_sample[pbcid], rs)
+            extended_sample = risk_bayes.multinomial(xs[pbcid], dirichlet_dict, rs)
             for av in current_sample[pbcid]:
                 current_sample[pbcid][av] += extended_sample[av]
 
         for pbcid in actual_votes:
-            dirichlet_dict = risk_bayes.dirichlet(current_sample[pbcid])
-            extended_sample = risk_bayes.multinomial(nonsample_sizes[pbcid] - xs[pbcid], dirichlet_dict)
+            dirichlet_dict = risk_bayes.dirichlet(current_sample[pbcid], rs)
+            extended_sample = risk_bayes.multinomial(nonsample_sizes[pbcid] - xs[pbcid], dirichlet_dict,
+                                                     rs)
             for av in current_sample[pbcid]:
                 current_sample[pbcid][av] += extended_sample[av]
 
@@ -130,7 +148,8 @@ def get_noisy_guess(e, mid, pbcids, actual_votes, xs, nonsample_sizes, num_trial
 
         if outcomes.compute_outcome(e, cid, merged_sample) == e.ro_c[cid]:
             winners.append(1)
-    return abs(float(num_trials - len(winners)) / len(winners) - 0.05)
+    # (max, in case no trial gives the reported outcome)
+    return abs(float(num_trials - len(winners)) / max(len(winners), 1) - 0.05)
 
 def subtract_from_all(xs, num):
     """
@@ -142,7 +161,35 @@ def subtract_from_all(xs, num):
         new[k] -= num
     return new
 
-def discrete_rm(e, pbcids_to_adjust, init_x=0, num_trials=40, power=-2./3):
+class Deadline(object):
+    """
+    Wall-clock deadline for anytime planning (see planned_sample_sizes).
+
+    The iterative planners (get_sample_size, discrete_rm, and their
+    array versions) check it between rounds of refinement (iterations,
+    or batches of iterations), and when it has passed, stop and return
+    the plan as refined so far.  self.expired then stays True, meaning
+    the plan did not converge (did not get all its iterations).
+    """
+
+    def __init__(self, budget):
+        self.time = time.monotonic() + budget
+        self.expired = False
+        self.rounds = 0
+        # number of rounds begun (and so completed) before the deadline
+
+    def passed(self):
+        """ Return True if the deadline has passed (else a round begins). """
+
+        if not self.expired and time.monotonic() >= self.time:
+            self.expired = True
+        if not self.expired:
+            self.rounds += 1
+        return self.expired
+
+
+def discrete_rm(e, pbcids_to_adjust, init_x=0, num_trials=40, power=-2./3, plan_key=None,
+                deadline=None):
     """
     Run discrete Robbins-Monro simulation on the loss function defined by
     the number of trials, where someone who isn't the reported winner wins.
@@ -154,16 +201,26 @@ def discrete_rm(e, pbcids_to_adjust, init_x=0, num_trials=40, power=-2./3):
     x_new = x_old - a_k (noisy_guess(x_old) - noisy_guess(x_old - 1))
     a_k must fulfill properties of RM step size - currently using
     (k+1)^power, where normally power is -1. In our case, we currently use -2/3.
+
+    Random draws come from substreams named by plan_key (see compute_plan),
+    or by the stage time if plan_key is None.
+    If deadline (a Deadline) is given, iteration stops when it passes.
     """
     for mid in e.cid_m:
         cid = e.cid_m[mid]
         xs, actual_votes, nonsample_sizes = create_helper_dicts(e, mid, init_x, pbcids_to_adjust)
+        rs = e.ctx.rng.stream("plan", plan_key or e.stage_time, "discrete_rm", mid)
 
         for k in range(num_trials):
-            finite_diff = (get_noisy_guess(e, mid, pbcids_to_adjust, actual_votes, xs, nonsample_sizes) - 
+            if deadline is not None and deadline.passed():
+                break
+            # (x_old - 1 is kept nonnegative, since it is a sample size)
+            finite_diff = (get_noisy_guess(e, mid, pbcids_to_adjust, actual_votes, xs, nonsample_sizes,
+                                           rs=rs) - 
                 get_noisy_guess(
-                    e, mid, pbcids_to_adjust, actual_votes, subtract_from_all(xs, 1),
-                    subtract_from_all(nonsample_sizes, -1)))
+                    e, mid, pbcids_to_adjust, actual_votes,
+                    {pbcid: max(x, 0) for (pbcid, x) in subtract_from_all(xs, 1).items()},
+                    subtract_from_all(nonsample_sizes, -1), rs=rs))
             step_size = (k+1)**power
             xs = subtract_from_all(xs, step_size * finite_diff-1)
             xs = {k:int(xs[k]) for k in xs}
@@ -172,6 +229,144 @@ def discrete_rm(e, pbcids_to_adjust, init_x=0, num_trials=40, power=-2./3):
                 xs[pbcid] = 0
         return xs
 
+def get_noisy_guess_array(e, mid, votes, actual, xs, nonsample_sizes, num_trials=100, rs=None):
+    """
+    Array version of get_noisy_guess, with all num_trials trials drawn at
+    once (risk_bayes.dirichlet_array and multinomial_array).
+
+    Here votes is the list of votes (in sorted order), actual is the
+    array of actual votes sampled (one row per collection, one column per
+    vote), and xs and nonsample_sizes are arrays with one entry per
+    collection.  Random draws come from numpy Generator rs.
+    """
+
+    seeded = np.where(actual == 0, 50.0, actual)         # pseudocount
+    trials = np.broadcast_to(seeded, (num_trials,) + seeded.shape)
+    current = trials + risk_bayes.multinomial_array(
+        np.broadcast_to(xs, trials.shape[:2]),
+        risk_bayes.dirichlet_array(trials, rs), rs)
+    current += risk_bayes.multinomial_array(
+        np.broadcast_to(nonsample_sizes - xs, trials.shape[:2]),
+        risk_bayes.dirichlet_array(current, rs), rs)
+    return noisy_guess_of_trials(e, mid, votes, current.sum(axis=1))
+
+def get_noisy_guess_pair_array(e, mid, votes, actual, xs, nonsample_sizes, num_trials=100,
+                               rs=None):
+    """
+    Return the pair of guesses
+        (get_noisy_guess_array(..., xs, nonsample_sizes, ...),
+         get_noisy_guess_array(..., max(xs-1, 0), nonsample_sizes+1, ...))
+    (arguments as for get_noisy_guess_array), drawn with common random
+    numbers, for the finite difference in discrete_rm_array.
+
+    Each guess has the same distribution as with get_noisy_guess_array,
+    but the trials of the two guesses are coupled ballot by ballot:
+        - the first Dirichlet draw is shared, and the first x ballots
+          of a trial are its first x-1 ballots plus one more;
+        - the second Dirichlet draw shares its gamma variates, the
+          extra ballot adding an exponential variate to its vote's
+          gamma (a gamma(a+1) variate is a gamma(a) variate plus an
+          exponential one);
+        - the two second-stage probability vectors p and p' are split
+          as p = (1-eps) q + eps r and p' = (1-eps) q + eps r', where
+          q is their common part, and ballots drawn from q are shared.
+    So the trials of the two guesses differ in only a few ballots.
+    """
+
+    seeded = np.where(actual == 0, 50.0, actual)         # pseudocount
+    shape = (num_trials,) + seeded.shape
+    trials = np.broadcast_to(seeded, shape)
+    xs_1 = np.maximum(xs-1, 0)
+    extra = np.broadcast_to(xs - xs_1, shape[:2])
+
+    # first stage: x ballots are x-1 ballots and one more (if x > 0)
+    ps = risk_bayes.dirichlet_array(trials, rs)
+    current_1 = trials + risk_bayes.multinomial_array(
+        np.broadcast_to(xs_1, shape[:2]), ps, rs)
+    extra_ballot = risk_bayes.multinomial_array(extra, ps, rs)
+
+    # second stage Dirichlet draws, from shared gamma variates
+    g_1 = rs.gamma(current_1)
+    g = g_1 + extra_ballot * rs.exponential(size=shape)
+    ps = g / g.sum(axis=-1, keepdims=True)
+    ps_1 = g_1 / g_1.sum(axis=-1, keepdims=True)
+
+    # second stage multinomial draws, sharing ballots drawn from the
+    # common part of ps and ps_1
+    common = np.minimum(ps, ps_1)
+    overlap = common.sum(axis=-1, keepdims=True)
+    eps = np.clip(1.0 - overlap[..., 0], 0.0, 1.0)       # (rounding)
+    qs = common / overlap
+
+    def residual(ps):
+        diff = ps - common
+        total = diff.sum(axis=-1, keepdims=True)
+        return np.where(total > 0, diff / np.where(total > 0, total, 1.0), qs)
+
+    ns = np.broadcast_to(nonsample_sizes - xs, shape[:2])
+    more = np.broadcast_to(nonsample_sizes + 1 - xs_1, shape[:2]) - ns
+    ks = rs.binomial(ns, eps)
+    ks_1 = ks + rs.binomial(more, eps)
+    shared = risk_bayes.multinomial_array(ns - ks, qs, rs)
+    shared_1 = shared + risk_bayes.multinomial_array(more - (ks_1 - ks), qs, rs)
+    current = current_1 + extra_ballot + shared + \
+        risk_bayes.multinomial_array(ks, residual(ps), rs)
+    current_1 = current_1 + shared_1 + \
+        risk_bayes.multinomial_array(ks_1, residual(ps_1), rs)
+
+    return (noisy_guess_of_trials(e, mid, votes, current.sum(axis=1)),
+            noisy_guess_of_trials(e, mid, votes, current_1.sum(axis=1)))
+
+def noisy_guess_of_trials(e, mid, votes, merged):
+    """
+    Return noisy guess (as for get_noisy_guess) from the trials merged
+    (array of vote tallies, one row per trial, one column per vote).
+    """
+
+    cid = e.cid_m[mid]
+    num_trials = merged.shape[0]
+    num_winners = sum(outcome == e.ro_c[cid]
+                      for outcome in outcomes.compute_outcomes(e, cid, votes, merged))
+    return abs(float(num_trials - num_winners) / max(num_winners, 1) - 0.05)
+
+def discrete_rm_array(e, pbcids_to_adjust, init_x=0, num_trials=40, power=-2./3,
+                      plan_key=None, deadline=None):
+    """
+    Common-random-numbers version of discrete_rm (e.plan_engine == "array").
+
+    The finite difference
+        noisy_guess(x_old) - noisy_guess(x_old - 1)
+    is estimated with the two guesses coupled (get_noisy_guess_pair_array),
+    their trials drawn from one substream (named for the iteration) and
+    differing in only a few ballots, rather than drawn independently; and
+    with the trials of each guess drawn at once.  The difference then has
+    much lower variance than with independent draws.
+    The number of iterations is the same as for discrete_rm (it sets the
+    scale of the plan); the time saved is per iteration, from drawing
+    the trials as arrays.
+    """
+
+    for mid in e.cid_m:
+        xs_d, actual_votes, nonsample_sizes_d = \
+            create_helper_dicts(e, mid, init_x, pbcids_to_adjust)
+        votes = sorted(actual_votes[pbcids_to_adjust[0]])
+        actual = np.array([[actual_votes[pbcid][vote] for vote in votes]
+                           for pbcid in pbcids_to_adjust], dtype=float)
+        xs = np.array([xs_d[pbcid] for pbcid in pbcids_to_adjust])
+        nonsample_sizes = np.array([nonsample_sizes_d[pbcid] for pbcid in pbcids_to_adjust])
+
+        for k in range(num_trials):
+            if deadline is not None and deadline.passed():
+                break
+            rs = e.ctx.rng.stream("plan", plan_key or e.stage_time, "discrete_rm_array", mid, k)
+            guess, guess_1 = get_noisy_guess_pair_array(e, mid, votes, actual, xs,
+                                                        nonsample_sizes, rs=rs)
+            finite_diff = guess - guess_1
+            step_size = (k+1)**power
+            xs = (xs - (step_size * finite_diff - 1)).astype(int)
+        xs = np.maximum(xs, 0)
+        return dict(zip(pbcids_to_adjust, xs.tolist()))
+
 def create_helper_dicts(e, mid, init_x, pbcids_to_adjust):
     """
     Helper function to create dictionary of actual votes, initialize
@@ -208,19 +403,25 @@ def create_helper_dicts(e, mid, init_x, pbcids_to_adjust):
         nonsample_sizes[pbcid] = nonsample_size
     return xs, actual_votes, nonsample_sizes
 
-def get_sample_size(e, pbcids_to_adjust, init_x=1, pick_pbcid_func=round_robin):
+def get_sample_size(e, pbcids_to_adjust, init_x=1, pick_pbcid_func=round_robin,
+                    plan_key=None, deadline=None):
     """
     Get sample size, for a given county, given how many ballots have been sampled before, and the number left
     to audit, as well as the required risk limit.
+    Random draws come from substreams named by plan_key (see compute_plan),
+    or by the stage time if plan_key is None.
+    If deadline (a Deadline) is given, iteration stops when it passes.
     """
     default_start_pbcid = 0
     start = None
     num_winners = e.num_winners
     max_num_it = e.max_num_it
+    best_xs = None
     for mid in e.cid_m:
         cid = e.cid_m[mid]
 
         xs, actual_votes, nonsample_sizes = create_helper_dicts(e, mid, init_x, pbcids_to_adjust)
+        rs = e.ctx.rng.stream("plan", plan_key or e.stage_time, "get_sample_size", mid)
 
         # For max_num_it iterations, we first choose a county, then, we extend the county
         # by x. Then, given this extended sample, we use it to extend the entire contest to
@@ -228,6 +429,8 @@ def get_sample_size(e, pbcids_to_adjust, init_x=1, pick_pbcid_func=round_robin):
         # correct, then we update the x for that pbcid, by possibly decreasing it. If not,
         # with some probability, we increase x for that county.
         for i in range(max_num_it):
+            if deadline is not None and deadline.passed():
+                return most_refined(xs, i, best_xs)
             current_sample = copy.deepcopy(actual_votes) # pbcid -> av -> count
             if pick_pbcid_func == random_min_var:
                 pbcid = pick_pbcid_func(pbcids_to_adjust, actual_votes, xs, nonsample_sizes)
@@ -238,18 +441,19 @@ def get_sample_size(e, pbcids_to_adjust, init_x=1, pick_pbcid_func=round_robin):
                 start += 1
                 start = (start % len(pbcids_to_adjust))
             else:
-                pbcid = pick_pbcid_func(pbcids_to_adjust)
+                pbcid = pick_pbcid_func(pbcids_to_adjust, rand=rs)
             for av in current_sample[pbcid]:
                 if current_sample[pbcid][av] == 0:
                     current_sample[pbcid][av] += 50 # pseudocount
-            dirichlet_dict = risk_bayes.dirichlet(current_sample[pbcid])
-            extended_sample = risk_bayes.multinomial(xs[pbcid], dirichlet_dict)
+            dirichlet_dict = risk_bayes.dirichlet(current_sample[pbcid], rs)
+            extended_sample = risk_bayes.multinomial(xs[pbcid], dirichlet_dict, rs)
             for av in current_sample[pbcid]:
                 current_sample[pbcid][av] += extended_sample[av]
 
             for k, pbcid in enumerate(pbcids_to_adjust):
-                dirichlet_dict = risk_bayes.dirichlet(current_sample[pbcid])
-                extended_sample = risk_bayes.multinomial(nonsample_sizes[pbcid] - xs[pbcid], dirichlet_dict)
+                dirichlet_dict = risk_bayes.dirichlet(current_sample[pbcid], rs)
+                extended_sample = risk_bayes.multinomial(nonsample_sizes[pbcid] - xs[pbcid], dirichlet_dict,
+                                                         rs)
                 for av in current_sample[pbcid]:
                     current_sample[pbcid][av] += extended_sample[av]
 
@@ -264,11 +468,113 @@ def get_sample_size(e, pbcids_to_adjust, init_x=1, pick_pbcid_func=round_robin):
             for k in range(num_winners):
                 winners.append(outcomes.compute_outcome(e, cid, merged_sample))
             if len(set(winners)) == 1 and winners[0] == e.ro_c[cid]:
-                xs = update_correct(xs, [pbcid], nonsample_sizes, num_winners, e.risk_limit_m[mid])
+                xs = update_correct(xs, [pbcid], nonsample_sizes, num_winners, e.risk_limit_m[mid],
+                                    rs)
             else:
-                xs = update_incorrect(xs, [pbcid], nonsample_sizes, num_winners, e.risk_limit_m[mid])
+                xs = update_incorrect(xs, [pbcid], nonsample_sizes, num_winners, e.risk_limit_m[mid],
+                                      rs)
+        best_xs = xs
+    return xs
+
+
+def most_refined(xs, iterations, best_xs):
+    """
+    Return plan to use when the deadline passes during a random walk
+    that has done the given number of iterations, giving xs: xs, unless
+    the walk hadn't started and there is a plan best_xs from an earlier
+    (completed) walk.
+    """
+
+    if iterations == 0 and best_xs is not None:
+        return best_xs
     return xs
 
+
+PLAN_BATCH_SIZE = 50
+# number of random-walk iterations of get_sample_size_array simulated at once
+
+
+def get_sample_size_array(e, pbcids_to_adjust, init_x=1, pick_pbcid_func=round_robin,
+                          plan_key=None, batch_size=PLAN_BATCH_SIZE, deadline=None):
+    """
+    Array-based version of get_sample_size (e.plan_engine == "array").
+
+    The e.max_num_it iterations of the random walk are simulated in
+    batches of batch_size: the extended samples of a whole batch are
+    drawn as numpy arrays (risk_bayes.dirichlet_array and
+    multinomial_array), with the xs as of the start of the batch, their
+    outcomes are computed by outcomes.compute_outcomes (once, rather
+    than num_winners times, since the outcome is determined by the
+    tally), and the batch's updates to the xs (as in update_correct and
+    update_incorrect) are then applied in turn.  Since the xs change by
+    at most one per iteration, this gives statistically the same plans
+    as get_sample_size, much faster.
+
+    If deadline (a Deadline) is given, it is checked between batches.
+    """
+
+    num_winners = e.num_winners
+    max_num_it = e.max_num_it
+    start = 0
+    P = len(pbcids_to_adjust)
+    best_xs = None
+    for mid in e.cid_m:
+        cid = e.cid_m[mid]
+
+        xs_d, actual_votes, nonsample_sizes_d = \
+            create_helper_dicts(e, mid, init_x, pbcids_to_adjust)
+        rs = e.ctx.rng.stream("plan", plan_key or e.stage_time, "get_sample_size_array", mid)
+
+        # votes in dict order (for outcomes) and in sorted order (for draws)
+        votes = list(actual_votes[pbcids_to_adjust[0]])
+        sorted_votes = sorted(votes)
+        order = [sorted_votes.index(vote) for vote in votes]
+        actual = np.array([[actual_votes[pbcid][vote] for vote in sorted_votes]
+                           for pbcid in pbcids_to_adjust], dtype=float)
+        seeded = np.where(actual == 0, 50.0, actual)       # pseudocount
+        xs = np.array([xs_d[pbcid] for pbcid in pbcids_to_adjust])
+        nonsample_sizes = np.array([nonsample_sizes_d[pbcid] for pbcid in pbcids_to_adjust])
+        p_decrease = 1-(1-e.risk_limit_m[mid])**num_winners
+        p_increase = (1-e.risk_limit_m[mid])**num_winners
+
+        for it in range(0, max_num_it, batch_size):
+            if deadline is not None and deadline.passed():
+                return most_refined(dict(zip(pbcids_to_adjust, xs.tolist())), it, best_xs)
+            B = min(batch_size, max_num_it - it)
+            # pick the collection to extend by xs in each iteration
+            if pick_pbcid_func == random_min_var:
+                xs_d = dict(zip(pbcids_to_adjust, xs.tolist()))
+                chosen = np.full(B, pbcids_to_adjust.index(
+                    pick_pbcid_func(pbcids_to_adjust, actual_votes, xs_d, nonsample_sizes_d)))
+            elif pick_pbcid_func == round_robin:
+                chosen = (start + np.arange(B)) % P
+                start = (start + B) % P
+            else:
+                chosen = (rs.random(B) * P).astype(int)
+
+            current = np.broadcast_to(actual, (B, P, len(votes))).copy()
+            rows = np.arange(B)
+            dirichlet = risk_bayes.dirichlet_array(seeded[chosen], rs)
+            current[rows, chosen] = seeded[chosen] + \
+                risk_bayes.multinomial_array(xs[chosen], dirichlet, rs)
+            dirichlet = risk_bayes.dirichlet_array(current, rs)
+            current += risk_bayes.multinomial_array(
+                np.broadcast_to(nonsample_sizes - xs, (B, P)), dirichlet, rs)
+            merged = current.sum(axis=1)[:, order]
+
+            correct = np.array([outcome == e.ro_c[cid] for outcome in
+                                outcomes.compute_outcomes(e, cid, votes, merged)])
+            u = rs.random((B, P))
+            for b in range(B):
+                if correct[b]:
+                    xs = np.where((xs > 0) & (u[b] < p_decrease), xs-1, xs)
+                else:
+                    xs = np.where((xs < nonsample_sizes) & (u[b] < p_increase), xs+1, xs)
+        xs_d = dict(zip(pbcids_to_adjust, xs.tolist()))
+        best_xs = xs_d
+    return xs_d
+
+
 def compute_plan(e):
     """ 
     Compute a sampling plan for the next stage.
@@ -276,8 +582,16 @@ def compute_plan(e):
     keyed by pbcid. 
     Only input is contest statuses, pbcid audit rates, pbcid current
     sample size, and pcbid size.
+
+    The sample-size computation (get_sample_size or discrete_rm) gives
+    sizes for all collections to adjust at once, so it is done once per
+    stage (see planned_sample_sizes).
     """
 
+    if e.consistent_sampling:
+        compute_plan_tcp(e)
+        return
+
     # for now, use simple strategy of looking at more ballots
     # only in those paper ballot collections that are still being audited
     e.plan_tp[e.stage_time] = e.sn_tp[e.stage_time].copy()
@@ -287,32 +601,123 @@ def compute_plan(e):
         for pbcid in e.possible_pbcid_c[cid]:
             if e.status_tm[e.stage_time][mid] == "Open":
                 pbcids_to_adjust.add(pbcid)
-    for i, pbcid in enumerate(pbcids_to_adjust):
+    # Use "sorted" in next line to preserve deterministic operation.
+    pbcids_to_adjust = sorted(pbcids_to_adjust)
+    if len(pbcids_to_adjust) == 0:
+        return
+
+    # If no flag is true, then we keep the sample size the same, for
+    # each county, throughout the audit.
+    if e.joint_allocation:
+        sample_size = allocation.joint_allocation(e, pbcids_to_adjust)
+    elif e.sample_by_size:
+        sample_size = planned_sample_sizes(e, "get_sample_size", pbcids_to_adjust)
+    elif e.use_discrete_rm:
+        sample_size = planned_sample_sizes(e, "discrete_rm", pbcids_to_adjust)
+    else:
+        sample_size = {pbcid: e.max_audit_rate_p[pbcid] for pbcid in pbcids_to_adjust}
+
+    for pbcid in pbcids_to_adjust:
         # if contest still being audited do as much as you can without
         # exceeding size of paper ballot collection
         # CHECK: is e.rn_p[pbcid] right number to use here?
+        e.plan_tp[e.stage_time][pbcid] = \
+            min(
+                e.sn_tp[e.stage_time][pbcid] + sample_size[pbcid],
+                e.rn_p[pbcid])
 
-        # If this flag is not true, then we keep the sample size the same, for
-        # each county, throughout the audit.
-        if e.sample_by_size:
-            pick_pbcid_func = eval(e.pick_county_func)
-            sample_size = get_sample_size(e, list(pbcids_to_adjust),
-                                          pick_pbcid_func=pick_pbcid_func)
-            e.plan_tp[e.stage_time][pbcid] = \
-                min(
-                    e.sn_tp[e.stage_time][pbcid] + sample_size[pbcid],
-                    e.rn_p[pbcid])
-        elif e.use_discrete_rm:
-            sample_size = discrete_rm(e, list(pbcids_to_adjust))
-            e.plan_tp[e.stage_time][pbcid] = \
-                min(
-                    e.sn_tp[e.stage_time][pbcid] + sample_size[pbcid],
-                    e.rn_p[pbcid])
-        else:
-            e.plan_tp[e.stage_time][pbcid] = \
-                min(
-                    e.sn_tp[e.stage_time][pbcid] + e.max_audit_rate_p[pbcid],
-                    e.rn_p[pbcid])
-    return
+
+def plan_key(e, method, pbcids_to_adjust):
+    """
+    Return digest (a hex string) of the sample state that a plan computed
+    by method ("get_sample_size" or "discrete_rm") for pbcids_to_adjust
+    depends on: the current sample tallies for those collections, their
+    sizes, the risk limits and reported outcomes, and the planner
+    parameters.
+    """
+
+    state = [method, e.plan_engine, e.pick_county_func, e.num_winners, e.max_num_it,
+             str(e.ctx.rng.entropy), pbcids_to_adjust,
+             [e.rn_p[pbcid] for pbcid in pbcids_to_adjust]]
+    for mid in e.cid_m:
+        cid = e.cid_m[mid]
+        tallies = []
+        for pbcid in pbcids_to_adjust:
+            tally2 = e.sn_tcpra[e.stage_time][cid][pbcid]
+            tallies.append(sorted((rv, av, tally2[rv][av])
+                                  for rv in tally2 for av in tally2[rv]))
+        state.append((mid, e.risk_limit_m[mid], e.ro_c[cid], tallies))
+    return hashlib.sha256(repr(state).encode("utf-8")).hexdigest()
 
 
+def planned_sample_sizes(e, method, pbcids_to_adjust):
+    """
+    Return dict (pbcid->int) of sample-size increments for pbcids_to_adjust,
+    as computed by method ("get_sample_size" or "discrete_rm").
+
+    Results are kept in e.plan_cache, keyed by plan_key, so a plan is
+    computed once per sample state; its random draws also come from
+    substreams named by that key, so it is the same whenever it is
+    computed.
+
+    If e.plan_time_budget is positive, planning is "anytime": it stops
+    after that many seconds, with the plan refined so far (or, if no
+    round of refinement was done, e.max_audit_rate_p[pbcid] for each
+    pbcid).  Such a plan depends on how fast the machine is, so it is
+    not cached.  e.plan_converged_t[e.stage_time] records whether the
+    plan got all of its iterations.
+    """
+
+    key = plan_key(e, method, pbcids_to_adjust)
+    if key in e.plan_cache:
+        e.plan_converged_t[e.stage_time] = True
+        return dict(e.plan_cache[key])
+
+    deadline = Deadline(e.plan_time_budget) if e.plan_time_budget > 0 else None
+    if method == "get_sample_size":
+        pick_pbcid_func = eval(e.pick_county_func)
+        if e.plan_engine == "array":
+            xs = get_sample_size_array(e, pbcids_to_adjust, pick_pbcid_func=pick_pbcid_func,
+                                       plan_key=key, deadline=deadline)
+        else:
+            xs = get_sample_size(e, pbcids_to_adjust, pick_pbcid_func=pick_pbcid_func,
+                                 plan_key=key, deadline=deadline)
+    elif e.plan_engine == "array":
+        xs = discrete_rm_array(e, pbcids_to_adjust, plan_key=key, deadline=deadline)
+    else:
+        xs = discrete_rm(e, pbcids_to_adjust, plan_key=key, deadline=deadline)
+
+    converged = deadline is None or not deadline.expired
+    e.plan_converged_t[e.stage_time] = converged
+    if converged:
+        e.plan_cache[key] = xs
+    else:
+        if deadline.rounds == 0:
+            xs = {pbcid: e.max_audit_rate_p[pbcid] for pbcid in pbcids_to_adjust}
+        logger.warning("Plan (%s) not converged within %s seconds (%d rounds); using plan so far.",
+                       method, e.plan_time_budget, deadline.rounds)
+    return dict(xs)
+
+
+def compute_plan_tcp(e):
+    """
+    Compute a sampling plan for the next stage, with consistent sampling
+    (see consistent_sampling.py).
+    Put in e.plan_tcp[e.stage_time] a dict of target sample sizes
+    keyed by cid and pbcid, and in e.plan_tp[e.stage_time] the
+    resulting numbers of ballots to pull, keyed by pbcid.
+
+    Contests with an Open measurement get larger samples, pulling up to
+    e.max_audit_rate_p[pbcid] more ballots from each pbcid; other
+    contests keep their current sample sizes.
+    """
+
+    open_cids = []
+    for mid in e.mids:
+        cid = e.cid_m[mid]
+        if e.status_tm[e.stage_time][mid] == "Open" and cid not in open_cids:
+            open_cids.append(cid)
+    e.plan_tcp[e.stage_time] = \
+        consistent_sampling.extend_plan(e, e.sn_tcp[e.stage_time], open_cids)
+    e.plan_tp[e.stage_time] = \
+        consistent_sampling.plan_sizes_p(e, e.plan_tcp[e.stage_time])
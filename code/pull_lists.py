@@ -0,0 +1,144 @@
+# pull_lists.py
+# python3
+
+"""
+Routines to work with OpenAuditTool.py on post-election audits.
+Box-grouped pull lists for audit boards.
+
+The audit order files list ballots in (pseudo)random order, but audit
+boards retrieve ballots physically, box by box.  So for each stage
+(with --pull_lists) the ballots newly selected by the plan for the
+next stage are grouped by box and sorted by position within the box,
+and a retrieval sheet is written for each box that has any of them:
+
+    3-audit
+       35-pull-lists
+          pull-list-PBCID-BOXID-STAGETIME.csv
+          ...
+
+Each row gives the ballot's box, position, stamp, and ballot id, and
+its place ("Ballot order") in the audit order, so that audited votes
+can still be matched up with the audit order.
+
+Only the selected ballots are looked up (in e.boxid_pb[pbcid] and
+e.position_pb[pbcid], which are dicts keyed by ballot id; with
+consistent sampling, also in the per-contest and audit-order position
+maps of consistent_sampling.py, which are computed once), so the work
+is proportional to the number of ballots to pull, not to the size of
+the collection's manifest.
+"""
+
+import csv
+import os
+
+import audit_orders
+import consistent_sampling
+import ids
+import utils
+
+
+PULL_LIST_FIELDNAMES = ["Collection",
+                        "Box",
+                        "Position",
+                        "Stamp",
+                        "Ballot id",
+                        "Ballot order",
+                        "Comments"]
+
+
+def position_key(position):
+    """
+    Return sort key for ballot position (a string) within a box:
+    numeric positions first, in numeric order, then any others.
+    """
+
+    s = str(position)
+    if s.isdigit():
+        return (0, int(s), s)
+    return (1, 0, s)
+
+
+def stage_bids(e, pbcid):
+    """
+    Return list of (order, bid) pairs for the ballots of pbcid that the
+    plan made at stage e.stage_time selects for the next stage (and that
+    have not been sampled already), where order is the ballot's place in
+    the audit order of pbcid.
+    """
+
+    t = e.stage_time
+    if e.consistent_sampling:
+        # walk each contest's ballots between its old and new sample sizes
+        old_size_c = {cid: int(e.sn_tcp[t][cid][pbcid])
+                      for cid in e.sn_tcp[t] if pbcid in e.sn_tcp[t][cid]}
+        ordinal_c = {cid: consistent_sampling.contest_ordinals(e, cid, pbcid)
+                     for cid in old_size_c}
+        order_b = consistent_sampling.priority_ordinals(e, pbcid)
+        new_order_b = {}
+        for cid in e.plan_tcp[t]:
+            if pbcid not in e.plan_tcp[t][cid]:
+                continue
+            bids = consistent_sampling.contest_bids(e, cid, pbcid)
+            for bid in bids[old_size_c.get(cid, 0):int(e.plan_tcp[t][cid][pbcid])]:
+                if bid not in new_order_b and \
+                   not any(ordinal_c[cid2].get(bid, old_size_c[cid2]) < old_size_c[cid2]
+                           for cid2 in old_size_c):
+                    new_order_b[bid] = order_b[bid]
+        return sorted((i, bid) for (bid, i) in new_order_b.items())
+    start = int(e.sn_tp[t][pbcid])
+    stop = int(e.plan_tp[t][pbcid])
+    audit_orders.ensure_audit_order(e, pbcid, stop)
+    return list(enumerate(e.shuffled_bids_p[pbcid][start:stop], start))
+
+
+def group_by_box(e, pbcid, order_bids):
+    """
+    Return dict mapping each boxid to the list of (order, bid) pairs of
+    order_bids for ballots in that box, sorted by position in the box.
+    The boxids are in sorted order (numeric ones numerically).
+    """
+
+    boxid_b = e.boxid_pb[pbcid]
+    position_b = e.position_pb[pbcid]
+    box_d = {}
+    for (i, bid) in order_bids:
+        box_d.setdefault(boxid_b[bid], []).append((i, bid))
+    for boxid in box_d:
+        box_d[boxid].sort(key=lambda pair: (position_key(position_b[pair[1]]), pair[0]))
+    return {boxid: box_d[boxid] for boxid in sorted(box_d, key=position_key)}
+
+
+def write_pull_lists(e):
+    """
+    Write pull lists (one per box) for the ballots selected for the next
+    stage, to 3-audit/35-pull-lists/pull-list-PBCID-BOXID-STAGETIME.csv
+    """
+
+    dirpath = os.path.join(e.ctx.elections_root, e.election_dirname,
+                           "3-audit", "35-pull-lists")
+    os.makedirs(dirpath, exist_ok=True)
+    for pbcid in e.pbcids:
+        box_d = group_by_box(e, pbcid, stage_bids(e, pbcid))
+        safe_pbcid = ids.filename_safe(pbcid)
+        for boxid in box_d:
+            filename = os.path.join(dirpath,
+                                    "pull-list-"+safe_pbcid+"-"+ids.filename_safe(boxid)
+                                    +"-"+e.stage_time+".csv")
+            write_pull_list(e, pbcid, boxid, box_d[boxid], filename)
+    utils.invalidate_dir_index(e.ctx, dirpath)
+
+
+def write_pull_list(e, pbcid, boxid, order_bids, filename):
+    """
+    Write pull list for box boxid of pbcid, listing the ballots of
+    order_bids (a list of (order, bid) pairs), to file filename.
+    """
+
+    position_b = e.position_pb[pbcid]
+    stamp_b = e.stamp_pb[pbcid]
+    comments_b = e.comments_pb[pbcid]
+    with open(filename, "w", newline="") as file:
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow(PULL_LIST_FIELDNAMES)
+        writer.writerows([pbcid, boxid, position_b[bid], stamp_b[bid], bid, i, comments_b[bid]]
+                         for (i, bid) in order_bids)
@@ -33,12 +33,15 @@ There are three file types here:
 See associated file README for file formats.
 """
 
+import concurrent.futures
 import logging
 import os
 import warnings
 
 import OpenAuditTool
 import csv_readers
+import cvr_store
+import election_db
 import ids
 import utils
 
@@ -53,8 +56,14 @@ logger = logging.getLogger(__name__)
 
 def read_reported(e):
 
-    read_reported_ballot_manifests(e)
-    read_reported_cvrs(e)
+    if e.db is not None:
+        election_db.load_reported_ballot_manifests(e)
+        election_db.load_reported_cvrs(e)
+    elif e.num_workers > 1:
+        read_reported_parallel(e)
+    else:
+        read_reported_ballot_manifests(e)
+        read_reported_cvrs(e)
     read_reported_outcomes(e)
     
     finish_reported(e)
@@ -70,59 +79,86 @@ def read_reported_ballot_manifests(e):
     Read ballot manifest file 21-reported-ballot-manifests and expand rows if needed.
     """
 
-    election_pathname = os.path.join(OpenAuditTool.ELECTIONS_ROOT, e.election_dirname)
+    for pbcid in e.pbcids:
+        rows = read_reported_ballot_manifest_rows(e, pbcid)
+        for (pbcid, bid, boxid, position, stamp, req, poss, comments) \
+            in expand_manifest_rows(rows):
+            # utils.nested_set(e.bids_p, [pbcid, bid], True)
+            if pbcid not in e.bids_p:
+                e.bids_p[pbcid] = []
+            e.bids_p[pbcid].append(bid)
+            utils.nested_set(e.boxid_pb, [pbcid, bid], boxid)
+            utils.nested_set(e.position_pb, [pbcid, bid], position)
+            utils.nested_set(e.stamp_pb, [pbcid, bid], stamp)
+            utils.nested_set(e.required_gid_pb, [pbcid, bid], req)
+            utils.nested_set(e.possible_gid_pb, [pbcid, bid], poss)
+            utils.nested_set(e.comments_pb, [pbcid, bid], comments)
+
+
+def read_reported_ballot_manifest_rows(e, pbcid):
+    """
+    Return rows of ballot manifest file 21-reported-ballot-manifests for pbcid.
+    """
+
+    election_pathname = os.path.join(e.ctx.elections_root, e.election_dirname)
     specification_pathname = os.path.join(election_pathname,
                                           "2-reported",
                                           "21-reported-ballot-manifests")
     fieldnames = ["Collection", "Box", "Position", "Stamp", 
                   "Ballot id", "Number of ballots",
                   "Required Contests", "Possible Contests", "Comments"]
-    for pbcid in e.pbcids:
-        safe_pbcid = ids.filename_safe(pbcid)
-        filename = utils.greatest_name(specification_pathname,
-                                       "manifest-" + safe_pbcid,
-                                       ".csv")
-        file_pathname = os.path.join(specification_pathname, filename)
-        rows = csv_readers.read_csv_file(file_pathname, fieldnames, varlen=False)
-        for row in rows:
-            pbcid = row["Collection"]
-            boxid = row["Box"]
-            position = row["Position"]
-            stamp = row["Stamp"]
-            bid = row["Ballot id"]
-            try:
-                num = int(row["Number of ballots"])
-            except ValueError as e:
-                raise ValueError("Number {} of ballots not an integer.".format(num)) from e
-            if num<=0:
-                warnings.warn("Number {} of ballots not positive.".format(num))
-            req = row["Required Contests"]
-            poss = row["Possible Contests"]
-            comments = row["Comments"]
-
-            bids = utils.count_on(bid, num)
-            stamps = utils.count_on(stamp, num)
-            # positions = utils.count_on(position, num)
-
-            for i in range(num):
-                # utils.nested_set(e.bids_p, [pbcid, bids[i]], True)
-                if pbcid not in e.bids_p:
-                    e.bids_p[pbcid] = []
-                e.bids_p[pbcid].append(bids[i])
-                utils.nested_set(e.boxid_pb, [pbcid, bids[i]], boxid)
-                utils.nested_set(e.position_pb, [pbcid, bids[i]], position[i])
-                utils.nested_set(e.stamp_pb, [pbcid, bids[i]], stamps[i])
-                utils.nested_set(e.required_gid_pb, [pbcid, bids[i]], req)
-                utils.nested_set(e.possible_gid_pb, [pbcid, bids[i]], poss)
-                utils.nested_set(e.comments_pb, [pbcid, bids[i]], comments)
+    safe_pbcid = ids.filename_safe(pbcid)
+    filename = utils.greatest_name(specification_pathname,
+                                   "manifest-" + safe_pbcid,
+                                   ".csv",
+                                   ctx=e.ctx)
+    file_pathname = os.path.join(specification_pathname, filename)
+    return csv_readers.read_csv_file(file_pathname, fieldnames, varlen=False)
+
+
+def expand_manifest_rows(rows):
+    """
+    Expand ballot manifest rows into one tuple per ballot.
+
+    Yields tuples (pbcid, bid, boxid, position, stamp, req, poss, comments),
+    expanding rows having "Number of ballots" > 1 into several ballots.
+    """
+
+    for row in rows:
+        pbcid = row["Collection"]
+        boxid = row["Box"]
+        position = row["Position"]
+        stamp = row["Stamp"]
+        bid = row["Ballot id"]
+        try:
+            num = int(row["Number of ballots"])
+        except ValueError as e:
+            raise ValueError("Number {} of ballots not an integer."
+                             .format(row["Number of ballots"])) from e
+        if num<=0:
+            warnings.warn("Number {} of ballots not positive.".format(num))
+        req = row["Required Contests"]
+        poss = row["Possible Contests"]
+        comments = row["Comments"]
+
+        bids = utils.count_on(bid, num)
+        stamps = utils.count_on(stamp, num)
+        positions = utils.count_on(position, num)
+
+        for i in range(num):
+            yield (pbcid, bids[i], boxid, positions[i], stamps[i],
+                   req, poss, comments)
                           
 
 def read_reported_cvrs(e):
     """
     Read reported votes 22-reported-cvrs/reported-cvrs-PBCID.csv.
+
+    If a collection has an up-to-date CVR store (see cvr_store.py),
+    its votes are taken from the store instead of the csv file.
     """
 
-    election_pathname = os.path.join(OpenAuditTool.ELECTIONS_ROOT, e.election_dirname)
+    election_pathname = os.path.join(e.ctx.elections_root, e.election_dirname)
     specification_pathname = os.path.join(election_pathname,
                                           "2-reported","22-reported-cvrs")
     fieldnames = ["Collection", "Scanner", "Ballot id",
@@ -131,8 +167,11 @@ def read_reported_cvrs(e):
         safe_pbcid = ids.filename_safe(pbcid)
         filename = utils.greatest_name(specification_pathname,
                                        "reported-cvrs-" + safe_pbcid,
-                                       ".csv")
+                                       ".csv",
+                                       ctx=e.ctx)
         file_pathname = os.path.join(specification_pathname, filename)
+        if cvr_store.read_cvr_store(e, pbcid, file_pathname):
+            continue
         rows = csv_readers.read_csv_file(file_pathname, fieldnames, varlen=True)
         for row in rows:
             pbcid = row["Collection"]
@@ -145,15 +184,113 @@ def read_reported_cvrs(e):
             utils.nested_set(e.votes_c, [cid, vote], True)
 
 
+##############################################################################
+# Parallel (per-collection) ingestion of manifests and CVRs
+
+# Attributes of an Election filled in by read_reported_ballot_manifests,
+# all keyed first by pbcid.
+MANIFEST_ATTRIBUTES = ["boxid_pb", "position_pb", "stamp_pb",
+                       "required_gid_pb", "possible_gid_pb", "comments_pb"]
+
+
+def read_reported_collection(elections_root, election_dirname, pbcid):
+    """
+    Read ballot manifest and reported CVRs for the single collection pbcid.
+
+    This is the unit of work for read_reported_parallel, run in a worker
+    process.  It uses the same sequential readers, on a scratch Election
+    whose only collection is pbcid, and returns a dict with:
+        "bids_p", MANIFEST_ATTRIBUTES, "rv_cpb", "votes_c"
+                  as the readers set them in the scratch Election
+        "rn_cpr"  partial counts cid->pbcid->rv->count for the ballots
+                  of this collection, or {} if the files have rows for
+                  other collections (so counts would be incomplete)
+        "cvr_store" sidecar index of the CVR store the reported votes came
+                  from, or None if they were read from the csv file
+    """
+
+    w = OpenAuditTool.Election()
+    w.ctx.elections_root = elections_root
+    w.election_dirname = election_dirname
+    w.pbcids = [pbcid]
+    read_reported_ballot_manifests(w)
+    read_reported_cvrs(w)
+
+    result = {"bids_p": w.bids_p,
+              "rv_cpb": w.rv_cpb,
+              "votes_c": w.votes_c,
+              "rn_cpr": {},
+              "cvr_store": w.cvr_store_p.get(pbcid)}
+    for attribute in MANIFEST_ATTRIBUTES:
+        result[attribute] = getattr(w, attribute)
+    if set(w.bids_p) == {pbcid} and \
+       all(set(w.rv_cpb[cid]) == {pbcid} for cid in w.rv_cpb):
+        for cid in w.rv_cpb:
+            utils.nested_set(result["rn_cpr"], [cid, pbcid],
+                             count_reported_votes(w.bids_p[pbcid],
+                                                  w.rv_cpb[cid][pbcid]))
+    return result
+
+
+def read_reported_parallel(e):
+    """
+    Read ballot manifests and reported CVRs, one collection per task,
+    in a pool of e.num_workers worker processes.
+
+    The per-collection results are merged in e.pbcids order, manifests
+    first and then CVRs, so that the Election ends up exactly as
+    read_reported_ballot_manifests followed by read_reported_cvrs would
+    leave it.  Partial counts of reported votes are kept in
+    e.rn_cpr_partial for use by compute_rn_cpr.
+    """
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=e.num_workers) as executor:
+        results = list(executor.map(read_reported_collection,
+                                    [e.ctx.elections_root] * len(e.pbcids),
+                                    [e.election_dirname] * len(e.pbcids),
+                                    e.pbcids))
+
+    for result in results:
+        for pbcid in result["bids_p"]:
+            e.bids_p.setdefault(pbcid, []).extend(result["bids_p"][pbcid])
+        for attribute in MANIFEST_ATTRIBUTES:
+            de = getattr(e, attribute)
+            for pbcid, d in result[attribute].items():
+                de.setdefault(pbcid, {}).update(d)
+
+    for pbcid, result in zip(e.pbcids, results):
+        for cid in result["rv_cpb"]:
+            for pbcid2, d in result["rv_cpb"][cid].items():
+                e.rv_cpb.setdefault(cid, {}).setdefault(pbcid2, {}).update(d)
+        for cid in result["votes_c"]:
+            e.votes_c.setdefault(cid, {}).update(result["votes_c"][cid])
+        if result["cvr_store"] is not None:
+            e.cvr_store_p[pbcid] = result["cvr_store"]
+
+    # Partial counts are only good if no other collection's files had
+    # rows for this collection.
+    foreign = set()
+    for pbcid, result in zip(e.pbcids, results):
+        foreign.update(set(result["bids_p"]) - {pbcid})
+        for cid in result["rv_cpb"]:
+            foreign.update(set(result["rv_cpb"][cid]) - {pbcid})
+    for pbcid, result in zip(e.pbcids, results):
+        if pbcid not in foreign:
+            for cid in result["rn_cpr"]:
+                utils.nested_set(e.rn_cpr_partial, [cid, pbcid],
+                                 result["rn_cpr"][cid][pbcid])
+
+
 def read_reported_outcomes(e):
 
-    election_pathname = os.path.join(OpenAuditTool.ELECTIONS_ROOT, e.election_dirname)
+    election_pathname = os.path.join(e.ctx.elections_root, e.election_dirname)
     specification_pathname = os.path.join(election_pathname,
                                           "2-reported")
     fieldnames = ["Contest", "Winner(s)"]
     filename = utils.greatest_name(specification_pathname,
                                    "23-reported-outcomes",
-                                   ".csv")
+                                   ".csv",
+                                   ctx=e.ctx)
     file_pathname = os.path.join(specification_pathname, filename)
     rows = csv_readers.read_csv_file(file_pathname, fieldnames, varlen=True)
     for row in rows:
@@ -178,17 +315,35 @@ def check_reported_selids(e):
                     if ids.is_writein(selid) or ids.is_error_selid(selid):
                         e.selids_c[cid][selid] = True
 
+def count_reported_votes(bids, rv_b):
+    """ 
+    Return dict mapping each reported vote to number of bids (from list bids)
+    having that reported vote in rv_b (a dict bid->vote).
+    """
+
+    counts = {}
+    for bid in bids:
+        if bid in rv_b:
+            rv = rv_b[bid]
+            counts[rv] = counts.get(rv, 0) + 1
+    return counts
+
+
 def compute_rn_cpr(e):
-    """ Set e.rn_cpr[cid][pbcid][rv] to number in pbcid with reported vote rv. """
+    """ 
+    Set e.rn_cpr[cid][pbcid][rv] to number in pbcid with reported vote rv. 
+
+    Uses partial counts from e.rn_cpr_partial where they are available
+    (see read_reported_parallel), and counts from e.rv_cpb otherwise.
+    """
 
     for cid in e.cids:
         e.rn_cpr[cid] = {}
         for pbcid in e.possible_pbcid_c[cid]:
-            e.rn_cpr[cid][pbcid] = {}
-            for rv in e.votes_c[cid]:
-                e.rn_cpr[cid][pbcid][rv] = len([bid for bid in e.bids_p[pbcid]
-                                                if bid in e.rv_cpb[cid][pbcid] and \
-                                                e.rv_cpb[cid][pbcid][bid] == rv])
+            counts = e.rn_cpr_partial.get(cid, {}).get(pbcid)
+            if counts is None:
+                counts = count_reported_votes(e.bids_p[pbcid], e.rv_cpb[cid][pbcid])
+            e.rn_cpr[cid][pbcid] = {rv: counts.get(rv, 0) for rv in e.votes_c[cid]}
 
 
 def compute_rn_c(e):    
@@ -236,9 +391,12 @@ def finish_reported(e):
     or that need conversion (e.g. strings-->tuples from json keys).
     """
 
-    check_reported_selids(e)
-
-    compute_rn_cpr(e)
+    if e.db is not None:
+        election_db.check_reported_selids(e)
+        election_db.compute_rn_cpr(e)
+    else:
+        check_reported_selids(e)
+        compute_rn_cpr(e)
     compute_rn_c(e)    
     compute_rn_p(e)
     compute_rn_cr(e)
@@ -324,38 +482,42 @@ def check_reported(e):
         if cid not in e.rn_cr:
             warnings.warn("cid `{}` is not a key for e.rn_cr".format(cid))
 
-    if not isinstance(e.bids_p, dict):
-        raise ValueError("e.bids_p is not a dict.")
-    for pbcid in e.pbcids:
-        # if not isinstance(e.bids_p[pbcid], dict):
-        #     raise ValueError("e.bids_p[{}] is not a dict.".format(pbcid))
-        if not isinstance(e.bids_p[pbcid], list):
-            raise ValueError("e.bids_p[{}] is not a list.".format(pbcid))
-
-    if not isinstance(e.rv_cpb, dict):
-        raise ValueError("e.rv_cpb is not a dict.")
-    for cid in e.rv_cpb:
-        if cid not in e.cids:
-            warnings.warn("e.rv_cpb key `{}` is not in e.cids.".format(cid))
-        for pbcid in e.rv_cpb[cid]:
-            if pbcid not in e.pbcids:
-                warnings.warn("e.rv_cpb[{}] key `{}` is not in e.pbcids."
-                              .format(cid, pbcid))
-            if not isinstance(e.rv_cpb[cid][pbcid], dict):
-                raise ValueError("e.rv_cpb[{}][{}] is not a dict.".format(cid, pbcid))
-            bidsset = set(e.bids_p[pbcid])
-            for bid in e.rv_cpb[cid][pbcid]:
-                if bid not in bidsset:
-                    warnings.warn("bid `{}` from e.rv_cpb[{}][{}] is not in e.bids_p[{}]."
-                                  .format(bid, cid, pbcid, pbcid))
-    for cid in e.cids:
-        if cid not in e.rv_cpb:
-            warnings.warn("cid `{}` is not a key in e.rv_cpb.".format(cid))
-        for pbcid in e.possible_pbcid_c[cid]:
-            if pbcid not in e.rv_cpb[cid]:
-                warnings.warn(("pbcid `{}` from e.possible_pbcid_c[{}] "
-                               "is not a key for e.rv_cpb[{}].")
-                               .format(pbcid, cid, cid))
+    if e.db is not None:
+        # per-ballot data is in the election database, not in e
+        election_db.check_reported(e)
+    else:
+        if not isinstance(e.bids_p, dict):
+            raise ValueError("e.bids_p is not a dict.")
+        for pbcid in e.pbcids:
+            # if not isinstance(e.bids_p[pbcid], dict):
+            #     raise ValueError("e.bids_p[{}] is not a dict.".format(pbcid))
+            if not isinstance(e.bids_p[pbcid], list):
+                raise ValueError("e.bids_p[{}] is not a list.".format(pbcid))
+
+        if not isinstance(e.rv_cpb, dict):
+            raise ValueError("e.rv_cpb is not a dict.")
+        for cid in e.rv_cpb:
+            if cid not in e.cids:
+                warnings.warn("e.rv_cpb key `{}` is not in e.cids.".format(cid))
+            for pbcid in e.rv_cpb[cid]:
+                if pbcid not in e.pbcids:
+                    warnings.warn("e.rv_cpb[{}] key `{}` is not in e.pbcids."
+                                  .format(cid, pbcid))
+                if not isinstance(e.rv_cpb[cid][pbcid], dict):
+                    raise ValueError("e.rv_cpb[{}][{}] is not a dict.".format(cid, pbcid))
+                bidsset = set(e.bids_p[pbcid])
+                for bid in e.rv_cpb[cid][pbcid]:
+                    if bid not in bidsset:
+                        warnings.warn("bid `{}` from e.rv_cpb[{}][{}] is not in e.bids_p[{}]."
+                                      .format(bid, cid, pbcid, pbcid))
+        for cid in e.cids:
+            if cid not in e.rv_cpb:
+                warnings.warn("cid `{}` is not a key in e.rv_cpb.".format(cid))
+            for pbcid in e.possible_pbcid_c[cid]:
+                if pbcid not in e.rv_cpb[cid]:
+                    warnings.warn(("pbcid `{}` from e.possible_pbcid_c[{}] "
+                                   "is not a key for e.rv_cpb[{}].")
+                                   .format(pbcid, cid, cid))
 
     if not isinstance(e.ro_c, dict):
         raise ValueError("e.ro_c is not a dict.")
@@ -16,11 +16,13 @@ implemented, and may require a significant change to the code base.
 """
 
 import copy
+import hashlib
 import logging
 import numpy as np
 
-import audit
 import outcomes
+import rng
+import scheduler
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -32,7 +34,8 @@ logger = logging.getLogger(__name__)
 # https://docs.scipy.org/doc/numpy-1.11.0/reference/generated/numpy.random.gamma.html
 # from numpy.random import gamma
 # To generate random gamma variate with mean k:
-# gamma(k)  or rs.gamma(k) where rs is a numpy.random.RandomState object
+# gamma(k)  or rs.gamma(k) where rs is a numpy.random.Generator object
+# (see rng.py)
 # This routine is used primarily to allow efficient generation of Dirichlet
 # posterior distributions.
 
@@ -43,11 +46,13 @@ def gamma(k, rs=None):
 
     Differs from standard gamma distribution implementation
     in that that it allows k==0, and returns 0 in that case.
-    Parameter rs, if present, is a numpy.random.RandomState object.
+    Parameter rs, if present, is a numpy.random.Generator (normally a
+    substream of e.ctx.rng) or RandomState object; otherwise numpy's
+    global random state is used.
     """
 
     if rs == None:
-        rs = audit.auditRandomState
+        rs = np.random
     if k <= 0.0:
         return 0.0
     else:
@@ -56,7 +61,7 @@ def gamma(k, rs=None):
 
 # Dirichlet distribution
 
-def dirichlet(tally):
+def dirichlet(tally, rs=None):
     """ 
     Given tally dict mapping votes (tuples of selids) to counts, 
     return dict mapping those votes to elements of Dirichlet distribution sample on
@@ -71,11 +76,13 @@ def dirichlet(tally):
         dir       dict mapping votes (tuples of selids) to reals (probabilities)
                   probabilities are real and sum to one.
                   The domain of dir is identical to the domain of tally.
+
+    Parameter rs is as for gamma.
     """
 
     # Use 'sorted' to make sure order of applying gamma is deterministic,
     # for reproducibility, since gamma is randomized.
-    dir = {vote: gamma(tally[vote]) for vote in sorted(tally)}
+    dir = {vote: gamma(tally[vote], rs) for vote in sorted(tally)}
 
     total = sum(dir.values())
     dir = {vote: dir[vote] / total for vote in dir}
@@ -84,7 +91,7 @@ def dirichlet(tally):
 
 # Multinomial distribution
 
-def multinomial(n, ps):
+def multinomial(n, ps, rs=None):
     """
     Given nonnegative value n (typically an int) and a dict ps of probabilities, 
     return sample of size n drawn according to multinomial distribution defined with the 
@@ -116,8 +123,12 @@ def multinomial(n, ps):
     Example:
            multinomial(100.5, {'A':0.6, 'B':0.4}) ==> {'A':70.3, 'B':30.2}
 
+    Parameter rs is as for gamma.
     """
 
+    if rs == None:
+        rs = np.random
+
     n_floor = int(n)
     n_frac = n - n_floor
     # Use 'sorted' here to ensure that computations are reproducible --
@@ -125,7 +136,7 @@ def multinomial(n, ps):
     # (Such considerations deal with internals of np.random.multinomial...)
     votes_sorted = sorted(ps)
     ps_sorted = [ps[vote] for vote in votes_sorted]
-    multinomial_freqs_sorted = np.random.multinomial(n_floor, ps_sorted)
+    multinomial_freqs_sorted = rs.multinomial(n_floor, ps_sorted)
     freq = {vote: vote_freq
             for (vote, vote_freq)
             in zip(votes_sorted, multinomial_freqs_sorted)}
@@ -135,6 +146,45 @@ def multinomial(n, ps):
     return freq
 
 
+# Array versions, for drawing many samples at once
+
+def dirichlet_array(alphas, rs=None):
+    """
+    Array version of dirichlet: return array of Dirichlet samples, one
+    for each row (last axis) of array alphas of hyperparameters.
+    As for gamma, hyperparameters <= 0 give 0.
+
+    If the columns of alphas are the votes in sorted order, the result
+    (for a numpy Generator rs) is the same as calling dirichlet on each
+    row in turn, with the same rs.
+    """
+
+    if rs is None:
+        rs = np.random
+    g = rs.gamma(np.maximum(alphas, 0.0))
+    return g / g.sum(axis=-1, keepdims=True)
+
+
+def multinomial_array(ns, ps, rs=None):
+    """
+    Array version of multinomial: return array of multinomial samples,
+    one for each row (last axis) of array ps of probabilities, with
+    sample sizes given by ns (broadcast against the other axes of ps).
+    Non-integral sample sizes are handled as by multinomial.
+
+    As for dirichlet_array, with the columns of ps in sorted vote order
+    and a numpy Generator rs, the result is the same as calling
+    multinomial on each row in turn.
+    """
+
+    if rs is None:
+        rs = np.random
+    ns = np.asarray(ns, dtype=float)
+    n_floor = np.floor(ns)
+    freqs = rs.multinomial(n_floor.astype(np.int64), ps).astype(float)
+    return freqs + (ns - n_floor)[..., np.newaxis] * ps
+
+
 ##############################################################################
 # Dict operations
 
@@ -196,7 +246,8 @@ def compute_prior_pseudocounts(vs, rv, pseudocount_base, pseudocount_match):
     return prior_pseudocounts
     
 
-def draw_nonsample_tally(sample_tally, prior_pseudocounts, nonsample_size):
+def draw_nonsample_tally(sample_tally, prior_pseudocounts, nonsample_size,
+                         rs=None, multinomial_rs=None):
     """
     Draw from Bayesian posterior on nonsample tallies, given sample tally and prior.
 
@@ -205,14 +256,19 @@ def draw_nonsample_tally(sample_tally, prior_pseudocounts, nonsample_size):
            non_sample_size    a nonnegative integer
 
     Output: nonsample_tally   a dict mapping votes to nonnegative reals
+
+    Parameter rs is as for gamma; the multinomial draw uses
+    multinomial_rs instead, if given.
     """
 
+    if multinomial_rs == None:
+        multinomial_rs = rs
     tally = sample_tally.copy()
     add_dicts(tally, prior_pseudocounts)
 
     # Obtain Dirichlet probability distribution corresponding to
     # hyperparameters given in the tally, indexed by av
-    dirichlet_dict = dirichlet(tally)
+    dirichlet_dict = dirichlet(tally, rs)
 
     # Get multinomial sample with given probability distribution
     # (This is Dirichlet-multinomial distribution, after all.)
@@ -221,7 +277,7 @@ def draw_nonsample_tally(sample_tally, prior_pseudocounts, nonsample_size):
     # (By providing more variance.)
     # This also forces frequencies to be integer, assuming
     # nonsample_size is integer.
-    nonsample_tally = multinomial(nonsample_size, dirichlet_dict)
+    nonsample_tally = multinomial(nonsample_size, dirichlet_dict, multinomial_rs)
 
     return nonsample_tally
 
@@ -261,60 +317,199 @@ def compute_risk(e, mid, sn_tcpra, trials=None):
     of e.votes_c[cid], so that the test tallies include an estimated tally for
     this vote.  This should be conservative, but might be something to be
     eliminated someday.
+
+    Random draws come from substreams of e.ctx.rng named by cid, pbcid,
+    and block of rng.TRIAL_BLOCK_SIZE trials, with separate streams for
+    the gamma (Dirichlet) and the multinomial draws; so the trials may
+    be split up among workers, or vectorized, without changing the
+    result.  The names don't include the stage, so a collection whose
+    sample tallies for cid are unchanged from an earlier stage makes the
+    same contribution to the test tallies: that is computed once, by
+    collection_draws, and cached.
     """
 
     cid = e.cid_m[mid]
-    wrong_outcome_count = 0
     if trials == None:
         trials = e.n_trials
     vs = e.votes_c[cid]
-    for trial in range(trials):
-        test_tally = {vote: 0 for vote in vs}
-        for pbcid in sorted(e.possible_pbcid_c[cid]):
-            # Draw from posterior for each paper ballot collection, sum over pbcids.
-            # Stratify by reported vote rv within each pbcid.
-            for rv in sorted(sn_tcpra[e.stage_time][cid][pbcid]):
-
-                # Obtain stratum_size, sample_size, nonsample_size
-                stratum_size = e.rn_cpr[cid][pbcid][rv]
-                sample_size = sum([sn_tcpra[e.stage_time][cid][pbcid][rv][av]
-                                   for av in sn_tcpra[e.stage_time][cid][pbcid][rv]])
-                nonsample_size = stratum_size - sample_size     # need not be an int
-
-                # Compute sample_tally as dict of count of votes per
-                # av (actual vote) in this stratum sample, add to test_tally.
-                sample_tally = sn_tcpra[e.stage_time][cid][pbcid][rv].copy()
-                add_dicts(test_tally, sample_tally)
-
-                # Add pseudocounts for prior
-                prior_pseudocounts = \
-                    compute_prior_pseudocounts(vs,
-                                               rv,
-                                               e.pseudocount_base,
-                                               e.pseudocount_match)
-
-                # Draw nonsample_tally from posterior, add it to test tally.
-                nonsample_tally = draw_nonsample_tally(sample_tally,
-                                                       prior_pseudocounts,
-                                                       nonsample_size)
-                add_dicts(test_tally, nonsample_tally)
-
-        if e.ro_c[cid] != outcomes.compute_outcome(e, cid, test_tally):  
-            wrong_outcome_count += 1
-
-    risk = wrong_outcome_count / e.n_trials
+    pbcids = sorted(e.possible_pbcid_c[cid])
+
+    # test tallies: one row per trial, columns for the votes in sorted order
+    extra = set()
+    for pbcid in pbcids:
+        for rv in sn_tcpra[e.stage_time][cid][pbcid]:
+            extra.update(av for av in sn_tcpra[e.stage_time][cid][pbcid][rv] if av not in vs)
+    votes = list(vs) + sorted(extra)
+    sorted_votes = sorted(votes)
+    test_tallies = np.zeros((trials, len(votes)))
+    for pbcid in pbcids:
+        # Draw from posterior for each paper ballot collection, sum over pbcids.
+        test_tallies += collection_draws(e, cid, pbcid, sorted_votes,
+                                         sn_tcpra[e.stage_time][cid][pbcid], trials)
+
+    order = [sorted_votes.index(vote) for vote in votes]
+    wrong_outcome_count = sum(outcome != e.ro_c[cid]
+                              for outcome in outcomes.compute_outcomes(
+                                  e, cid, votes, test_tallies[:, order]))
+
+    risk = wrong_outcome_count / trials
     e.risk_tm[e.stage_time][mid] = risk
 
     return risk
 
 
+RISK_DRAW_CACHE_BYTES = 256 * 2**20
+# limit on memory used by cached posterior draws (e.risk_draw_cache)
+
+
+def collection_draws(e, cid, pbcid, sorted_votes, sample_ra, trials):
+    """
+    Return array (trials x len(sorted_votes)) giving, for each trial of
+    compute_risk, the contribution of collection pbcid to the test tally
+    for cid: the sample tally plus a draw of the nonsample tally from
+    the posterior, summed over reported votes rv.
+
+    Here sorted_votes is the list of votes (in sorted order) for the
+    columns, and sample_ra is the sample tally (rv->av->count) for cid
+    in pbcid.  The draws are made by draw_test_tallies_array, for each
+    block of rng.TRIAL_BLOCK_SIZE trials, from that block's substreams
+    (see risk_streams); this only adds the caching.
+
+    Results are kept in e.risk_draw_cache (up to RISK_DRAW_CACHE_BYTES,
+    least recently used ones dropped first), keyed by a digest of the
+    stratum sizes and sample tallies, the prior, the votes, the number
+    of trials, and the substreams.
+    """
+
+    rvs = sorted(sample_ra)
+    key = hashlib.sha256(repr([str(e.ctx.rng.entropy), cid, pbcid, trials, rng.TRIAL_BLOCK_SIZE,
+                               sorted_votes, e.pseudocount_base, e.pseudocount_match,
+                               sorted(e.votes_c[cid]),
+                               [(rv, e.rn_cpr[cid][pbcid][rv], sorted(sample_ra[rv].items()))
+                                for rv in rvs]]).encode("utf-8")).hexdigest()
+    if key in e.risk_draw_cache:
+        e.risk_draw_cache.move_to_end(key)
+        return e.risk_draw_cache[key]
+
+    sample_rv = {rv: [sample_ra[rv].get(vote, 0) for vote in sorted_votes] for rv in rvs}
+    draws = np.zeros((trials, len(sorted_votes)))
+    for start in range(0, trials, rng.TRIAL_BLOCK_SIZE):
+        block_trials = min(rng.TRIAL_BLOCK_SIZE, trials - start)
+        gamma_rs, multinomial_rs = risk_streams(e, cid, pbcid, start // rng.TRIAL_BLOCK_SIZE)
+        draws[start:start+block_trials] = \
+            draw_test_tallies_array(e, cid, pbcid, sorted_votes, sample_rv,
+                                    block_trials, gamma_rs, multinomial_rs)
+
+    cache_draws(e, key, draws)
+    return draws
+
+
+def cache_draws(e, key, draws):
+    """
+    Put draws (an array) in e.risk_draw_cache under key, dropping least
+    recently used entries to keep within RISK_DRAW_CACHE_BYTES.
+    """
+
+    e.risk_draw_cache[key] = draws
+    e.risk_draw_cache.move_to_end(key)
+    total = sum(d.nbytes for d in e.risk_draw_cache.values())
+    while total > RISK_DRAW_CACHE_BYTES and len(e.risk_draw_cache) > 0:
+        _, old = e.risk_draw_cache.popitem(last=False)
+        total -= old.nbytes
+
+
+def draw_test_tallies_array(e, cid, pbcid, votes, sample_rv, trials, rs=None,
+                            multinomial_rs=None):
+    """
+    Array version of the draws in compute_risk for one collection:
+    return array of test tallies for cid in pbcid (sample tally plus a
+    draw of the nonsample tally from the posterior, summed over reported
+    votes), with columns indexed by the votes in list votes.
+
+    sample_rv maps reported votes rv to arrays of sample counts (last
+    axis indexed by votes); any leading axes index independent sample
+    states (e.g. simulated audits), which share the axes of the result:
+    its shape is leading axes + (trials, len(votes)).
+    As in compute_risk, only strata with sampled ballots contribute.
+
+    Each trial draws from all strata (in sorted order of rv) at once.
+    Gamma (Dirichlet) draws come from numpy Generator rs, and multinomial
+    draws from multinomial_rs (default rs).  With votes in sorted order,
+    and no leading axes, the draws are the same as calling
+    draw_nonsample_tally for each trial and stratum in turn, with the
+    same rs and multinomial_rs.
+    """
+
+    if multinomial_rs is None:
+        multinomial_rs = rs
+    rvs = sorted(sample_rv)
+    if len(rvs) == 0:
+        return np.zeros((trials, len(votes)))
+    # sample axes: leading axes + (1, stratum, vote)
+    sample = np.stack(np.broadcast_arrays(*[np.asarray(sample_rv[rv], dtype=float)
+                                            for rv in rvs]), axis=-2)[..., np.newaxis, :, :]
+    sample_size = sample.sum(axis=-1)
+    stratum_size = np.array([e.rn_cpr[cid][pbcid][rv] for rv in rvs], dtype=float)
+    nonsample_size = np.maximum(stratum_size - sample_size, 0.0)
+    prior = np.zeros((len(rvs), len(votes)))
+    for i, rv in enumerate(rvs):
+        prior_d = compute_prior_pseudocounts(e.votes_c[cid], rv,
+                                             e.pseudocount_base,
+                                             e.pseudocount_match)
+        prior[i] = [prior_d.get(vote, 0.0) for vote in votes]
+    alphas = np.broadcast_to(sample + prior,
+                             sample.shape[:-3] + (trials, len(rvs), len(votes)))
+    ps = dirichlet_array(alphas, rs)
+    draws = sample + multinomial_array(np.broadcast_to(nonsample_size, alphas.shape[:-1]),
+                                       ps, multinomial_rs)
+    return np.where(sample_size[..., np.newaxis] > 0, draws, 0.0).sum(axis=-2)
+
+
+def risk_streams(e, cid, pbcid, block):
+    """
+    Return (gamma_rs, multinomial_rs), the random substreams used by
+    compute_risk for given cid, pbcid, and block of trials.
+    """
+
+    return (e.ctx.rng.stream("risk", cid, pbcid, block, "gamma"),
+            e.ctx.rng.stream("risk", cid, pbcid, block, "multinomial"))
+
+
 def compute_risks(e, st, trials=None):
     """
     Compute risks via all measurement approaches, for current sample.
+
+    Each measurement is a job for scheduler.run_jobs (so with
+    e.num_workers > 1 they are computed in parallel, most costly first);
+    results are the same as computing them in turn.  Posterior draws
+    cached by the jobs are merged into e.risk_draw_cache, for use at
+    later stages.
     """
 
+    if trials == None:
+        trials = e.n_trials
+    jobs = {mid: ((mid, st, trials), scheduler.contest_cost(e, e.cid_m[mid], st, trials))
+            for mid in e.mids}
+    results = scheduler.run_jobs(e, "risk", risk_job, jobs)
     for mid in e.mids:
-        compute_risk(e, mid, st, trials)
+        risk, draws_k = results[mid]
+        e.risk_tm[e.stage_time][mid] = risk
+        for key in draws_k:
+            cache_draws(e, key, draws_k[key])
+
+
+def risk_job(e, mid, st, trials):
+    """
+    Compute risk for mid (as compute_risk); return (risk, draws_k),
+    where draws_k gives the entries added to e.risk_draw_cache (which
+    would otherwise be lost when run in a worker process).
+    """
+
+    before = set(e.risk_draw_cache)
+    risk = compute_risk(e, mid, st, trials)
+    draws_k = {key: e.risk_draw_cache[key]
+               for key in e.risk_draw_cache if key not in before}
+    return risk, draws_k
 
 
 def compute_slack_p(e):
@@ -0,0 +1,72 @@
+# rng.py
+# python3
+
+"""
+Routines to work with OpenAuditTool.py on post-election audits.
+Seeded random number service with named substreams.
+
+All randomness used by an audit comes from an RNG object (kept in the
+audit context, as e.ctx.rng), built on numpy.random.Generator with the
+PCG64 bit generator, and seeded (via numpy.random.SeedSequence) from
+the audit seed.
+
+Rather than one stream whose draws depend on the order in which all
+of the audit's computations happen to be done, the RNG hands out
+independent *named* substreams:
+
+    rs = e.ctx.rng.stream("risk", cid, pbcid, block, "gamma")
+
+Each name component (a str, int, or tuple of these) is hashed (SHA-256
+of its repr, so that e.g. 0 and "0" differ) into a word of the
+SeedSequence spawn key, so the substream depends only on the audit
+seed and the names -- not on what other streams were used before, or
+in which process.  Hence a computation split into named
+pieces (e.g. risk trials split into blocks of TRIAL_BLOCK_SIZE trials,
+per contest and collection) gives the same result whether the pieces
+are computed sequentially, in parallel workers, or vectorized (numpy
+array draws consume a stream in the same order as the corresponding
+sequence of scalar draws).
+"""
+
+import hashlib
+
+import numpy as np
+
+
+TRIAL_BLOCK_SIZE = 1000
+# number of risk trials drawn from one substream
+
+
+def name_key(name):
+    """ Return 64-bit integer spawn-key word for substream name component name. """
+
+    digest = hashlib.sha256(repr(name).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+class RNG(object):
+    """ Random number service for one audit, seeded from the audit seed. """
+
+    def __init__(self, audit_seed=None):
+        """
+        audit_seed is an arbitrarily large nonnegative integer (or
+        string of digits), or None to seed from fresh OS entropy
+        (recorded in self.entropy, so the run can still be reproduced).
+        """
+
+        self.audit_seed = audit_seed
+        self.seed_sequence = np.random.SeedSequence(
+            None if audit_seed is None else int(audit_seed))
+        self.entropy = self.seed_sequence.entropy
+
+    def seed_sequence_for(self, *names):
+        """ Return SeedSequence for substream with given name components. """
+
+        return np.random.SeedSequence(self.entropy,
+                                      spawn_key=tuple(name_key(name)
+                                                      for name in names))
+
+    def stream(self, *names):
+        """ Return new numpy Generator for substream with given name components. """
+
+        return np.random.Generator(np.random.PCG64(self.seed_sequence_for(*names)))
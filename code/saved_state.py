@@ -6,7 +6,7 @@
 import json
 import os
 
-import OpenAuditTool
+import consistent_sampling
 import utils
 
 
@@ -26,6 +26,13 @@ def write_initial_saved_state(e):
     for pbcid in e.pbcids:
         e.plan_tp[initial_stage_time][pbcid] = int(e.max_audit_rate_p[pbcid])
 
+    if e.consistent_sampling:
+        e.sn_tcp[initial_stage_time] = {cid: {pbcid: 0 for pbcid in e.possible_pbcid_c[cid]}
+                                        for cid in e.cids}
+        e.plan_tcp[initial_stage_time] = consistent_sampling.initial_plan_tcp(e)
+        e.plan_tp[initial_stage_time] = \
+            consistent_sampling.plan_sizes_p(e, e.plan_tcp[initial_stage_time])
+
     e.status_tm[initial_stage_time] = {}
     for mid in e.mids:                                
         # initial contest state
@@ -37,6 +44,9 @@ def write_initial_saved_state(e):
     ss["sn_tp"] = e.sn_tp             # sample sizes, by stage and pbcid
     ss["status_tm"] = e.status_tm     # measurement statuses, by stage and mid
     ss["plan_tp"] = e.plan_tp         # plan for next stage of audit
+    if e.consistent_sampling:
+        ss["sn_tcp"] = e.sn_tcp       # sample sizes, by stage, cid and pbcid
+        ss["plan_tcp"] = e.plan_tcp   # plan for next stage, by cid and pbcid
 
     write_state(e, ss)
 
@@ -53,6 +63,9 @@ def write_intermediate_saved_state(e):
     ss["sn_tp"] = e.sn_tp             # sample sizes, by stage and pbcid
     ss["status_tm"] = e.status_tm     # measurement statuses, by stage and mid
     ss["plan_tp"] = e.plan_tp         # plan for next stage of audit
+    if e.consistent_sampling:
+        ss["sn_tcp"] = e.sn_tcp       # sample sizes, by stage, cid and pbcid
+        ss["plan_tcp"] = e.plan_tcp   # plan for next stage, by cid and pbcid
 
     write_state(e, ss)
 
@@ -64,9 +77,17 @@ def write_state(e, ss):
     Data ss saved is needed in the next audit stage.
     ss is a dict with the saved-state information, including
     the stage_time.
+
+    When simulating, ss is (also) kept in memory, as e.saved_state_ss.
     """
 
-    dirpath = os.path.join(OpenAuditTool.ELECTIONS_ROOT,
+    if e.simulate:
+        # json round trip, so reading it back is just like reading the file
+        e.saved_state_ss = json.loads(json.dumps(ss))
+        if not e.write_outputs:
+            return
+
+    dirpath = os.path.join(e.ctx.elections_root,
                            e.election_dirname,
                            "3-audit",
                            "34-audit-output")
@@ -76,20 +97,27 @@ def write_state(e, ss):
 
     with open(filename, "w") as file:
         json.dump(ss, file, indent=2)
+    utils.invalidate_dir_index(e.ctx, dirpath)
 
 
 def read_saved_state(e):
     """
     Read state from latest 3-audit/34-audit-output/audit-output-saved-state.json 
+    (or from memory, when simulating).
     """
 
-    dirpath = os.path.join(OpenAuditTool.ELECTIONS_ROOT,
+    if e.simulate and e.saved_state_ss is not None:
+        e.saved_state = json.loads(json.dumps(e.saved_state_ss))
+        return
+
+    dirpath = os.path.join(e.ctx.elections_root,
                            e.election_dirname,
                            "3-audit",
                            "34-audit-output")
     filename = utils.greatest_name(dirpath,
                                    "audit-output-saved-state",
-                                   ".json")
+                                   ".json",
+                                   ctx=e.ctx)
     file_pathname = os.path.join(dirpath, filename)
     file = open(file_pathname, "r")
 
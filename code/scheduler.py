@@ -0,0 +1,137 @@
+# scheduler.py
+# python3
+
+"""
+Routines to work with OpenAuditTool.py on post-election audits.
+Cost-aware scheduling of per-measurement (or per-contest) jobs on a
+pool of worker processes.
+
+Measurements differ widely in cost: a trial for a 20-candidate IRV
+contest costs orders of magnitude more than one for a yes/no measure.
+Risk measurement (risk_bayes.compute_risks) and the response curves of
+the joint allocation (allocation.joint_allocation) are therefore run
+as jobs, one per measurement (or contest), by run_jobs:
+
+    -- each job's cost is estimated (contest_cost) from the size of the
+       contest's vote universe, its outcome rule, the number of strata
+       (collection, reported vote) it is drawn from, and the number of
+       trials;
+
+    -- with e.num_workers > 1, the jobs are submitted longest first
+       (LPT order) to a pool of worker processes, which take the next
+       job from the shared queue whenever they finish one; so a worker
+       that drew cheap jobs takes on more of them, and the expensive
+       jobs don't end up last, on one worker;
+
+    -- each job's wall-clock time (and the worker that ran it) is
+       recorded in e.job_times_k[kind] and logged.
+
+Where processes are started by fork (the default on Linux), the
+Election e is put in a module global before the pool starts, so the
+workers inherit it and e is not pickled for each job; otherwise e is
+sent with each job.
+The jobs must not depend on each other or on their order: e.g. risks
+are computed from random substreams named by contest and collection
+(see rng.py), so they are the same however the jobs are scheduled.
+Results are returned to the parent, which must store any it needs
+(a job's side effects on e in a worker are lost).
+"""
+
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+# Election e in a worker process (inherited, when forked; see run_jobs)
+worker_e = None
+
+
+def run_job(func, args, e=None):
+    """
+    Run func(e, *args) in a worker, with e defaulting to worker_e;
+    return (result, seconds, worker pid).
+    """
+
+    if e is None:
+        e = worker_e
+    start = time.perf_counter()
+    result = func(e, *args)
+    return result, time.perf_counter() - start, os.getpid()
+
+
+def contest_cost(e, cid, sn_tcpra, trials):
+    """
+    Return estimate of the cost (in arbitrary units) of trials draws of
+    a test tally for contest cid from sample tallies sn_tcpra (as for
+    risk_bayes.compute_risk), and its outcome.
+
+    Each trial draws from each stratum (collection and reported vote)
+    with sampled ballots, over the votes of the contest, and then
+    computes the outcome: for IRV, elimination rounds (one per
+    candidate, at most) over all the votes.
+    """
+
+    num_votes = len(e.votes_c[cid])
+    num_strata = sum(len(sn_tcpra[e.stage_time][cid][pbcid])
+                     for pbcid in e.possible_pbcid_c[cid]
+                     if pbcid in sn_tcpra[e.stage_time][cid])
+    if e.contest_type_c[cid].lower() == "irv":
+        # IRV selids are "RANK-CANDIDATE" (see outcomes.IRV)
+        candidates = set(selid.split("-", 1)[-1] for vote in e.votes_c[cid] for selid in vote)
+        outcome_cost = num_votes * len(candidates)
+    else:
+        outcome_cost = num_votes
+    return trials * (num_strata * num_votes + outcome_cost)
+
+
+def run_jobs(e, kind, func, jobs):
+    """
+    Run jobs, a dict mapping job names to (args, cost) pairs, as
+    func(e, *args), longest (highest estimated cost) first, in a pool of
+    e.num_workers worker processes (or in this process, if e.num_workers
+    is 1).  Return dict mapping job names to results.
+
+    Job times are put in e.job_times_k[kind], as a list of dicts (in
+    the order run), and logged.
+    """
+
+    names = sorted(jobs, key=lambda name: -jobs[name][1])
+    results = {}
+    times = []
+    wall_start = time.perf_counter()
+    if e.num_workers > 1 and len(names) > 1:
+        global worker_e
+        forked = multiprocessing.get_start_method() == "fork"
+        worker_e = e
+        try:
+            with concurrent.futures.ProcessPoolExecutor(
+                    max_workers=min(e.num_workers, len(names))) as executor:
+                futures = [executor.submit(run_job, func, jobs[name][0],
+                                           None if forked else e)
+                           for name in names]
+                for name, future in zip(names, futures):
+                    results[name], seconds, worker = future.result()
+                    times.append({"job": name, "cost": jobs[name][1],
+                                  "seconds": seconds, "worker": worker})
+        finally:
+            worker_e = None
+    else:
+        for name in names:
+            start = time.perf_counter()
+            results[name] = func(e, *jobs[name][0])
+            times.append({"job": name, "cost": jobs[name][1],
+                          "seconds": time.perf_counter() - start, "worker": os.getpid()})
+    wall = time.perf_counter() - wall_start
+
+    e.job_times_k[kind] = times
+    if len(times) > 0:
+        slowest = max(times, key=lambda t: t["seconds"])
+        logger.info("%s jobs: %d jobs, %d worker(s), %.3f s (job total %.3f s; slowest %s %.3f s)",
+                    kind, len(times), max(1, min(e.num_workers, len(times))), wall,
+                    sum(t["seconds"] for t in times), slowest["job"], slowest["seconds"])
+    return results
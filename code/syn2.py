@@ -130,11 +130,12 @@ def read_syn2_csv(e, synpar):
     Read file defining syn2 synthetic election spec. 
     """
 
-    syn2_pathname = os.path.join(OpenAuditTool.ELECTIONS_ROOT, 
+    syn2_pathname = os.path.join(e.ctx.elections_root, 
                                  "syn2_specs")
     filename = utils.greatest_name(syn2_pathname,
                                    synpar.election_dirname,
-                                   ".csv")
+                                   ".csv",
+                                   ctx=e.ctx)
     file_pathname = os.path.join(syn2_pathname, filename)
     fieldnames = ["Contest",
                   "Collection",
@@ -180,18 +180,19 @@ def read_meta_csv(e, synpar):
     """
     Read file defining syn3 synthetic election spec.
     """
-    syn3_pathname = os.path.join(OpenAuditTool.ELECTIONS_ROOT,
+    syn3_pathname = os.path.join(e.ctx.elections_root,
                                  "syn3_specs", synpar.election_dirname)
     try:
         # Use config dir if properly defined
         if synpar.config_dirname is not None:
-            syn3_pathname = os.path.join(OpenAuditTool.ELECTIONS_ROOT,
+            syn3_pathname = os.path.join(e.ctx.elections_root,
                                          "syn3_specs", synpar.config_dirname)
     except NameError:
         pass
     filename = utils.greatest_name(syn3_pathname,
                                    "meta",
-                                   ".csv")
+                                   ".csv",
+                                   ctx=e.ctx)
     file_pathname = os.path.join(syn3_pathname, filename)
     fieldnames = ["Contest",
                   "Collection",
@@ -215,19 +216,20 @@ def read_vote_csv(e, synpar, reported=False):
     Read file defining syn3 synthetic election spec.
     """
 
-    syn3_pathname = os.path.join(OpenAuditTool.ELECTIONS_ROOT,
+    syn3_pathname = os.path.join(e.ctx.elections_root,
                                  "syn3_specs", synpar.election_dirname)
     try:
         # Use config dir if properly defined
         if synpar.config_dirname is not None:
-            syn3_pathname = os.path.join(OpenAuditTool.ELECTIONS_ROOT,
+            syn3_pathname = os.path.join(e.ctx.elections_root,
                                          "syn3_specs", synpar.config_dirname)
     except NameError:
         pass
 
     filename = utils.greatest_name(syn3_pathname,
                                    "reported" if reported else "actual",
-                                   ".csv")
+                                   ".csv",
+                                   ctx=e.ctx)
     file_pathname = os.path.join(syn3_pathname, filename)
     fieldnames = ["Contest",
                   "Collection",
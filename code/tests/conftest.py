@@ -0,0 +1,93 @@
+"""
+Shared fixtures for the tests: elections written to a temporary
+elections root.
+"""
+
+import os
+
+import pytest
+
+import OpenAuditTool
+
+# Small election "ex": one collection PBC1 of four ballots, with
+# contests Mayor and Prop.
+
+MANIFEST_CONTENTS = """Collection,Box,Position,Stamp,Ballot id,Number of ballots,Required Contests,Possible Contests,Comments
+PBC1,B1,1,,b1,1,,,
+PBC1,B1,2,,b2,1,,,
+PBC1,B2,1,,b3,1,,,
+PBC1,B2,2,,b4,1,,,
+"""
+
+CVRS_CONTENTS = """Collection,Scanner,Ballot id,Contest,Selections
+PBC1,s1,b1,Mayor,Bob
+PBC1,s1,b1,Prop,Yes
+PBC1,s1,b2,Mayor,Alice
+PBC1,s1,b3,Mayor,Bob,Alice
+PBC1,s1,b3,Prop,No
+PBC1,s1,b4,Mayor,+Eve
+"""
+
+AUDITED_CONTENTS = """Collection,Ballot id,Contest,Selections
+PBC1,b1,Mayor,Bob
+PBC1,b1,Prop,No
+PBC1,b2,Mayor,Bob
+PBC1,b3,Prop,No
+"""
+
+
+@pytest.fixture
+def elections_root(tmp_path, monkeypatch):
+    """ Temporary directory used as OpenAuditTool.ELECTIONS_ROOT. """
+
+    monkeypatch.setattr(OpenAuditTool, "ELECTIONS_ROOT", str(tmp_path))
+    return str(tmp_path)
+
+
+@pytest.fixture
+def write_election_file(elections_root):
+    """
+    Return function write(dirnames, filename, contents, append=False)
+    writing (or appending to) file filename in directory dirnames
+    (a list of names) of election "ex".
+    """
+
+    def write(dirnames, filename, contents, append=False):
+        dirpath = os.path.join(elections_root, "ex", *dirnames)
+        os.makedirs(dirpath, exist_ok=True)
+        with open(os.path.join(dirpath, filename), "a" if append else "w") as file:
+            file.write(contents)
+
+    return write
+
+
+@pytest.fixture
+def small_election_files(write_election_file):
+    """
+    Write ballot manifest, reported CVRs, and audited votes of the small
+    election "ex"; return write_election_file.
+    """
+
+    write_election_file(["2-reported", "21-reported-ballot-manifests"],
+                        "manifest-PBC1.csv", MANIFEST_CONTENTS)
+    write_election_file(["2-reported", "22-reported-cvrs"],
+                        "reported-cvrs-PBC1.csv", CVRS_CONTENTS)
+    write_election_file(["3-audit", "33-audited-votes"],
+                        "audited-votes-PBC1.csv", AUDITED_CONTENTS)
+    return write_election_file
+
+
+@pytest.fixture
+def new_election(elections_root):
+    """
+    Return function make(pbcids=["PBC1"]) returning a new Election for
+    election "ex" in the temporary elections root, with given pbcids.
+    """
+
+    def make(pbcids=("PBC1",)):
+        e = OpenAuditTool.Election()
+        e.election_dirname = "ex"
+        e.pbcids = list(pbcids)
+        return e
+
+    return make
@@ -35,12 +35,26 @@ def test_4_easy():
         OpenAuditTool_args.election_name = '4-easy'
         OpenAuditTool_args.elections_root = './elections'
         OpenAuditTool_args.set_audit_seed = 42
+        OpenAuditTool_args.sqlite_db = None
+        OpenAuditTool_args.num_workers = 1
         OpenAuditTool_args.read_election_spec = False
         OpenAuditTool_args.read_reported = False
+        OpenAuditTool_args.make_cvr_store = False
         OpenAuditTool_args.make_audit_orders = False
+        OpenAuditTool_args.audit_order_mode = "shuffle"
+        OpenAuditTool_args.consistent_sampling = False
+        OpenAuditTool_args.audit_order_chunk_size = 0
+        OpenAuditTool_args.pull_lists = False
         OpenAuditTool_args.read_audited = False
         OpenAuditTool_args.audit = True
         OpenAuditTool_args.pause = False
+        OpenAuditTool_args.serve = False
+        OpenAuditTool_args.watch = False
+        OpenAuditTool_args.poll_interval = 1.0
+        OpenAuditTool_args.debounce = 2.0
+        OpenAuditTool_args.latency_target = 10.0
+        OpenAuditTool_args.simulate = False
+        OpenAuditTool_args.write_outputs = False
 
         # added for new planner code:
         OpenAuditTool_args.num_winners = 2
@@ -48,6 +62,14 @@ def test_4_easy():
         OpenAuditTool_args.sample_by_size = False 
         OpenAuditTool_args.use_discrete_rm = False
         OpenAuditTool_args.pick_county_func = "round_robin"
+        OpenAuditTool_args.plan_engine = "scalar"
+        OpenAuditTool_args.plan_time_budget = 0.0
+        OpenAuditTool_args.joint_allocation = False
+        OpenAuditTool_args.asn = False
+        OpenAuditTool_args.asn_audits = 1000
+        OpenAuditTool_args.asn_error_rate = 0.0
+        OpenAuditTool_args.asn_trials = 100
+        OpenAuditTool_args.asn_max_stages = 20
         cli_OpenAuditTool.dispatch(e, OpenAuditTool_args)
 
 
@@ -0,0 +1,68 @@
+"""
+Tests for allocation.py
+"""
+
+import OpenAuditTool
+import allocation
+
+
+def small_election():
+    # contest C1 in collections P1 and P2, whose measurement is nearly
+    # passing; contest C2 in P3 only, whose measurement has already passed
+    e = OpenAuditTool.Election()
+    e.ctx.seed(1)
+    e.stage_time = "0001-01-01-00-00-01"
+    e.pbcids = ["P1", "P2", "P3"]
+    e.mids = ["M1", "M2"]
+    e.cid_m = {"M1": "C1", "M2": "C2"}
+    e.risk_limit_m = {"M1": 0.05, "M2": 0.05}
+    e.status_tm[e.stage_time] = {"M1": "Open", "M2": "Passed"}
+    e.contest_type_c = {"C1": "plurality", "C2": "plurality"}
+    e.ro_c = {"C1": ("Alice",), "C2": ("Alice",)}
+    e.votes_c = {cid: {("Alice",): True, ("Bob",): True} for cid in ["C1", "C2"]}
+    e.possible_pbcid_c = {"C1": {"P1": "True", "P2": "True"}, "C2": {"P3": "True"}}
+    e.rn_p = {"P1": 1000, "P2": 1000, "P3": 1000}
+    e.max_audit_rate_p = {"P1": 100, "P2": 100, "P3": 100}
+    e.sn_tp[e.stage_time] = {"P1": 100, "P2": 100, "P3": 100}
+    # ballot-polling (noCVR) collections
+    nocvr = ("-noCVR",)
+    e.rn_cpr = {"C1": {"P1": {nocvr: 1000}, "P2": {nocvr: 1000}},
+                "C2": {"P3": {nocvr: 1000}}}
+    e.sn_tcpra[e.stage_time] = \
+        {"C1": {"P1": {nocvr: {("Alice",): 56, ("Bob",): 44}},
+                "P2": {nocvr: {("Alice",): 55, ("Bob",): 45}}},
+         "C2": {"P3": {nocvr: {("Alice",): 90, ("Bob",): 10}}}}
+    return e
+
+
+def test_response_curves():
+    e = small_election()
+    inc_p = allocation.increments_p(e, e.pbcids)
+    assert inc_p == {"P1": 100, "P2": 100, "P3": 100}
+    curves = allocation.response_curves(e, "C1", inc_p)
+    assert sorted(curves) == ["P1", "P2"]
+    for pbcid in curves:
+        assert len(curves[pbcid]) == allocation.CURVE_POINTS + 1
+        # more sampling (of ballots like those seen) lowers the risk
+        assert curves[pbcid][-1] < curves[pbcid][0]
+    assert len(e.risk_curve_cache) == 1
+    assert allocation.response_curves(e, "C1", inc_p) is curves
+
+    progress_p = allocation.progress_curves(curves, 0.05)
+    for pbcid in progress_p:
+        values = progress_p[pbcid]
+        assert values[0] == 0.0 and values == sorted(values) and values[-1] <= 1.0
+
+
+def test_joint_allocation():
+    e = small_election()
+    xs = allocation.joint_allocation(e, e.pbcids)
+    assert xs == allocation.joint_allocation(e, e.pbcids)
+    # no ballots for P3, whose only contest has passed
+    assert xs["P3"] == 0
+    # a few more ballots of C1 are projected to be enough
+    assert 0 < xs["P1"] + xs["P2"] < 200
+
+    # nothing to gain anywhere: full increments, as without joint allocation
+    e.status_tm[e.stage_time]["M1"] = "Passed"
+    assert allocation.joint_allocation(e, ["P1", "P2"]) == {"P1": 100, "P2": 100}
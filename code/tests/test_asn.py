@@ -0,0 +1,64 @@
+"""
+Tests for asn.py
+"""
+
+import numpy as np
+
+import OpenAuditTool
+import asn
+
+
+def small_election():
+    # one contest, in a CVR collection and a noCVR collection
+    e = OpenAuditTool.Election()
+    e.ctx.seed(1)
+    e.pbcids = ["P1", "P2"]
+    e.cids = ["C1"]
+    e.rn_p = {"P1": 1000, "P2": 500}
+    e.max_audit_rate_p = {"P1": 40, "P2": 20}
+    e.possible_pbcid_c = {"C1": {"P1": "True", "P2": "True"}}
+    e.contest_type_c = {"C1": "plurality"}
+    nocvr = ("-noCVR",)
+    e.votes_c = {"C1": {("Alice",): True, ("Bob",): True, nocvr: True}}
+    e.rn_cpr = {"C1": {"P1": {("Alice",): 700, ("Bob",): 300, nocvr: 0},
+                       "P2": {nocvr: 500}}}
+    e.rn_cr = {"C1": {("Alice",): 700, ("Bob",): 300, nocvr: 500}}
+    e.ro_c = {"C1": ("Alice",)}
+    e.mids = ["M1"]
+    e.cid_m = {"M1": "C1"}
+    e.risk_limit_m = {"M1": 0.05}
+    e.risk_upset_m = {"M1": 0.98}
+    e.initial_status_m = {"M1": "Open"}
+    e.asn_audits = 150
+    e.asn_max_stages = 10
+    return e
+
+
+def test_actual_vote_shares():
+    e = small_election()
+    e.asn_error_rate = 0.1
+    votes = list(e.votes_c["C1"])
+    assert np.allclose(asn.actual_vote_shares(e, "C1", ("Alice",), votes), [0.9, 0.1, 0.0])
+    assert np.allclose(asn.actual_vote_shares(e, "C1", ("-noCVR",), votes), [0.7, 0.3, 0.0])
+
+
+def test_simulate_audits():
+    e = small_election()
+    results = asn.simulate_audits(e)
+    assert results["sn_p"].shape == (150, 2)
+    assert results["status_m"].shape == results["stages_m"].shape == (150, 1)
+    # a wide margin and no errors: every audit passes, in whole stages
+    assert (results["status_m"] == asn.STATUSES.index("Passed")).all()
+    stages = results["stages_m"][:, 0]
+    assert (stages >= 1).all()
+    assert (results["sn_p"] == np.outer(stages, [40, 20])).all()
+
+    # same results however the audits are split among workers
+    e.num_workers = 2
+    results2 = asn.simulate_audits(e)
+    for key in results:
+        assert (results[key] == results2[key]).all()
+
+    collection_rows, measurement_rows = asn.asn_report(e, results)
+    assert [row["Collection"] for row in collection_rows] == ["P1", "P2"]
+    assert measurement_rows[0]["Passed"] == 1.0
@@ -0,0 +1,37 @@
+"""
+Tests for audit.py
+"""
+
+import OpenAuditTool
+import audit
+import outcomes
+
+
+def test_update_sample_tally():
+    e = OpenAuditTool.Election()
+    a, b = ("A",), ("B",)
+    e.bids_p = {"P1": ["b1", "b2", "b3", "b4", "b2"]}
+    e.rv_cpb = {"C1": {"P1": {bid: a for bid in e.bids_p["P1"]}}}
+    e.av_cpb = {"C1": {"P1": {"b1": a, "b3": b}}}
+    audit.extend_sample_tally(e, "C1", "P1", 3)
+    assert audit.ballot_ordinals(e, "P1") == {"b1": 0, "b2": 1, "b3": 2, "b4": 3}
+    assert e.duplicate_bids_p["P1"] == {"b2"}
+
+    def expected(size):
+        bids = e.bids_p["P1"][:size]
+        return outcomes.compute_tally2([(e.av_cpb["C1"]["P1"].get(bid, ("-NoSuchContest",)),
+                                         e.rv_cpb["C1"]["P1"][bid]) for bid in bids])
+
+    # vote changed for a tallied ballot: tally updated in place
+    e.av_cpb["C1"]["P1"]["b3"] = a
+    audit.update_sample_tally(e, "C1", "P1", "b3", b, a)
+    assert e.sample_tally_cpra["C1"]["P1"] == expected(3)
+    # ballot not yet tallied: nothing to do
+    e.av_cpb["C1"]["P1"]["b4"] = b
+    audit.update_sample_tally(e, "C1", "P1", "b4", None, b)
+    assert e.sample_size_cp["C1"]["P1"] == 3
+    # duplicate ballot id: retallied from scratch
+    e.av_cpb["C1"]["P1"]["b2"] = b
+    audit.update_sample_tally(e, "C1", "P1", "b2", None, b)
+    assert e.sample_size_cp["C1"]["P1"] == 0
+    assert audit.extend_sample_tally(e, "C1", "P1", 3) == expected(3)
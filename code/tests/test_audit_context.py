@@ -0,0 +1,61 @@
+"""
+Tests for audit_context.py
+"""
+
+import threading
+
+import OpenAuditTool
+import audit
+import risk_bayes
+
+
+def draws(e, n=50):
+    tally = {("A",): 30, ("B",): 20}
+    return [risk_bayes.draw_nonsample_tally(tally, {("A",): 0.5, ("B",): 0.5},
+                                            100, e.ctx.random_state)
+            for i in range(n)]
+
+
+def test_elections_have_separate_contexts():
+    e1 = OpenAuditTool.Election()
+    e2 = OpenAuditTool.Election()
+    assert e1.ctx is not e2.ctx
+    e1.ctx.elections_root = "/tmp/one"
+    assert e2.ctx.elections_root == OpenAuditTool.ELECTIONS_ROOT
+
+
+def test_same_seed_same_draws_when_interleaved():
+    e1 = OpenAuditTool.Election()
+    e2 = OpenAuditTool.Election()
+    audit.set_audit_seed(e1, "12345678901234567890")
+    audit.set_audit_seed(e2, "12345678901234567890")
+    a1 = draws(e1, 10)
+    # draws for another election in between don't disturb e1's stream
+    e3 = OpenAuditTool.Election()
+    audit.set_audit_seed(e3, 1)
+    draws(e3, 10)
+    a2 = draws(e2, 10)
+    assert a1 == a2
+    assert e1.ctx.planner_random.random() == e2.ctx.planner_random.random()
+
+
+def test_threads_are_isolated():
+    expected = {}
+    for seed in range(4):
+        e = OpenAuditTool.Election()
+        audit.set_audit_seed(e, seed)
+        expected[seed] = draws(e)
+
+    results = {}
+
+    def run(seed):
+        e = OpenAuditTool.Election()
+        audit.set_audit_seed(e, seed)
+        results[seed] = draws(e)
+
+    threads = [threading.Thread(target=run, args=(seed,)) for seed in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == expected
@@ -0,0 +1,73 @@
+"""
+Tests for audit_orders.py
+"""
+
+import csv
+import os
+import tempfile
+
+import OpenAuditTool
+import audit_orders
+
+
+def test_shuffle_unchanged():
+    # as recorded in audit_orders.test_shuffle
+    assert audit_orders.shuffle(range(20), 1234567890) == \
+        [12, 13, 2, 18, 3, 8, 9, 7, 17, 6, 16, 5, 11, 19, 1, 14, 10, 0, 4, 15]
+
+
+def test_permute_is_permutation():
+    for n in [1, 2, 3, 5, 16, 17, 100, 257]:
+        images = [audit_orders.permute(i, n, "seed") for i in range(n)]
+        assert sorted(images) == list(range(n))
+    assert audit_orders.lazy_order(100, "seed", 0, 100) != \
+        audit_orders.lazy_order(100, "other seed", 0, 100)
+
+
+def test_lazy_order_extends_prefix():
+    e = OpenAuditTool.Election()
+    e.audit_seed = 42
+    e.bids_p = {"P1": ["b{}".format(i) for i in range(50)]}
+    audit_orders.extend_audit_order(e, "P1", 10)
+    first = list(e.shuffled_bids_p["P1"])
+    assert len(first) == 10
+    audit_orders.extend_audit_order(e, "P1", 30)
+    assert e.shuffled_bids_p["P1"][:10] == first
+    audit_orders.extend_audit_order(e, "P1", 100)
+    assert sorted(e.shuffled_indices_p["P1"]) == list(range(1, 51))
+    assert e.shuffled_bids_p["P1"] == \
+        [e.bids_p["P1"][i-1] for i in e.shuffled_indices_p["P1"]]
+
+
+def test_shuffle_parallel_identical():
+    L = ["b{}".format(i) for i in range(1000)]
+    assert audit_orders.shuffle_parallel(L, "42,PBC1", 2, batch_size=77) == \
+        audit_orders.shuffle(L, "42,PBC1")
+    assert audit_orders.shuffle_parallel([], "s", 2) == []
+
+
+def test_audit_order_chunks():
+    e = OpenAuditTool.Election()
+    e.audit_seed = 42
+    e.election_dirname = "E"
+    e.audit_order_mode = "lazy"
+    e.audit_order_chunk_size = 8
+    e.bids_p = {"P1": ["b{}".format(i) for i in range(50)]}
+    for attr in ["boxid_pb", "position_pb", "stamp_pb", "comments_pb"]:
+        getattr(e, attr)["P1"] = {bid: "" for bid in e.bids_p["P1"]}
+    with tempfile.TemporaryDirectory() as root:
+        e.ctx.elections_root = root
+        dirpath = os.path.join(root, "E", "3-audit", "32-audit-orders")
+        audit_orders.write_audit_order_chunks(e, "P1", 10)
+        assert sorted(os.listdir(dirpath)) == \
+            ["audit-order-P1-chunk-000000.csv", "audit-order-P1-chunk-000001.csv"]
+        assert len(e.shuffled_bids_p["P1"]) == 16
+        audit_orders.write_audit_order_chunks(e, "P1", 100)
+        assert len(os.listdir(dirpath)) == 7
+        bids = []
+        for filename in sorted(os.listdir(dirpath)):
+            with open(os.path.join(dirpath, filename)) as file:
+                rows = list(csv.reader(file))
+            assert rows[0][0] == "Ballot order"
+            bids.extend(row[5] for row in rows[1:])
+        assert bids == e.shuffled_bids_p["P1"]
@@ -0,0 +1,159 @@
+"""
+Tests for audit_server.py
+"""
+
+import json
+import os
+import shutil
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+import warnings
+
+import OpenAuditTool
+import audit
+import audit_server
+import cli_OpenAuditTool
+import cli_syn
+
+
+def make_election():
+    e = OpenAuditTool.Election()
+    e.mids = ["M1"]
+    e.sampling_mode_m = {"M1": "Active"}
+    return e
+
+
+def test_status_and_plan_before_first_stage():
+    e = make_election()
+    assert audit_server.run_command(e, "GET", "/status") == \
+        (200, {"stage_time": e.stage_time, "stopped": False})
+    assert audit_server.run_command(e, "GET", "/plan/") == \
+        (200, {"stage_time": e.stage_time, "plan_p": None})
+
+
+def test_status_and_plan_after_stage():
+    e = make_election()
+    t = "2017-11-10-14-03-21"
+    e.stage_time = t
+    e.risk_tm[t] = {"M1": 0.01}
+    e.status_tm[t] = {"M1": "Passed"}
+    e.election_status_t[t] = ["Passed"]
+    e.sn_tp[t] = {"PBC1": 40}
+    e.plan_tp[t] = {"PBC1": 80}
+    code, response = audit_server.run_command(e, "GET", "/status")
+    assert code == 200
+    assert response["status_m"] == {"M1": "Passed"}
+    assert response["stopped"]
+    assert audit_server.run_command(e, "GET", "/plan")[1]["plan_p"] == {"PBC1": 80}
+
+
+def test_unknown_command():
+    e = make_election()
+    assert audit_server.run_command(e, "GET", "/stage")[0] == 404
+    assert audit_server.run_command(e, "POST", "/nope")[0] == 404
+
+
+SYN2_SPECS = os.path.join(os.path.dirname(__file__), "..", "..", "elections", "syn2_specs")
+
+
+class Args(object):
+    """ Class subclassed from object so we can hang attributes off of it. """
+    pass
+
+
+def serve_args(elections_root, port):
+
+    args = Args()
+    args.election_dirname = "4-easy"
+    args.election_name = "4-easy"
+    args.elections_root = elections_root
+    args.set_audit_seed = 42
+    args.sqlite_db = None
+    args.num_workers = 1
+    args.read_election_spec = False
+    args.read_reported = False
+    args.make_cvr_store = False
+    args.make_audit_orders = False
+    args.audit_order_mode = "shuffle"
+    args.consistent_sampling = False
+    args.audit_order_chunk_size = 0
+    args.pull_lists = False
+    args.read_audited = False
+    args.audit = False
+    args.pause = False
+    args.serve = True
+    args.port = port
+    args.watch = False
+    args.poll_interval = 1.0
+    args.debounce = 2.0
+    args.latency_target = 10.0
+    args.simulate = False
+    args.write_outputs = False
+    args.num_winners = 1
+    args.max_num_it = 100
+    args.sample_by_size = False
+    args.use_discrete_rm = False
+    args.pick_county_func = "round_robin"
+    args.plan_engine = "scalar"
+    args.plan_time_budget = 0.0
+    args.joint_allocation = False
+    args.asn = False
+    args.asn_audits = 1000
+    args.asn_error_rate = 0.0
+    args.asn_trials = 100
+    args.asn_max_stages = 20
+    return args
+
+
+def free_port():
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def post(port, path, timeout=60.0):
+    """ POST to the server, retrying until it is listening; return (code, json). """
+
+    url = "http://127.0.0.1:{}{}".format(port, path)
+    deadline = time.time() + timeout
+    while True:
+        try:
+            request = urllib.request.Request(url, data=b"", method="POST")
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return response.status, json.loads(response.read().decode("utf-8"))
+        except (ConnectionError, urllib.error.URLError):
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def test_serve_stage_over_http(elections_root):
+
+    shutil.copytree(SYN2_SPECS, os.path.join(elections_root, "syn2_specs"))
+    syn_args = Args()
+    syn_args.election_dirname = "4-easy"
+    syn_args.syn_type = "2"
+    with warnings.catch_warnings(record=True):
+        cli_syn.dispatch(OpenAuditTool.Election(), syn_args)
+
+    e = OpenAuditTool.Election()
+    port = free_port()
+    server = threading.Thread(target=cli_OpenAuditTool.dispatch,
+                              args=(e, serve_args(elections_root, port)))
+    server.start()
+    try:
+        code, response = post(port, "/stage")
+        assert code == 200
+        assert response["stage_time"] == e.stage_time
+        assert response["sn_p"] == {"PBC1": e.max_audit_rate_p["PBC1"]}
+        assert set(response["status_m"]) == set(e.mids)
+        assert response["stopped"] == audit.stop_audit(e)
+        assert set(response["risk_m"]) == set(e.mids)
+    finally:
+        assert post(port, "/shutdown") == (200, {"stopping": True})
+        server.join(timeout=60.0)
+    assert not server.is_alive()
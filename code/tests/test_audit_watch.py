@@ -0,0 +1,92 @@
+"""
+Tests for audit_watch.py
+"""
+
+import os
+import tempfile
+
+import OpenAuditTool
+import audit
+import audit_watch
+
+
+def test_audited_prefix_size():
+    e = OpenAuditTool.Election()
+    e.bids_p = {"P1": ["b1", "b2", "b3", "b4"], "P2": ["c1"]}
+    e.av_cpb = {"C1": {"P1": {"b1": ("A",), "b3": ("A",)}},
+                "C2": {"P1": {"b2": ("B",)}}}
+    assert audit_watch.audited_prefix_size(e, "P1") == 3
+    assert audit_watch.audited_prefix_size(e, "P2") == 0
+    assert e.audited_prefix_p == {"P1": 3, "P2": 0}
+
+    # the next scan resumes at b4
+    e.av_cpb["C1"]["P1"]["b4"] = ("A",)
+    assert audit_watch.audited_prefix_size(e, "P1") == 4
+    assert e.audited_prefix_p["P1"] == 4
+
+
+def test_audited_prefix_sizes_cp():
+    e = OpenAuditTool.Election()
+    e.cids = ["C1", "C2"]
+    e.possible_pbcid_c = {"C1": {"P1": True}, "C2": {"P1": True}}
+    e.contest_bids_cp = {"C1": {"P1": ["b2", "b1", "b3"]},
+                         "C2": {"P1": ["b3", "b1"]}}
+    e.av_cpb = {"C1": {"P1": {"b2": ("A",), "b3": ("A",)}},
+                "C2": {"P1": {"b3": ("B",)}}}
+    assert audit_watch.audited_prefix_sizes_cp(e) == \
+        {"C1": {"P1": 1}, "C2": {"P1": 1}}
+
+    # only the pairs reported as changed are rescanned
+    e.av_cpb["C1"]["P1"]["b1"] = ("A",)
+    e.av_cpb["C2"]["P1"]["b1"] = ("B",)
+    assert audit_watch.audited_prefix_sizes_cp(e, {("C1", "P1")}) == \
+        {"C1": {"P1": 3}, "C2": {"P1": 1}}
+    assert audit_watch.audited_prefix_sizes_cp(e) == \
+        {"C1": {"P1": 3}, "C2": {"P1": 2}}
+
+
+def test_affected_mids():
+    # contests C1 and C2 in one (CVR) collection P1
+    e = OpenAuditTool.Election()
+    e.cids = ["C1", "C2"]
+    e.mids = ["M1", "M2", "M3"]
+    e.cid_m = {"M1": "C1", "M2": "C2", "M3": "C1"}
+    e.possible_pbcid_c = {"C1": {"P1": "True"}, "C2": {"P1": "True"}}
+    e.bids_p = {"P1": ["b1", "b2", "b3"]}
+    a, b = ("A",), ("B",)
+    e.rv_cpb = {"C1": {"P1": {"b1": a, "b2": a, "b3": a}},
+                "C2": {"P1": {"b1": b, "b2": b, "b3": b}}}
+    e.rn_cpr = {"C1": {"P1": {a: 3}}, "C2": {"P1": {b: 3}}}
+    # b3 is already audited for C2, but b2 for neither contest
+    e.av_cpb = {"C1": {"P1": {"b1": a}}, "C2": {"P1": {"b1": b, "b3": b}}}
+
+    def stage(stage_time):
+        e.stage_time = stage_time
+        e.sn_tcpra[stage_time] = {}
+        audit.draw_sample(e, {"P1": audit_watch.audited_prefix_size(e, "P1")})
+
+    stage("0001-01-01-00-00-01")
+    assert e.sn_tp[e.stage_time] == {"P1": 1}
+    stage("0001-01-01-00-00-02")
+    assert audit_watch.affected_mids(e, "0001-01-01-00-00-01") == []
+
+    # a row for C1 fills the gap at b2, so the sample of P1 now also
+    # includes b3, and the tally for C2 changes too
+    e.av_cpb["C1"]["P1"]["b2"] = a
+    stage("0001-01-01-00-00-03")
+    assert e.sn_tp[e.stage_time] == {"P1": 3}
+    assert audit_watch.affected_mids(e, "0001-01-01-00-00-02") == ["M1", "M2", "M3"]
+
+
+def test_directory_signature():
+    with tempfile.TemporaryDirectory() as dirpath:
+        sig0 = audit_watch.directory_signature(dirpath)
+        filename = os.path.join(dirpath, "audited-votes-P1.csv")
+        with open(filename, "w") as file:
+            file.write("Collection,Ballot id,Contest,Selections\n")
+        sig1 = audit_watch.directory_signature(dirpath)
+        assert sig1 != sig0
+        assert audit_watch.directory_signature(dirpath) == sig1
+        with open(filename, "a") as file:
+            file.write("P1,b1,C1,A\n")
+        assert audit_watch.directory_signature(dirpath) != sig1
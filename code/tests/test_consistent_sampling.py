@@ -0,0 +1,61 @@
+"""
+Tests for consistent_sampling.py
+"""
+
+import OpenAuditTool
+import consistent_sampling
+
+
+def small_election():
+    # one collection of 100 ballots; every ballot has contest C1, and
+    # only ballots with even numbers also have contest C2
+    e = OpenAuditTool.Election()
+    e.audit_seed = 42
+    e.pbcids = ["P1"]
+    e.cids = ["C1", "C2"]
+    e.cids_g = {"g1": ["C1"], "g12": ["C1", "C2"]}
+    e.possible_cid_p = {"P1": {"C1": "True", "C2": "True"}}
+    e.possible_pbcid_c = {"C1": {"P1": "True"}, "C2": {"P1": "True"}}
+    e.max_audit_rate_p = {"P1": 10}
+    e.bids_p = {"P1": ["b{}".format(i) for i in range(100)]}
+    for i, bid in enumerate(e.bids_p["P1"]):
+        gid = "g12" if i % 2 == 0 else "g1"
+        e.required_gid_pb.setdefault("P1", {})[bid] = gid
+        e.possible_gid_pb.setdefault("P1", {})[bid] = gid
+    return e
+
+
+def test_contest_bids():
+    e = small_election()
+    order = consistent_sampling.priority_bids(e, "P1")
+    assert sorted(order) == sorted(e.bids_p["P1"])
+    assert consistent_sampling.contest_bids(e, "C1", "P1") == order
+    c2_bids = consistent_sampling.contest_bids(e, "C2", "P1")
+    assert c2_bids == [bid for bid in order if int(bid[1:]) % 2 == 0]
+
+    # priorities depend only on seed, pbcid and bid
+    e2 = small_election()
+    e2.bids_p["P1"].reverse()
+    assert consistent_sampling.priority_bids(e2, "P1") == order
+
+
+def test_extend_plan():
+    e = small_election()
+    plan_cp = consistent_sampling.initial_plan_tcp(e)
+    # ten ballots pulled, shared by both contests
+    assert consistent_sampling.plan_sizes_p(e, plan_cp) == {"P1": 10}
+    assert plan_cp["C1"]["P1"] == 10
+    c2_bids = consistent_sampling.contest_bids(e, "C2", "P1")
+    assert set(c2_bids[:plan_cp["C2"]["P1"]]) <= \
+        set(consistent_sampling.contest_bids(e, "C1", "P1")[:10])
+
+    # only C2 still open: its sample grows by ten ballots not yet pulled
+    plan2_cp = consistent_sampling.extend_plan(e, plan_cp, ["C2"])
+    assert plan2_cp["C1"] == plan_cp["C1"]
+    assert plan2_cp["C2"]["P1"] == plan_cp["C2"]["P1"] + 10
+    assert consistent_sampling.plan_sizes_p(e, plan2_cp) == {"P1": 20}
+
+    # sample sizes never exceed number of ballots with the contest
+    for i in range(10):
+        plan2_cp = consistent_sampling.extend_plan(e, plan2_cp, ["C2"])
+    assert plan2_cp["C2"]["P1"] == 50
@@ -1,7 +1,8 @@
 import os
+import tempfile
 import warnings
 
-from csv_readers import read_csv_file
+from csv_readers import read_csv_file, read_csv_file_tail
 
 test_filename = 'test_file.csv'
 
@@ -168,3 +169,71 @@ def test_csv_duplicate_field():
         assert str(e) == 'Duplicate field name: {}'.format(duplicate_fieldnames)
 
     os.remove(test_filename)
+
+
+def test_csv_tail_no_final_newline():
+    with tempfile.TemporaryDirectory() as dirpath:
+        filename = os.path.join(dirpath, "votes.csv")
+        with open(filename, 'w') as f:
+            f.write('Collection,Ballot id,Contest,Selections\nP,b1,C,A\nP,b2,C,B')
+        rows = read_csv_file_tail(filename, None, varlen=True)[0]
+        assert len(rows) == 2
+        assert rows == read_csv_file(filename, varlen=True)
+
+
+def test_csv_tail():
+    with tempfile.TemporaryDirectory() as dirpath:
+        filename = os.path.join(dirpath, "tail.csv")
+        with open(filename, 'w') as f:
+            f.write('A,B,C\n1,2,3\n4,5')
+        rows, state, reread = read_csv_file_tail(filename, None, varlen=True)
+        assert reread
+        # the unterminated last line is read, as by read_csv_file ...
+        assert rows == read_csv_file(filename, varlen=True)
+        # ... but read again next time
+        assert read_csv_file_tail(filename, state, varlen=True)[0] == \
+            [{'A':'4', 'B':'5', 'C':()}]
+
+        # unterminated last line is finished, and a row appended
+        with open(filename, 'a') as f:
+            f.write(',6\n7,8,9,10\n')
+        rows, state, reread = read_csv_file_tail(filename, state, varlen=True)
+        assert not reread
+        assert rows == [{'A':'4', 'B':'5', 'C':('6',)},
+                        {'A':'7', 'B':'8', 'C':('9','10')}]
+        rows, state, reread = read_csv_file_tail(filename, state, varlen=True)
+        assert rows == [] and not reread
+
+        # rewritten (not appended to): read again from the start
+        with open(filename, 'w') as f:
+            f.write('A,B,C\n1,2,X\n4,5,6\n7,8,9,10\n11,12\n')
+        rows, state, reread = read_csv_file_tail(filename, state, varlen=True)
+        assert reread
+        assert rows == read_csv_file(filename, varlen=True)
+
+        # growing file: a half-written row is read only once finished
+        with open(filename, 'a') as f:
+            f.write('13,1')
+        rows, state, reread = read_csv_file_tail(filename, state, varlen=True, growing=True)
+        assert rows == [] and not reread
+        with open(filename, 'a') as f:
+            f.write('4,15\n')
+        rows, state, reread = read_csv_file_tail(filename, state, varlen=True, growing=True)
+        assert rows == [{'A':'13', 'B':'14', 'C':('15',)}] and not reread
+
+        # growing file: header not yet complete
+        partial = os.path.join(dirpath, "tail-partial.csv")
+        with open(partial, 'w') as f:
+            f.write('A,B')
+        assert read_csv_file_tail(partial, None, varlen=True, growing=True) == ([], None, True)
+        with open(partial, 'a') as f:
+            f.write(',C\n1,2,3\n')
+        rows, _, reread = read_csv_file_tail(partial, None, varlen=True, growing=True)
+        assert reread and rows == [{'A':'1', 'B':'2', 'C':('3',)}]
+
+        # a different file
+        other = os.path.join(dirpath, "tail-2.csv")
+        with open(other, 'w') as f:
+            f.write('A,B,C\n1,2,3\n')
+        rows, state, reread = read_csv_file_tail(other, state, varlen=True)
+        assert reread and rows == [{'A':'1', 'B':'2', 'C':('3',)}]
@@ -0,0 +1,30 @@
+"""
+Tests for cvr_store.py
+"""
+
+import cvr_store
+import reported
+
+
+def test_cvr_store_roundtrip(small_election_files, new_election):
+
+    e1 = new_election()
+    reported.read_reported_cvrs(e1)
+    assert e1.cvr_store_p == {}
+
+    cvr_store.write_cvr_stores(new_election())
+    e2 = new_election()
+    reported.read_reported_cvrs(e2)
+    assert e2.cvr_store_p["PBC1"]["rows"] == 6
+    assert e2.rv_cpb == e1.rv_cpb
+    assert e2.votes_c == e1.votes_c
+    assert e2.rv_cpb["Mayor"]["PBC1"]["b3"] == ("Alice", "Bob")
+
+    # store goes stale when the csv file changes
+    small_election_files(["2-reported", "22-reported-cvrs"],
+                         "reported-cvrs-PBC1.csv",
+                         "PBC1,s1,b4,Mayor,Alice\n", append=True)
+    e3 = new_election()
+    reported.read_reported_cvrs(e3)
+    assert e3.cvr_store_p == {}
+    assert e3.rv_cpb["Mayor"]["PBC1"]["b4"] == ("Alice",)
@@ -0,0 +1,56 @@
+"""
+Tests for election_db.py (compare against in-memory computations)
+"""
+
+import warnings
+
+import audit
+import election_db
+import reported
+
+
+def make_election(new_election, use_db):
+
+    e = new_election()
+    e.cids = ["Mayor", "Prop"]
+    e.selids_c = {"Mayor": {"Alice": True, "Bob": True},
+                  "Prop": {"Yes": True, "No": True}}
+    e.possible_pbcid_c = {"Mayor": {"PBC1": True}, "Prop": {"PBC1": True}}
+    if use_db:
+        election_db.open_election_db(e, ":memory:")
+    return e
+
+
+def load(e):
+
+    if e.db is not None:
+        election_db.load_reported_ballot_manifests(e)
+        election_db.load_reported_cvrs(e)
+    else:
+        reported.read_reported_ballot_manifests(e)
+        reported.read_reported_cvrs(e)
+    reported.finish_reported(e)
+    audit.read_audited_votes(e)
+    e.stage_time = "t"
+    e.sn_tp["t"] = {}
+    e.sn_tcpra["t"] = {}
+    e.max_audit_rate_p = {"PBC1": 3}
+    audit.draw_sample(e)
+
+
+def test_election_db_matches_memory(small_election_files, new_election):
+
+    e1 = make_election(new_election, False)
+    e2 = make_election(new_election, True)
+    with warnings.catch_warnings(record=True):
+        load(e1)
+        load(e2)
+    assert e2.votes_c == e1.votes_c
+    assert ("-NoSuchContest",) in e2.votes_c["Prop"]
+    assert e2.selids_c == e1.selids_c
+    assert e2.rn_cpr == e1.rn_cpr
+    assert e2.rn_p == e1.rn_p
+    assert e2.sn_tcpra == e1.sn_tcpra
+    assert e2.sn_tcpr == e1.sn_tcpr
+    assert e2.bids_p == {}
+    assert election_db.count_ballots(e2, "PBC1") == 4
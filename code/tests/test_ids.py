@@ -10,6 +10,13 @@ def test_clean_id():
     assert ids.clean_id("ab ") == "ab"
     assert ids.clean_id("  ab cd  ") == "ab cd"
     assert ids.clean_id("\t ab\n cd\n") == "ab cd"
+    assert ids.clean_id("ab\u00a0 cd") == "ab cd"
+    assert ids.clean_id("ab \x00 cd") == "ab cd"
+    assert ids.clean_id("ab\x00") == "ab"
+    assert ids.clean_id("") == ""
+    # already-clean ids are returned unchanged (fast path)
+    assert ids.clean_id("Den-Mayor") == "Den-Mayor"
+    assert ids.clean_id("John Smith") == "John Smith"
 
 
 def test_filename_safe():
@@ -50,3 +50,26 @@ def test_approval():
     str_tally = {("Alice", "Bob", "Charlie", "David"): 1, ("Alice", "Charlie"): 2, (): 1, ("Alice","David"): 1}
     expected_str_winner = ("Alice",)
     assert(expected_str_winner==outcomes.approval(None, None,str_tally))
+
+
+def test_compute_tally2_by_reported_vote():
+    """
+    compute_tally2 maps each reported vote to a tally of the
+    actual votes seen with it.
+    """
+    arvs = [("a", "a"), ("b", "a"), ("a", "a"), ("c", "c"), ("a", "c")]
+    expected = {"a": {"a": 2, "b": 1}, "c": {"c": 1, "a": 1}}
+    assert(outcomes.compute_tally2(arvs) == expected)
+    assert(list(outcomes.compute_tally2(arvs)) == ["a", "c"])
+    assert(outcomes.compute_tally2([]) == {})
+
+
+def test_plurality_batch():
+    import numpy as np
+    votes = [("Bob",), ("Alice",), ("-Invalid",), ("Alice", "Bob")]
+    tallies = np.array([[3, 5, 9, 9],
+                        [5, 5, 0, 0],
+                        [7, 1, 0, 0]])
+    assert outcomes.plurality_batch(votes, tallies) == [("Alice",), ("Bob",), ("Bob",)]
+    for row, outcome in zip(tallies.tolist(), outcomes.plurality_batch(votes, tallies)):
+        assert outcomes.plurality(None, "C", dict(zip(votes, row))) == outcome
@@ -0,0 +1,157 @@
+"""
+Tests for planner.py
+"""
+
+import numpy as np
+
+import OpenAuditTool
+import planner
+
+
+def test_compute_plan_once_per_stage(monkeypatch):
+    e = OpenAuditTool.Election()
+    e.pbcids = ["P1", "P2", "P3"]
+    e.mids = ["M1"]
+    e.cid_m = {"M1": "C1"}
+    e.risk_limit_m = {"M1": 0.05}
+    e.ro_c = {"C1": ("Alice",)}
+    e.possible_pbcid_c = {"C1": {pbcid: "True" for pbcid in e.pbcids}}
+    e.rn_p = {pbcid: 1000 for pbcid in e.pbcids}
+    e.stage_time = "0001-01-01-00-00-01"
+    e.status_tm[e.stage_time] = {"M1": "Open"}
+    e.sn_tp[e.stage_time] = {pbcid: 40 for pbcid in e.pbcids}
+    e.sn_tcpra[e.stage_time] = {"C1": {pbcid: {("Alice",): {("Alice",): 40}}
+                                       for pbcid in e.pbcids}}
+    e.sample_by_size = True
+    e.pick_county_func = "round_robin"
+
+    calls = []
+    def fake_get_sample_size(e, pbcids_to_adjust, pick_pbcid_func=None, plan_key=None,
+                             deadline=None):
+        calls.append(plan_key)
+        return {pbcid: 10 * (i+1) for i, pbcid in enumerate(pbcids_to_adjust)}
+    monkeypatch.setattr(planner, "get_sample_size", fake_get_sample_size)
+
+    planner.compute_plan(e)
+    assert len(calls) == 1
+    assert e.plan_tp[e.stage_time] == {"P1": 50, "P2": 60, "P3": 70}
+
+    # same sample state at a later stage: plan comes from the cache
+    e.stage_time = "0001-01-01-00-00-02"
+    e.status_tm[e.stage_time] = {"M1": "Open"}
+    e.sn_tp[e.stage_time] = e.sn_tp["0001-01-01-00-00-01"]
+    e.sn_tcpra[e.stage_time] = e.sn_tcpra["0001-01-01-00-00-01"]
+    planner.compute_plan(e)
+    assert len(calls) == 1
+    assert e.plan_tp[e.stage_time] == {"P1": 50, "P2": 60, "P3": 70}
+
+    # new sample tallies: new plan
+    e.sn_tcpra[e.stage_time] = {"C1": {pbcid: {("Alice",): {("Alice",): 50}}
+                                       for pbcid in e.pbcids}}
+    planner.compute_plan(e)
+    assert len(calls) == 2 and calls[0] != calls[1]
+
+
+def small_election():
+    e = OpenAuditTool.Election(num_winners=2, max_num_it=200)
+    e.audit_seed = 1
+    e.ctx.seed(1)
+    pbcids = ["P1", "P2"]
+    e.cid_m = {"M1": "C1"}
+    e.risk_limit_m = {"M1": 0.05}
+    e.contest_type_c = {"C1": "plurality"}
+    e.ro_c = {"C1": ("Alice",)}
+    e.votes_c = {"C1": {("Alice",): True, ("Bob",): True}}
+    e.rn_p = {"P1": 1000, "P2": 500}
+    e.stage_time = "0001-01-01-00-00-01"
+    e.sn_tcpra[e.stage_time] = \
+        {"C1": {"P1": {("Alice",): {("Alice",): 22, ("Bob",): 1}, ("Bob",): {("Bob",): 17}},
+                "P2": {("Alice",): {("Alice",): 21}, ("Bob",): {("Bob",): 19}}}}
+    return e
+
+
+def test_get_sample_size_array():
+    e = small_election()
+    pbcids = ["P1", "P2"]
+    xs = planner.get_sample_size_array(e, pbcids, plan_key="k")
+    assert xs == planner.get_sample_size_array(e, pbcids, plan_key="k")
+    assert all(isinstance(xs[pbcid], int) for pbcid in pbcids)
+    assert 0 <= xs["P1"] <= 960 and 0 <= xs["P2"] <= 460
+
+
+def test_discrete_rm_array():
+    e = small_election()
+    pbcids = ["P1", "P2"]
+    xs = planner.discrete_rm_array(e, pbcids, num_trials=10, plan_key="k")
+    assert xs == planner.discrete_rm_array(e, pbcids, num_trials=10, plan_key="k")
+    assert all(isinstance(xs[pbcid], int) and xs[pbcid] >= 0 for pbcid in pbcids)
+
+    # no trial gives the reported outcome: no division by zero
+    e.ro_c["C1"] = ("Bob",)
+    e.sn_tcpra[e.stage_time]["C1"]["P2"] = {("Alice",): {("Alice",): 40}}
+    planner.discrete_rm_array(e, pbcids, num_trials=3, plan_key="k")
+    planner.discrete_rm(e, pbcids, num_trials=1, plan_key="k")
+
+
+def test_noisy_guess_pair_array():
+    # the coupled finite difference of discrete_rm_array has much lower
+    # variance than one from independently drawn guesses
+    e = small_election()
+    pbcids = ["P1", "P2"]
+    xs_d, actual_votes, nonsample_sizes_d = planner.create_helper_dicts(e, "M1", 0, pbcids)
+    votes = sorted(actual_votes["P1"])
+    actual = np.array([[actual_votes[pbcid][vote] for vote in votes] for pbcid in pbcids],
+                      dtype=float)
+    nonsample_sizes = np.array([nonsample_sizes_d[pbcid] for pbcid in pbcids])
+    xs = np.array([30, 10])
+    independent = []
+    coupled = []
+    for k in range(50):
+        independent.append(
+            planner.get_noisy_guess_array(e, "M1", votes, actual, xs, nonsample_sizes,
+                                          rs=e.ctx.rng.stream("test", k, 0)) -
+            planner.get_noisy_guess_array(e, "M1", votes, actual, xs-1, nonsample_sizes+1,
+                                          rs=e.ctx.rng.stream("test", k, 1)))
+        guess, guess_1 = planner.get_noisy_guess_pair_array(
+            e, "M1", votes, actual, xs, nonsample_sizes, rs=e.ctx.rng.stream("test", k, 2))
+        coupled.append(guess - guess_1)
+    assert np.var(coupled) < np.var(independent) / 4
+
+
+def test_plan_time_budget(monkeypatch):
+    e = small_election()
+    e.pick_county_func = "round_robin"
+    e.plan_engine = "array"
+    e.max_audit_rate_p = {"P1": 40, "P2": 40}
+    pbcids = ["P1", "P2"]
+    full = planner.get_sample_size_array(e, pbcids, plan_key="k")
+
+    # plenty of time: same plan as without a budget, and cached
+    e.plan_time_budget = 60.0
+    xs = planner.planned_sample_sizes(e, "get_sample_size", pbcids)
+    assert e.plan_converged_t[e.stage_time] is True
+    assert len(e.plan_cache) == 1
+    key = planner.plan_key(e, "get_sample_size", pbcids)
+    assert xs == planner.get_sample_size_array(e, pbcids, plan_key=key)
+
+    # time for two rounds (batches) only: the walk so far, not cached
+    Deadline = planner.Deadline
+    class TwoRounds(Deadline):
+        def passed(self):
+            self.expired = self.expired or self.rounds == 2
+            if not self.expired:
+                self.rounds += 1
+            return self.expired
+    monkeypatch.setattr(planner, "Deadline", TwoRounds)
+    e.plan_cache = {}
+    xs = planner.planned_sample_sizes(e, "get_sample_size", pbcids)
+    assert e.plan_converged_t[e.stage_time] is False
+    assert e.plan_cache == {}
+    e.max_num_it = 2 * planner.PLAN_BATCH_SIZE
+    assert xs == planner.get_sample_size_array(e, pbcids, plan_key=key) != full
+
+    # no time at all: e.max_audit_rate_p
+    monkeypatch.setattr(planner, "Deadline", lambda budget: Deadline(-1.0))
+    for method in ["get_sample_size", "discrete_rm"]:
+        assert planner.planned_sample_sizes(e, method, pbcids) == {"P1": 40, "P2": 40}
+        assert e.plan_converged_t[e.stage_time] is False
@@ -0,0 +1,74 @@
+"""
+Tests for pull_lists.py
+"""
+
+import csv
+import os
+import tempfile
+
+import OpenAuditTool
+import consistent_sampling
+import pull_lists
+
+
+def test_position_key():
+    assert sorted(["10", "9", "b", "100", "a"], key=pull_lists.position_key) == \
+        ["9", "10", "100", "a", "b"]
+
+
+def test_write_pull_lists():
+    e = OpenAuditTool.Election()
+    e.audit_seed = 42
+    e.election_dirname = "E"
+    e.pbcids = ["P1"]
+    e.bids_p = {"P1": ["b{}".format(i) for i in range(60)]}
+    for i, bid in enumerate(e.bids_p["P1"]):
+        e.boxid_pb.setdefault("P1", {})[bid] = "box{}".format(i // 20)
+        e.position_pb.setdefault("P1", {})[bid] = str(i % 20 + 1)
+        e.stamp_pb.setdefault("P1", {})[bid] = ""
+        e.comments_pb.setdefault("P1", {})[bid] = ""
+    e.stage_time = "0001-01-01-00-00-01"
+    e.sn_tp[e.stage_time] = {"P1": 10}
+    e.plan_tp[e.stage_time] = {"P1": 25}
+    with tempfile.TemporaryDirectory() as root:
+        e.ctx.elections_root = root
+        pull_lists.write_pull_lists(e)
+        dirpath = os.path.join(root, "E", "3-audit", "35-pull-lists")
+        rows = []
+        for filename in sorted(os.listdir(dirpath)):
+            assert filename.startswith("pull-list-P1-box")
+            with open(os.path.join(dirpath, filename)) as file:
+                box_rows = list(csv.DictReader(file))
+            positions = [int(row["Position"]) for row in box_rows]
+            assert positions == sorted(positions)
+            assert len(set(row["Box"] for row in box_rows)) == 1
+            rows.extend(box_rows)
+    # ballots 10..24 of the audit order, each once
+    assert sorted(int(row["Ballot order"]) for row in rows) == list(range(10, 25))
+    assert all(e.shuffled_bids_p["P1"][int(row["Ballot order"])] == row["Ballot id"]
+               for row in rows)
+
+
+def test_stage_bids_consistent_sampling():
+    # as in test_consistent_sampling: C1 on every ballot, C2 on even ones
+    e = OpenAuditTool.Election()
+    e.audit_seed = 42
+    e.consistent_sampling = True
+    e.bids_p = {"P1": ["b{}".format(i) for i in range(100)]}
+    for i, bid in enumerate(e.bids_p["P1"]):
+        gid = "g12" if i % 2 == 0 else "g1"
+        e.required_gid_pb.setdefault("P1", {})[bid] = gid
+        e.possible_gid_pb.setdefault("P1", {})[bid] = gid
+    e.cids_g = {"g1": ["C1"], "g12": ["C1", "C2"]}
+    e.stage_time = "0001-01-01-00-00-01"
+    e.sn_tcp[e.stage_time] = {"C1": {"P1": 10}, "C2": {"P1": 5}}
+    e.plan_tcp[e.stage_time] = {"C1": {"P1": 12}, "C2": {"P1": 15}}
+
+    # the ballots in the new samples, but in no old one, in audit order
+    order = consistent_sampling.priority_bids(e, "P1")
+    old_bids = consistent_sampling.sampled_bids(e, e.sn_tcp[e.stage_time], "P1")
+    new_bids = consistent_sampling.sampled_bids(e, e.plan_tcp[e.stage_time], "P1")
+    expected = [(i, bid) for i, bid in enumerate(order)
+                if bid in new_bids and bid not in old_bids]
+    assert len(expected) > 0
+    assert pull_lists.stage_bids(e, "P1") == expected
@@ -0,0 +1,73 @@
+"""
+Tests for reported.py
+"""
+
+import reported
+
+manifests = {
+    "PBC1": """Collection,Box,Position,Stamp,Ballot id,Number of ballots,Required Contests,Possible Contests,Comments
+PBC1,B1,1,,b1,1,,,
+PBC1,B1,2,,b2,1,,,
+PBC1,B1,3,,b3,1,,,
+""",
+    "PBC2": """Collection,Box,Position,Stamp,Ballot id,Number of ballots,Required Contests,Possible Contests,Comments
+PBC2,B7,1,,c1,1,,,
+PBC2,B7,2,,c2,1,,,
+"""}
+
+cvrs = {
+    "PBC1": """Collection,Scanner,Ballot id,Contest,Selections
+PBC1,s1,b1,Mayor,Bob
+PBC1,s1,b2,Mayor,Alice
+PBC1,s1,b3,Mayor,Bob,Alice
+""",
+    "PBC2": """Collection,Scanner,Ballot id,Contest,Selections
+PBC2,s1,c1,Prop,No
+PBC2,s1,c1,Mayor,Alice
+PBC2,s1,c2,Prop,Yes
+"""}
+
+
+def read(new_election, num_workers):
+
+    e = new_election(["PBC1", "PBC2"])
+    e.cids = ["Mayor", "Prop"]
+    e.possible_pbcid_c = {"Mayor": {"PBC1": True, "PBC2": True},
+                          "Prop": {"PBC2": True}}
+    e.num_workers = num_workers
+    if num_workers > 1:
+        reported.read_reported_parallel(e)
+    else:
+        reported.read_reported_ballot_manifests(e)
+        reported.read_reported_cvrs(e)
+    e.votes_c["Mayor"][("-NoSuchContest",)] = True
+    reported.compute_rn_cpr(e)
+    return e
+
+
+def test_read_reported_parallel_matches_sequential(write_election_file, new_election):
+
+    for pbcid in manifests:
+        write_election_file(["2-reported", "21-reported-ballot-manifests"],
+                            "manifest-"+pbcid+".csv", manifests[pbcid])
+        write_election_file(["2-reported", "22-reported-cvrs"],
+                            "reported-cvrs-"+pbcid+".csv", cvrs[pbcid])
+    e1 = read(new_election, 1)
+    e2 = read(new_election, 2)
+    for attribute in ["bids_p", "rv_cpb", "votes_c", "rn_cpr"] + \
+                     reported.MANIFEST_ATTRIBUTES:
+        assert repr(getattr(e2, attribute)) == repr(getattr(e1, attribute))
+    assert e2.rn_cpr_partial["Mayor"]["PBC2"] == {("Alice",): 1}
+    assert e2.rn_cpr["Mayor"]["PBC1"][("Alice", "Bob")] == 1
+
+
+def test_expand_manifest_rows():
+    rows = [{"Collection": "PBC1", "Box": "B1", "Position": "12", "Stamp": "",
+             "Ballot id": "b7", "Number of ballots": "3",
+             "Required Contests": "", "Possible Contests": "", "Comments": ""},
+            {"Collection": "PBC1", "Box": "B2", "Position": "345", "Stamp": "",
+             "Ballot id": "x", "Number of ballots": "1",
+             "Required Contests": "", "Possible Contests": "", "Comments": ""}]
+    expanded = list(reported.expand_manifest_rows(rows))
+    assert [(bid, boxid, position) for (_, bid, boxid, position, _, _, _, _) in expanded] == \
+        [("b7", "B1", "12"), ("b8", "B1", "13"), ("b9", "B1", "14"), ("x", "B2", "345")]
@@ -0,0 +1,136 @@
+"""
+Tests for risk_bayes.py
+"""
+
+import numpy as np
+
+import OpenAuditTool
+import outcomes
+import risk_bayes
+import rng
+
+
+def test_array_draws_match_scalar_draws():
+    r = rng.RNG(42)
+    votes = [("Alice",), ("Bob",), ("Eve",)]
+    alphas = np.array([[10.0, 0.0, 3.5],
+                       [1.0, 2.0, 3.0]])
+    ns = np.array([100, 7.5])
+
+    rs = r.stream("test")
+    dirichlets = risk_bayes.dirichlet_array(alphas, rs)
+    freqs = risk_bayes.multinomial_array(ns, dirichlets, rs)
+
+    rs = r.stream("test")
+    dicts = [risk_bayes.dirichlet(dict(zip(votes, row)), rs) for row in alphas.tolist()]
+    freq_dicts = [risk_bayes.multinomial(n, d, rs) for n, d in zip(ns.tolist(), dicts)]
+
+    assert np.allclose(dirichlets, [[d[v] for v in votes] for d in dicts])
+    assert np.allclose(freqs, [[f[v] for v in votes] for f in freq_dicts])
+    assert dirichlets[0][1] == 0.0
+    assert np.allclose(freqs.sum(axis=1), ns)
+
+
+def test_draw_test_tallies_array():
+    e = OpenAuditTool.Election()
+    votes = [("Alice",), ("Bob",)]
+    e.votes_c = {"C1": {vote: True for vote in votes}}
+    e.rn_cpr = {"C1": {"P1": {("Alice",): 600, ("Bob",): 400}}}
+    # two sample states: the second has no ballots reported for Bob
+    sample_rv = {("Alice",): np.array([[30, 2], [25, 0]]),
+                 ("Bob",): np.array([[1, 20], [0, 0]])}
+    tallies = risk_bayes.draw_test_tallies_array(e, "C1", "P1", votes, sample_rv, 50,
+                                                 rng.RNG(1).stream("test"))
+    assert tallies.shape == (2, 50, 2)
+    # all ballots of the strata with sampled ballots are counted
+    assert np.allclose(tallies[0].sum(axis=1), 1000)
+    assert np.allclose(tallies[1].sum(axis=1), 600)
+    assert (tallies[0] >= [31, 22]).all()
+
+
+def two_collection_election():
+    # close plurality contest in a CVR collection P1 and a noCVR collection P2
+    e = OpenAuditTool.Election()
+    e.ctx.seed(1)
+    e.stage_time = "0001-01-01-00-00-01"
+    e.mids = ["M1"]
+    e.cid_m = {"M1": "C1"}
+    e.contest_type_c = {"C1": "plurality"}
+    alice, bob, nocvr = ("Alice",), ("Bob",), ("-noCVR",)
+    e.votes_c = {"C1": {alice: True, bob: True, nocvr: True}}
+    e.ro_c = {"C1": alice}
+    e.possible_pbcid_c = {"C1": {"P1": "True", "P2": "True"}}
+    e.rn_cpr = {"C1": {"P1": {alice: 520, bob: 480}, "P2": {nocvr: 1000}}}
+    e.sn_tcpra[e.stage_time] = \
+        {"C1": {"P1": {alice: {alice: 18, bob: 2}, bob: {bob: 19, alice: 1}},
+                "P2": {nocvr: {alice: 21, bob: 19}}}}
+    e.risk_tm[e.stage_time] = {}
+    return e
+
+
+def scalar_risk(e, mid, trials):
+    # compute_risk one trial at a time, with draw_nonsample_tally
+    cid = e.cid_m[mid]
+    vs = e.votes_c[cid]
+    pbcids = sorted(e.possible_pbcid_c[cid])
+    wrong_outcome_count = 0
+    for trial in range(trials):
+        if trial % rng.TRIAL_BLOCK_SIZE == 0:
+            streams = {pbcid: risk_bayes.risk_streams(e, cid, pbcid,
+                                                      trial // rng.TRIAL_BLOCK_SIZE)
+                       for pbcid in pbcids}
+        test_tally = {vote: 0 for vote in vs}
+        for pbcid in pbcids:
+            for rv in sorted(e.sn_tcpra[e.stage_time][cid][pbcid]):
+                sample_tally = e.sn_tcpra[e.stage_time][cid][pbcid][rv]
+                nonsample_size = e.rn_cpr[cid][pbcid][rv] - sum(sample_tally.values())
+                prior = risk_bayes.compute_prior_pseudocounts(vs, rv, e.pseudocount_base,
+                                                              e.pseudocount_match)
+                risk_bayes.add_dicts(test_tally, sample_tally)
+                risk_bayes.add_dicts(test_tally,
+                                     risk_bayes.draw_nonsample_tally(sample_tally, prior,
+                                                                     nonsample_size,
+                                                                     *streams[pbcid]))
+        wrong_outcome_count += outcomes.compute_outcome(e, cid, test_tally) != e.ro_c[cid]
+    return wrong_outcome_count / trials
+
+
+def test_compute_risk_matches_scalar_draws():
+    e = two_collection_election()
+    trials = rng.TRIAL_BLOCK_SIZE + 200
+    risk = risk_bayes.compute_risk(e, "M1", e.sn_tcpra, trials)
+    assert 0 < risk < 1
+    assert risk == scalar_risk(e, "M1", trials)
+
+
+def test_risk_draw_cache():
+    e = two_collection_election()
+    risk_bayes.compute_risk(e, "M1", e.sn_tcpra, 300)
+    assert len(e.risk_draw_cache) == 2
+    draws = list(e.risk_draw_cache.values())
+
+    # next stage: more ballots sampled from P2 only
+    alice, bob, nocvr = ("Alice",), ("Bob",), ("-noCVR",)
+    old_stage_time = e.stage_time
+    e.stage_time = "0001-01-01-00-00-02"
+    e.sn_tcpra[e.stage_time] = {"C1": dict(e.sn_tcpra[old_stage_time]["C1"])}
+    e.sn_tcpra[e.stage_time]["C1"]["P2"] = {nocvr: {alice: 40, bob: 30}}
+    e.risk_tm[e.stage_time] = {}
+    risk = risk_bayes.compute_risk(e, "M1", e.sn_tcpra, 300)
+    # P1's draws are reused, P2's are drawn again
+    assert len(e.risk_draw_cache) == 3
+    assert not np.array_equal(e.risk_draw_cache[next(reversed(e.risk_draw_cache))], draws[1])
+    assert any(d is draws[0] for d in e.risk_draw_cache.values())
+
+    # same risk as with nothing cached, or when computed in a worker
+    # process (whose cached draws are passed back)
+    e2 = two_collection_election()
+    e2.stage_time = e.stage_time
+    e2.sn_tcpra = {e.stage_time: e.sn_tcpra[e.stage_time]}
+    e2.risk_tm[e2.stage_time] = {}
+    e2.mids = ["M1", "M2"]
+    e2.cid_m["M2"] = "C1"
+    e2.num_workers = 2
+    risk_bayes.compute_risks(e2, e2.sn_tcpra, 300)
+    assert e2.risk_tm[e2.stage_time] == {"M1": risk, "M2": risk}
+    assert len(e2.risk_draw_cache) == 2
@@ -0,0 +1,40 @@
+"""
+Tests for rng.py
+"""
+
+import numpy as np
+
+import rng
+
+
+def test_streams_depend_only_on_seed_and_names():
+    r1 = rng.RNG("12345678901234567890")
+    r2 = rng.RNG(12345678901234567890)
+    a = r1.stream("risk", "t", "C1", "P1", 0).random(5)
+    # other streams drawn from first make no difference
+    r2.stream("risk", "t", "C1", "P2", 0).random(100)
+    b = r2.stream("risk", "t", "C1", "P1", 0).random(5)
+    assert np.array_equal(a, b)
+
+
+def test_streams_are_distinct():
+    r = rng.RNG(1)
+    draws = [tuple(r.stream(*names).random(3))
+             for names in [("a",), ("b",), ("a", 0), ("a", 1), ("a", "0"), ("a", "0", "x")]]
+    assert len(set(draws)) == len(draws)
+    assert not np.array_equal(rng.RNG(2).stream("a").random(3),
+                              rng.RNG(1).stream("a").random(3))
+
+
+def test_unseeded_rng_is_reproducible_from_entropy():
+    r1 = rng.RNG()
+    r2 = rng.RNG(r1.entropy)
+    assert np.array_equal(r1.stream("x").random(3), r2.stream("x").random(3))
+
+
+def test_array_draws_match_scalar_draws():
+    r = rng.RNG(7)
+    shapes = [0.5, 2.0, 0.0, 3.5]
+    g = r.stream("gamma")
+    scalar = [g.gamma(k) for k in shapes]
+    assert np.array_equal(r.stream("gamma").gamma(shapes), scalar)
@@ -0,0 +1,59 @@
+"""
+Tests for scheduler.py
+"""
+
+import OpenAuditTool
+import risk_bayes
+import scheduler
+
+
+def small_election():
+    # a yes/no measure and an IRV contest, in one collection
+    e = OpenAuditTool.Election()
+    e.ctx.seed(1)
+    e.stage_time = "0001-01-01-00-00-01"
+    e.n_trials = 200
+    e.pbcids = ["P1"]
+    e.mids = ["M1", "M2"]
+    e.cid_m = {"M1": "Measure", "M2": "Mayor"}
+    e.contest_type_c = {"Measure": "plurality", "Mayor": "irv"}
+    e.possible_pbcid_c = {"Measure": {"P1": "True"}, "Mayor": {"P1": "True"}}
+    yes, no = ("Yes",), ("No",)
+    ranked = [("1-Alice", "2-Bob", "3-Carol"), ("1-Bob", "2-Alice", "3-Carol"),
+              ("1-Carol", "2-Bob", "3-Alice")]
+    e.votes_c = {"Measure": {yes: True, no: True},
+                 "Mayor": {vote: True for vote in ranked}}
+    e.ro_c = {"Measure": yes, "Mayor": ("Bob",)}
+    e.rn_cpr = {"Measure": {"P1": {yes: 600, no: 400}},
+                "Mayor": {"P1": {ranked[0]: 450, ranked[1]: 350, ranked[2]: 200}}}
+    e.sn_tcpra[e.stage_time] = \
+        {"Measure": {"P1": {yes: {yes: 30}, no: {no: 20}}},
+         "Mayor": {"P1": {ranked[0]: {ranked[0]: 22}, ranked[1]: {ranked[1]: 18},
+                          ranked[2]: {ranked[2]: 10}}}}
+    e.risk_tm[e.stage_time] = {}
+    return e
+
+
+def test_contest_cost():
+    e = small_election()
+    measure = scheduler.contest_cost(e, "Measure", e.sn_tcpra, 100)
+    mayor = scheduler.contest_cost(e, "Mayor", e.sn_tcpra, 100)
+    assert measure < mayor
+    assert scheduler.contest_cost(e, "Measure", e.sn_tcpra, 200) == 2 * measure
+
+
+def test_compute_risks_jobs():
+    e = small_election()
+    risk_bayes.compute_risks(e, e.sn_tcpra)
+    risk_m = dict(e.risk_tm[e.stage_time])
+    times = e.job_times_k["risk"]
+    # most costly job first
+    assert [t["job"] for t in times] == ["M2", "M1"]
+    assert all(t["seconds"] >= 0 for t in times)
+
+    # same risks when computed by worker processes
+    e2 = small_election()
+    e2.num_workers = 2
+    risk_bayes.compute_risks(e2, e2.sn_tcpra)
+    assert e2.risk_tm[e2.stage_time] == risk_m
+    assert [t["job"] for t in e2.job_times_k["risk"]] == ["M2", "M1"]
@@ -0,0 +1,70 @@
+"""
+Tests for utils.py
+"""
+
+import os
+import tempfile
+import time
+
+import pytest
+
+import audit_context
+import utils
+
+
+def touch(dirpath, filename):
+
+    with open(os.path.join(dirpath, filename), "w") as file:
+        file.write("")
+
+
+def test_greatest_name():
+
+    with tempfile.TemporaryDirectory() as dirpath:
+        for filename in ["foo-11-13.csv", "foo-11-08.csv", "foo-11-07.csv",
+                         "foo-11-09.txt", "zeb-12-12.csv"]:
+            touch(dirpath, filename)
+        os.mkdir(os.path.join(dirpath, "foo-11-20.csv"))
+        assert utils.greatest_name(dirpath, "foo", ".csv") == "foo-11-13.csv"
+        assert utils.greatest_name(dirpath, "foo", ".csv", max_label="-11-10") \
+            == "foo-11-08.csv"
+        assert utils.greatest_name(dirpath, "foo", ".csv", dir_wanted=True) \
+            == "foo-11-20.csv"
+        assert utils.greatest_name(dirpath, "foo", ".txt") == "foo-11-09.txt"
+        with pytest.raises(FileNotFoundError):
+            utils.greatest_name(dirpath, "bar", ".csv")
+
+
+def test_greatest_name_dir_index():
+
+    ctx = audit_context.AuditContext()
+    with tempfile.TemporaryDirectory() as dirpath:
+        touch(dirpath, "foo-1.csv")
+        # a directory changed just now is not indexed yet
+        assert utils.greatest_name(dirpath, "foo", ".csv", ctx=ctx) == "foo-1.csv"
+        assert ctx.dir_index == {}
+        past = time.time() - 60
+        os.utime(dirpath, (past, past))
+        assert utils.greatest_name(dirpath, "foo", ".csv", ctx=ctx) == "foo-1.csv"
+        assert list(ctx.dir_index) == [os.path.abspath(dirpath)]
+
+        # a file added (e.g. by another process) changes the directory's
+        # mtime, so the directory is read again
+        touch(dirpath, "foo-2.csv")
+        assert utils.greatest_name(dirpath, "foo", ".csv", ctx=ctx) == "foo-2.csv"
+
+        # the index is used only while the mtime is unchanged
+        os.utime(dirpath, (past, past))
+        utils.greatest_name(dirpath, "foo", ".csv", ctx=ctx)
+        ctx.dir_index[os.path.abspath(dirpath)][2]["foo-2.csv"] = False
+        assert utils.greatest_name(dirpath, "foo", ".csv", ctx=ctx) == "foo-1.csv"
+        utils.invalidate_dir_index(ctx, dirpath)
+        assert utils.greatest_name(dirpath, "foo", ".csv", ctx=ctx) == "foo-2.csv"
+
+
+def test_logical_stage_time():
+    assert utils.logical_stage_time(1) == "0001-01-01-00-00-01"
+    assert utils.logical_stage_time(3661) == "0001-01-01-01-01-01"
+    times = [utils.logical_stage_time(n) for n in range(1, 200)]
+    assert times == sorted(times)
+    assert "0000-00-00-00-00-00" < times[0] < "9999-12-31-23-59-59"
@@ -8,11 +8,13 @@ Code to work with OpenAuditTool.py on post-election audits.
 Various utilities.
 """
 
+import bisect
 import datetime
 import logging
 import numpy as np
 import os
 import sys
+import time
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -31,6 +33,18 @@ def datetime_string():
     t = datetime.datetime.now()
     return t.strftime("%Y-%m-%d-%H-%M-%S")
 
+def logical_stage_time(stage_number):
+    """ Return stage time string for stage stage_number of a simulated audit.
+        Stage n is n seconds after 0001-01-01-00-00-00, e.g. stage 1 is
+        '0001-01-01-00-00-01', so stage times sort in stage order, after
+        the initial stage time '0000-00-00-00-00-00'.
+    """
+
+    t = datetime.datetime(1, 1, 1) + datetime.timedelta(seconds=stage_number)
+    # (strftime does not zero-pad years before 1000 on all platforms)
+    return "{:04d}-{:02d}-{:02d}-{:02d}-{:02d}-{:02d}" \
+        .format(t.year, t.month, t.day, t.hour, t.minute, t.second)
+
 def date_string():
     """ Return current date as string e.g. '2017-06-26' 
         Year-Month-Day
@@ -49,11 +63,67 @@ start_datetime_string = datetime_string()
 # Input/output at the file-handling level
 ##############################################################################
 
+# Directory index: a cache of directory listings, so that repeated
+# greatest_name lookups in the same directory (one per collection for
+# manifests, CVRs and audited votes, plus spec files and saved state)
+# cost one os.stat per lookup and one os.scandir per directory change,
+# rather than an os.listdir plus one stat per entry per lookup.
+# The index is kept in the audit context, as ctx.dir_index, mapping
+# absolute dirpath -> (directory mtime_ns, sorted list of names, dict
+# name->is_file).  An entry is used only while the directory's mtime
+# is unchanged, so files added (or removed) by other processes, e.g.
+# while serving or watching, are seen.  Code that writes files into a
+# directory may also call invalidate_dir_index afterwards.
+
+DIR_INDEX_RACY_NS = 2 * 10**9
+# A listing taken less than this long after the directory's last
+# change is not kept, since a further change within the same mtime
+# tick (on file systems with coarse timestamps) would go unnoticed.
+
+
+def dir_index(dirpath, ctx=None):
+    """ 
+    Return (names, is_file) for directory dirpath, from the directory
+    index ctx.dir_index of audit context ctx (or read afresh, if ctx is None).
+
+    Here names is the sorted list of names of entries in dirpath, and is_file
+    is a dict mapping each name to True iff it is a file (as os.path.isfile).
+    """
+
+    key = os.path.abspath(dirpath)
+    mtime_ns = os.stat(dirpath).st_mtime_ns
+    if ctx is not None and key in ctx.dir_index \
+       and ctx.dir_index[key][0] == mtime_ns:
+        return ctx.dir_index[key][1:]
+    is_file = {}
+    with os.scandir(dirpath) as entries:
+        for entry in entries:
+            is_file[entry.name] = entry.is_file()
+    names = sorted(is_file)
+    if ctx is not None and int(time.time() * 1e9) - mtime_ns > DIR_INDEX_RACY_NS:
+        ctx.dir_index[key] = (mtime_ns, names, is_file)
+    return names, is_file
+
+
+def invalidate_dir_index(ctx, dirpath=None):
+    """ 
+    Drop directory dirpath from the directory index of audit context ctx
+    (all directories, if dirpath is None), so its next lookup re-reads
+    the directory.
+    """
+
+    if dirpath is None:
+        ctx.dir_index.clear()
+    else:
+        ctx.dir_index.pop(os.path.abspath(dirpath), None)
+
+
 def greatest_name(dirpath,
                   startswith,
                   endswith,
                   max_label=None,
-                  dir_wanted=False):
+                  dir_wanted=False,
+                  ctx=None):
     """ 
     Return greatest filename (or dirname) meeting given specs.
 
@@ -78,21 +148,27 @@ def greatest_name(dirpath,
         "foo-11-07.csv" , and
         "zeb-12-12.csv" .
 
+    Directory contents are taken from the directory index of audit
+    context ctx, if given (see dir_index).
     """
     if max_label is None:
         max_filename = None
     else:
-        max_filename = os.path.join(dirpath, startswith, max_label, endswith)
+        max_filename = startswith + max_label + endswith
+    names, is_file = dir_index(dirpath, ctx)
+    # names having prefix startswith are contiguous in sorted order;
+    # scan them from the greatest down.
+    lo = bisect.bisect_left(names, startswith)
+    hi = lo
+    while hi < len(names) and names[hi].startswith(startswith):
+        hi += 1
+    if max_filename is not None:
+        hi = min(hi, bisect.bisect_right(names, max_filename, lo, hi))
     selected_filename = ""
-    for filename in os.listdir(dirpath):
-        full_filename = os.path.join(dirpath,filename)
-        if (dir_wanted == False and os.path.isfile(full_filename) or \
-            dir_wanted == True and not os.path.isfile(full_filename)) and \
-           filename.startswith(startswith) and \
-           filename.endswith(endswith) and \
-           filename > selected_filename and \
-           (max_filename == None or filename <= max_filename):
+    for filename in reversed(names[lo:hi]):
+        if is_file[filename] != dir_wanted and filename.endswith(endswith):
             selected_filename = filename
+            break
     if selected_filename == "":
         if dir_wanted == False:
             raise FileNotFoundError(("No files in `{}` have a name starting with `{}`"
@@ -214,6 +290,9 @@ def RandomState(seed):
 
     if seed != None:
         seed_as_array = convert_int_to_32_bit_numpy_array(seed)
+        if len(seed_as_array) == 0:
+            # seed 0 (RandomState won't take an empty array)
+            seed_as_array = np.array([0], dtype=int)
         return np.random.RandomState(seed_as_array)
     else:
         logger.info("utils.RandomState: seed is None!")
@@ -0,0 +1,87 @@
+# bench_clean_id.py
+# python3
+
+"""
+Microbenchmark for ids.clean_id, on a realistic distribution of CVR cells.
+
+Builds the cells of a synthetic reported-CVR file (one row per ballot and
+contest: Collection, Scanner, Ballot id, Contest, Selections), then times
+cleaning every cell with
+    -- the original per-character clean_id (copied below), and
+    -- the current ids.clean_id (fast path plus bounded memo cache).
+Collection, scanner, contest and selection cells repeat many times;
+ballot id cells are all distinct (so they always miss the memo cache).
+
+Run from this directory:
+    python3 bench_clean_id.py
+"""
+
+import random
+import sys
+import time
+
+sys.path.append("../../code")
+
+import ids
+
+
+def clean_id_original(id):
+    """ ids.clean_id before the fast path and memo cache were added. """
+
+    id = id.strip()
+    new_id = ""
+    for c in id:
+        if c.isspace():
+            c = " "
+        if (c != " " or (len(new_id)>0 and new_id[-1] != " ")) \
+           and c.isprintable():
+            new_id += c
+    return new_id
+
+
+def make_cells(n_ballots, seed=1):
+    """ Return list of CVR cells for n_ballots ballots. """
+
+    rs = random.Random(seed)
+    pbcids = ["DEN-A{:02d}".format(i) for i in range(20)]
+    cids = ["U.S. President", "U.S. Senate 1", "CO Prop A", "Denver Mayor",
+            "Denver Clerk", "Denver Prop 1", "Denver Prop 2"]
+    selids = ["Don Brown", "Larry Pew", "Deb O'Crat", "Rhee Pub", "Yes", "No",
+              "John Smith", "Bob Cat", "Mary Mee", "+Jack Frost", "-Invalid"]
+    cells = []
+    for b in range(n_ballots):
+        pbcid = rs.choice(pbcids)
+        bid = "{}-{:07d}".format(pbcid, b)
+        for cid in cids:
+            cells.extend([pbcid, "scanner-3", bid, cid, rs.choice(selids)])
+            if rs.random() < 0.01:
+                # the occasional dirty cell
+                cells.append("  " + rs.choice(selids) + "\t")
+    return cells
+
+
+def time_it(f, cells):
+
+    start = time.perf_counter()
+    for cell in cells:
+        f(cell)
+    return time.perf_counter() - start
+
+
+def main(n_ballots=200000):
+
+    cells = make_cells(n_ballots)
+    assert all(ids.clean_id(cell) == clean_id_original(cell) for cell in cells)
+    ids.clean_id.cache_clear()
+
+    t_original = time_it(clean_id_original, cells)
+    t_new = time_it(ids.clean_id, cells)
+    print("{} cells ({} ballots)".format(len(cells), n_ballots))
+    print("  original clean_id: {:.3f} s".format(t_original))
+    print("  current clean_id:  {:.3f} s  ({:.1f}x faster)"
+          .format(t_new, t_original / t_new))
+    print("  memo cache: {}".format(ids.clean_id.cache_info()))
+
+
+if __name__ == "__main__":
+    main()
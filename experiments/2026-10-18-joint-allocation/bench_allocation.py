@@ -0,0 +1,100 @@
+# bench_allocation.py
+# python3
+
+"""
+Timing of the joint sample allocation (allocation.joint_allocation)
+for a synthetic election with many contests sharing collections.
+
+Builds an Election (in memory) with NUM_CONTESTS plurality contests
+over NUM_COLLECTIONS CVR collections of 10000 ballots each, each
+contest appearing in 1 to 4 collections, with a sample of 200 ballots
+from each collection already audited (with a few discrepancies).
+Margins vary, so some contests are nearly done and others are not.
+
+Then times planning one stage with --joint_allocation, first with an
+empty response-curve cache and then again (all curves cached), and
+prints the increments chosen, against the plain plan of
+e.max_audit_rate_p[pbcid] for every collection.
+
+Run from this directory:
+    python3 bench_allocation.py [NUM_CONTESTS]
+"""
+
+import random
+import sys
+import time
+
+sys.path.append("../../code")
+
+import OpenAuditTool
+import allocation
+
+
+NUM_CONTESTS = 300
+NUM_COLLECTIONS = 8
+COLLECTION_SIZE = 10000
+SAMPLE_SIZE = 200
+MAX_AUDIT_RATE = 400
+
+
+def synthetic_election(num_contests, seed=1):
+    rand = random.Random(seed)
+    e = OpenAuditTool.Election()
+    e.ctx.seed(seed)
+    e.stage_time = "0001-01-01-00-00-01"
+    e.pbcids = ["PBC{}".format(i) for i in range(NUM_COLLECTIONS)]
+    e.rn_p = {pbcid: COLLECTION_SIZE for pbcid in e.pbcids}
+    e.max_audit_rate_p = {pbcid: MAX_AUDIT_RATE for pbcid in e.pbcids}
+    e.sn_tp[e.stage_time] = {pbcid: SAMPLE_SIZE for pbcid in e.pbcids}
+    e.status_tm[e.stage_time] = {}
+    e.sn_tcpra[e.stage_time] = {}
+    votes = [("Alice",), ("Bob",), ("Carol",)]
+    for i in range(num_contests):
+        cid = "C{}".format(i)
+        mid = "M{}".format(i)
+        e.cids.append(cid)
+        e.mids.append(mid)
+        e.cid_m[mid] = cid
+        e.risk_limit_m[mid] = 0.05
+        e.status_tm[e.stage_time][mid] = "Open"
+        e.contest_type_c[cid] = "plurality"
+        e.ro_c[cid] = ("Alice",)
+        e.votes_c[cid] = {vote: True for vote in votes}
+        share = 0.4 + 0.2 * rand.random()
+        pbcids = rand.sample(e.pbcids, rand.randint(1, 4))
+        e.possible_pbcid_c[cid] = {pbcid: "True" for pbcid in pbcids}
+        e.rn_cpr[cid] = {}
+        e.sn_tcpra[e.stage_time][cid] = {}
+        for pbcid in pbcids:
+            ps = [share, (1-share) * 0.8, (1-share) * 0.2]
+            e.rn_cpr[cid][pbcid] = {vote: round(COLLECTION_SIZE * p)
+                                    for vote, p in zip(votes, ps)}
+            tally2 = {}
+            for _ in range(SAMPLE_SIZE):
+                rv = rand.choices(votes, ps)[0]
+                av = rv if rand.random() < 0.99 else rand.choice(votes)
+                tally2.setdefault(rv, {}).setdefault(av, 0)
+                tally2[rv][av] += 1
+            e.sn_tcpra[e.stage_time][cid][pbcid] = tally2
+    return e
+
+
+def main():
+    num_contests = int(sys.argv[1]) if len(sys.argv) > 1 else NUM_CONTESTS
+    e = synthetic_election(num_contests)
+    print("{} contests, {} collections".format(num_contests, NUM_COLLECTIONS))
+
+    t0 = time.time()
+    sample_size = allocation.joint_allocation(e, e.pbcids)
+    t1 = time.time()
+    assert allocation.joint_allocation(e, e.pbcids) == sample_size
+    t2 = time.time()
+    print("  joint allocation, curves computed: {:.2f} s".format(t1 - t0))
+    print("  joint allocation, curves cached:   {:.2f} s".format(t2 - t1))
+    print("  increments: {} ({} ballots)".format(sample_size, sum(sample_size.values())))
+    print("  max audit rate everywhere: {} ballots".format(
+        sum(e.max_audit_rate_p.values())))
+
+
+if __name__ == "__main__":
+    main()
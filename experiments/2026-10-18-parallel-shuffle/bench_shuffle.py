@@ -0,0 +1,51 @@
+# bench_shuffle.py
+# python3
+
+"""
+Benchmark for audit_orders.shuffle_parallel against audit_orders.shuffle,
+on a synthetic collection of (position, ballot id) pairs, as shuffled by
+audit_orders.compute_audit_order.
+
+For each number of workers, times the full shuffle and checks that the
+result is identical to that of the sequential shuffle.
+
+Run from this directory:
+    python3 bench_shuffle.py [number of ballots [max workers]]
+(default 10,000,000 ballots, and up to os.cpu_count() workers).
+"""
+
+import os
+import sys
+import time
+
+sys.path.append("../../code")
+
+import audit_orders
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10**7
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+    seed = "12345678901234567890,DEN-A01"
+    pairs = [(i+1, "bid{}".format(i)) for i in range(n)]
+    print("ballots: {:,}   cpus: {}".format(n, os.cpu_count()))
+
+    t0 = time.perf_counter()
+    expected = audit_orders.shuffle(pairs, seed)
+    t_seq = time.perf_counter() - t0
+    print("shuffle (sequential):        {:8.2f} s".format(t_seq))
+
+    workers = 1
+    while True:
+        t0 = time.perf_counter()
+        result = audit_orders.shuffle_parallel(pairs, seed, workers)
+        t = time.perf_counter() - t0
+        print("shuffle_parallel {:2d} workers: {:8.2f} s  ({:.2f}x)  identical: {}"
+              .format(workers, t, t_seq / t, result == expected))
+        if workers >= max_workers:
+            break
+        workers = min(2 * workers, max_workers)
+
+
+if __name__ == "__main__":
+    main()